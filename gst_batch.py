@@ -0,0 +1,193 @@
+"""
+Batch mode for the GSTR-1 report generator.
+
+Runs every seller ZIP in a directory (or an explicit list) through the same
+pipeline as the Streamlit app, spread across a process pool, and writes the four
+reports per GSTIN / period plus a manifest with per-file timings and failures:
+
+    python gst_batch.py exports/ -o reports/ -j 8
+
+    reports/
+        manifest.json
+        <GSTIN>/<MMYYYY>/<GSTIN>_<MM>_<YYYY>_GSTR1.xlsx
+                         B2CS_Summary_Report.csv
+                         HSN_Summary_Report.csv
+                         <GSTIN>_<MM>_<YYYY>_GSTR1_GSTR1.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import gst_core as gst
+
+MANIFEST_NAME = "manifest.json"
+STAGING_PREFIX = ".staging-"
+
+
+# ============================================================
+#  INPUT DISCOVERY
+# ============================================================
+def discover_zips(paths):
+    """Expands directories to the .zip files directly inside them (sorted); files are kept as given."""
+    zips = []
+    for path in paths:
+        if os.path.isdir(path):
+            zips.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.lower().endswith(".zip") and os.path.isfile(os.path.join(path, name))
+            )
+        else:
+            zips.append(path)
+    return zips
+
+
+# ============================================================
+#  WORKER
+# ============================================================
+def process_zip_path(zip_path, output_dir, streaming=False, formula_mode=gst.DEFAULT_COMBO_FORMULA_MODE,
+                     json_style=gst.DEFAULT_GSTR1_JSON_STYLE):
+    """
+    Processes one ZIP in the current process and writes its reports to a staging
+    directory under output_dir. Returns the manifest entry; never raises.
+    """
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    entry = {"zip": os.path.abspath(zip_path), "status": "failed", "pid": os.getpid()}
+
+    try:
+        with open(zip_path, "rb") as zip_file:
+            # One process per ZIP already keeps the cores busy; no nested parse pool
+            results = gst.generate_reports(
+                zip_file, streaming=streaming, formula_mode=formula_mode, parse_workers=1, json_style=json_style
+            )
+
+        staging_dir = tempfile.mkdtemp(prefix=STAGING_PREFIX, dir=output_dir)
+        written = gst.write_reports(results, staging_dir)
+
+        entry.update(
+            status="ok",
+            gstin=results["dynamic_gstin"],
+            fp=results["dynamic_fp"],
+            staging_dir=staging_dir,
+            files=sorted(os.path.basename(path) for path in written),
+            warnings=results["warnings"],
+        )
+    except gst.ReportError as e:
+        entry["error"] = str(e)
+    except Exception as e:
+        entry["error"] = f"{type(e).__name__}: {e}"
+
+    entry["seconds"] = round(time.perf_counter() - started, 3)
+    entry["cpu_seconds"] = round(time.process_time() - cpu_started, 3)
+    return entry
+
+
+# ============================================================
+#  BATCH RUNNER
+# ============================================================
+def _publish(entry, output_dir, claimed):
+    """Moves a finished entry's staging directory to <GSTIN>/<fp>/ (first ZIP per period wins)."""
+    staging_dir = entry.pop("staging_dir")
+    target = os.path.join(output_dir, entry["gstin"], entry["fp"])
+    if target in claimed:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        entry["status"] = "failed"
+        entry["error"] = f"Duplicate GSTIN/period {entry['gstin']} {entry['fp']}: already produced by {claimed[target]}"
+        return
+
+    claimed[target] = entry["zip"]
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if os.path.isdir(target):
+        shutil.rmtree(target) # left over from an earlier batch run
+    os.replace(staging_dir, target)
+    entry["output_dir"] = target
+
+def run_batch(paths, output_dir, workers=None, streaming=False, formula_mode=gst.DEFAULT_COMBO_FORMULA_MODE,
+              json_style=gst.DEFAULT_GSTR1_JSON_STYLE):
+    """
+    Processes every ZIP in `paths` across `workers` processes (default: all cores),
+    writes the reports into output_dir and returns the manifest (also saved as manifest.json).
+    """
+    zips = discover_zips(paths)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(zips) or 1))
+    os.makedirs(output_dir, exist_ok=True)
+
+    started = time.perf_counter()
+    entries = [None] * len(zips)
+    claimed = {}  # final output directory -> ZIP that produced it
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(process_zip_path, zip_path, output_dir, streaming, formula_mode, json_style): index
+            for index, zip_path in enumerate(zips)
+        }
+        # Publish in input order, so the winner of a duplicate GSTIN/period is deterministic
+        done = {}
+        next_index = 0
+        for future in as_completed(futures):
+            done[futures[future]] = future.result()
+            while next_index in done:
+                entry = done.pop(next_index)
+                if entry["status"] == "ok":
+                    _publish(entry, output_dir, claimed)
+                entries[next_index] = entry
+                next_index += 1
+
+    manifest = {
+        "output_dir": os.path.abspath(output_dir),
+        "workers": workers,
+        "streaming": streaming,
+        "formula_mode": formula_mode,
+        "json_style": json_style,
+        "files": len(entries),
+        "succeeded": sum(entry["status"] == "ok" for entry in entries),
+        "failed": sum(entry["status"] != "ok" for entry in entries),
+        "seconds": round(time.perf_counter() - started, 3),
+        "results": entries,
+    }
+    with open(os.path.join(output_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+# ============================================================
+#  COMMAND LINE
+# ============================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate GSTR-1 reports for a batch of seller ZIPs.")
+    parser.add_argument("paths", nargs="+", help="ZIP files and/or directories containing ZIP files")
+    parser.add_argument("-o", "--output", default="gstr1_reports", help="output directory (default: %(default)s)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--low-memory", action="store_true", help="read the sheets in chunks (streaming mode)")
+    parser.add_argument(
+        "--formula-mode", choices=gst.COMBO_FORMULA_MODES, default=gst.DEFAULT_COMBO_FORMULA_MODE,
+        help="how combo columns K–O are written (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--json-style", choices=gst.GSTR1_JSON_STYLES, default=gst.DEFAULT_GSTR1_JSON_STYLE,
+        help="GSTR-1 JSON layout: indented or compact for upload (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+
+    manifest = run_batch(
+        args.paths, args.output, workers=args.workers, streaming=args.low_memory, formula_mode=args.formula_mode,
+        json_style=args.json_style,
+    )
+    for entry in manifest["results"]:
+        label = f"{entry.get('gstin', '-')} {entry.get('fp', '-')}"
+        detail = entry.get("output_dir") or entry.get("error")
+        print(f"[{entry['status']:>6}] {entry['seconds']:8.2f}s  {os.path.basename(entry['zip'])}  {label}  {detail}")
+    print(
+        f"{manifest['succeeded']}/{manifest['files']} succeeded in {manifest['seconds']:.2f}s "
+        f"with {manifest['workers']} workers; manifest: {os.path.join(args.output, MANIFEST_NAME)}"
+    )
+    return 0 if manifest["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
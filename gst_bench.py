@@ -0,0 +1,542 @@
+"""
+Benchmarks for the GSTR-1 report generator, with a synthetic Meesho export generator.
+
+    python gst_bench.py generate --rows 100k --format xlsx -o sample.zip
+    python gst_bench.py run --sizes 10k,100k,1m --formats xlsx,csv --repeat 3
+    python gst_bench.py run --sizes 100k --compare 1a2b3c4   # flag regressions vs a stored run
+
+Each (size, format) case runs in a fresh process and times every pipeline stage
+separately (ZIP extraction, process_file, state mapping, tax split, aggregation,
+each summary, combo workbook, JSON) with the peak RSS reached during the stage.
+Results are stored per commit under BENCH_DIR/results, so runs can be compared
+across commits; generated exports are kept under BENCH_DIR/data and reused.
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+
+import gst_core as gst
+
+BENCH_DIR = os.environ.get("MESSO_GST_BENCH_DIR", os.path.join(os.path.expanduser("~"), ".cache", "messo_gst", "bench"))
+DEFAULT_SIZES = "10k,100k"
+DEFAULT_FORMATS = "xlsx,csv"
+REGRESSION_THRESHOLD = 0.20    # relative slowdown / memory growth that counts as a regression...
+REGRESSION_MIN_SECONDS = 0.05  # ...when the stage also got at least this much slower
+REGRESSION_MIN_MIB = 20        # ...or its peak grew by at least this much
+
+
+# ============================================================
+#  SYNTHETIC EXPORT GENERATOR
+# ============================================================
+EXPORT_COLUMNS = [
+    "identifier", "sup_name", "gstin", "sub_order_num", "order_date", "hsn_code", "quantity", "gst_rate",
+    "total_taxable_sale_value", "tax_amount", "total_invoice_value", "taxable_shipping",
+    "end_customer_state_new", "enrollment_no", "financial_year", "month_number", "supplier_id",
+]  # C = gstin, O = financial_year, P = month_number (HEADER_CELLS)
+XLSX_MAX_ROWS = 1_000_000  # per sheet (Excel's limit is 1,048,576 rows including the header)
+GENERATE_CHUNK_ROWS = 200_000
+
+# Customer states by share of orders (long tail), as they appear in exports
+STATE_WEIGHTS = [
+    ("Uttar Pradesh", 14), ("Maharashtra", 11), ("Bihar", 8), ("West Bengal", 8), ("Karnataka", 7),
+    ("Tamil Nadu", 6), ("Rajasthan", 6), ("Gujarat", 5), ("Madhya Pradesh", 5), ("Delhi", 4),
+    ("Telangana", 4), ("Andhra Pradesh", 4), ("Odisha", 3), ("Assam", 3), ("Jharkhand", 3),
+    ("Haryana", 3), ("Kerala", 2), ("Punjab", 2), ("Chhattisgarh", 2), ("Uttarakhand", 1),
+    ("Jammu & Kashmir", 1), ("Himachal Pradesh", 0.6), ("Goa", 0.4), ("Tripura", 0.3), ("Manipur", 0.2),
+    ("Meghalaya", 0.2), ("Puducherry", 0.15), ("Chandigarh", 0.15), ("Arunachal Pradesh", 0.1),
+    ("Nagaland", 0.1), ("Mizoram", 0.08), ("Sikkim", 0.08), ("Andaman & Nicobar Islands", 0.05),
+    ("Ladakh", 0.03), ("Dadra & Nagar Haveli & Daman & Diu", 0.03), ("Lakshadweep", 0.01),
+]
+STATE_VARIANT_SHARE = 0.05  # spelled differently (case, spacing, old names)
+STATE_ALIASES = {"Odisha": "Orissa", "Puducherry": "Pondicherry", "Andaman & Nicobar Islands": "Andaman & Nicobar"}
+UNMAPPED_STATE_SHARE = 0.002
+
+# (HSN, GST rate, share): apparel and home textiles dominate, then jewellery, cosmetics, gadgets
+HSN_RATE_WEIGHTS = [
+    (6204, 5, 18), (6206, 5, 12), (6211, 5, 8), (6109, 5, 7), (6104, 5, 6), (6302, 5, 5),
+    (6211, 12, 3), (6204, 12, 3), (7117, 3, 9), (3304, 18, 6), (3305, 18, 3), (9619, 12, 4),
+    (6403, 12, 3), (6404, 18, 2), (4202, 18, 3), (8518, 18, 2), (9503, 12, 2), (3926, 18, 2),
+    (8517, 18, 1), (6505, 5, 1),
+]
+
+
+def _weighted_choice(rng, weights, size):
+    p = np.asarray(weights, dtype=np.float64)
+    return rng.choice(len(p), size=size, p=p / p.sum())
+
+def _state_column(rng, size):
+    names = [name for name, _ in STATE_WEIGHTS]
+    states = np.array(names, dtype=object)[_weighted_choice(rng, [w for _, w in STATE_WEIGHTS], size)]
+    variant = rng.random(size) < STATE_VARIANT_SHARE
+    style = rng.integers(0, 4, size)
+    for i in np.flatnonzero(variant):
+        name = states[i]
+        states[i] = (
+            name.upper(), name.lower(), f"  {name} ", STATE_ALIASES.get(name, name.replace("&", "And"))
+        )[style[i]]
+    states[rng.random(size) < UNMAPPED_STATE_SHARE] = ""
+    return states
+
+def synthetic_rows(rng, rows, start_order, gstin, month, year):
+    """One block of realistic sales rows (a DataFrame with EXPORT_COLUMNS)."""
+    hsn_rate = np.array([(hsn, rate) for hsn, rate, _ in HSN_RATE_WEIGHTS])
+    picked = hsn_rate[_weighted_choice(rng, [w for _, _, w in HSN_RATE_WEIGHTS], rows)]
+    taxable = np.round(rng.lognormal(np.log(350), 0.7, rows), 2)
+    tax = np.round(taxable * picked[:, 1] / 100, 2)
+    days = (datetime.date(year + month // 12, month % 12 + 1, 1) - datetime.date(year, month, 1)).days
+    order_dates = pd.Timestamp(year, month, 1) + pd.to_timedelta(rng.integers(0, days, rows), unit="D")
+    order_ids = np.arange(start_order, start_order + rows)
+
+    return pd.DataFrame({
+        "identifier": "tcs",
+        "sup_name": "Synthetic Supplier",
+        "gstin": gstin,
+        "sub_order_num": [f"{order_id}_{order_id % 3 + 1}" for order_id in order_ids.tolist()],
+        "order_date": order_dates,
+        "hsn_code": picked[:, 0],
+        "quantity": rng.choice([1, 2, 3, 4], size=rows, p=[0.8, 0.13, 0.05, 0.02]),
+        "gst_rate": picked[:, 1],
+        "total_taxable_sale_value": taxable,
+        "tax_amount": tax,
+        "total_invoice_value": np.round(taxable + tax, 2),
+        "taxable_shipping": 0,
+        "end_customer_state_new": _state_column(rng, rows),
+        "enrollment_no": np.nan,
+        "financial_year": year,
+        "month_number": month,
+        "supplier_id": 4242,
+    }, columns=EXPORT_COLUMNS)
+
+def _return_rows(rng, sales, return_share):
+    """Returns for a random share of the sales rows (same order numbers, later dates)."""
+    returned = sales[rng.random(len(sales)) < return_share].copy()
+    returned["order_date"] = returned["order_date"] + pd.to_timedelta(rng.integers(0, 4, len(returned)), unit="D")
+    last_day = sales["order_date"].max()
+    returned["order_date"] = returned["order_date"].where(returned["order_date"] <= last_day, last_day)
+    return returned
+
+
+_XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+        '<Relationship Id="rId3" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" Target="sharedStrings.xml"/>'
+        '</Relationships>'
+    ),
+    "xl/styles.xml": (  # style 1 = date (numFmt 14), so order_date reads back as a datetime
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'
+    ),
+}
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<dimension ref="A1:{last_cell}"/><sheetData>'
+)
+_SHEET_TAIL = "</sheetData></worksheet>"
+_EXCEL_EPOCH = pd.Timestamp(1899, 12, 30)
+
+
+class _XlsxMemberWriter:
+    """
+    Streams one single-sheet .xlsx into a file the way Excel writes it: shared
+    strings, a <dimension>, order_date as date-styled serials. rows = data rows to come.
+    """
+
+    def __init__(self, f, rows):
+        self._zip = zipfile.ZipFile(f, "w", zipfile.ZIP_DEFLATED, compresslevel=1)
+        for name, content in _XLSX_PARTS.items():
+            self._zip.writestr(name, content)
+        self._letters = [gst.column_letter(i) for i in range(1, len(EXPORT_COLUMNS) + 1)]
+        self._strings = {}
+        self._sheet = self._zip.open("xl/worksheets/sheet1.xml", "w", force_zip64=True)
+        self._sheet.write(_SHEET_HEAD.format(last_cell=f"{self._letters[-1]}{rows + 1}").encode())
+        self._row = 1
+        self._write_rows([[self._text(col) for col in EXPORT_COLUMNS]])
+
+    def _text(self, value):
+        if not isinstance(value, str) or value == "":
+            return None  # blank cell
+        index = self._strings.setdefault(value, len(self._strings))
+        return f' t="s"><v>{index}</v></c>'
+
+    def _write_rows(self, rows):
+        parts = []
+        for cells in rows:
+            r = self._row
+            self._row += 1
+            parts.append(f'<row r="{r}">')
+            parts.extend(f'<c r="{letter}{r}"{body}' for letter, body in zip(self._letters, cells) if body is not None)
+            parts.append("</row>")
+        self._sheet.write("".join(parts).encode("utf-8"))
+
+    def append(self, df):
+        columns = []
+        for col in EXPORT_COLUMNS:
+            values = df[col]
+            if col == "order_date":
+                serials = ((values - _EXCEL_EPOCH) / pd.Timedelta(days=1)).tolist()
+                columns.append([f' s="1"><v>{serial:g}</v></c>' for serial in serials])
+            elif values.dtype.kind in "if":
+                columns.append([None if v != v else f"><v>{v!r}</v></c>" for v in values.tolist()])
+            else:
+                bodies = {value: self._text(value) for value in pd.unique(values)}
+                columns.append([bodies[value] for value in values.tolist()])
+        self._write_rows(zip(*columns))
+
+    def close(self):
+        self._sheet.write(_SHEET_TAIL.encode())
+        self._sheet.close()
+        with self._zip.open("xl/sharedStrings.xml", "w", force_zip64=True) as sst:
+            sst.write(
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                f'uniqueCount="{len(self._strings)}">'.encode()
+            )
+            sst.write("".join(f"<si><t>{escape(value)}</t></si>" for value in self._strings).encode("utf-8"))
+            sst.write(b"</sst>")
+        self._zip.close()
+
+class _CsvMemberWriter:
+    def __init__(self, f, rows):
+        self._f = io.TextIOWrapper(f, encoding="utf-8", newline="")
+        self._header = True
+
+    def append(self, df):
+        df.to_csv(self._f, index=False, header=self._header, date_format="%Y-%m-%d")
+        self._header = False
+
+    def close(self):
+        if self._header:
+            pd.DataFrame(columns=EXPORT_COLUMNS).to_csv(self._f, index=False)
+        self._f.flush()
+        self._f.detach()
+
+MEMBER_WRITERS = {"xlsx": _XlsxMemberWriter, "csv": _CsvMemberWriter}
+
+
+def generate_export(path, rows, fmt="xlsx", gstin="27ABCDE1234F1Z5", month=6, year=2025, return_share=0.08, seed=0):
+    """
+    Writes a synthetic seller ZIP with `rows` sales rows (plus ~return_share returns):
+    tcs_sales.xlsx / tcs_sales_return.xlsx, or .csv with fmt="csv". Sales above
+    XLSX_MAX_ROWS are split into tcs_sales_1.xlsx, tcs_sales_2.xlsx, ...
+    Same arguments, same bytes.
+    """
+    rng = np.random.default_rng(seed)
+    sales_parts = max(1, (rows + XLSX_MAX_ROWS - 1) // XLSX_MAX_ROWS) if fmt == "xlsx" else 1
+    returns = []
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as out:
+        written = 0
+        for part in range(sales_parts):
+            name = f"tcs_sales_{part + 1}.{fmt}" if sales_parts > 1 else f"tcs_sales.{fmt}"
+            part_rows = min(XLSX_MAX_ROWS, rows - written) if fmt == "xlsx" else rows
+            with out.open(name, "w", force_zip64=True) as member:
+                writer = MEMBER_WRITERS[fmt](member, part_rows)
+                for start in range(0, part_rows, GENERATE_CHUNK_ROWS):
+                    block = synthetic_rows(rng, min(GENERATE_CHUNK_ROWS, part_rows - start), written + start + 1,
+                                           gstin, month, year)
+                    returns.append(_return_rows(rng, block, return_share))
+                    writer.append(block)
+                writer.close()
+            written += part_rows
+
+        with out.open(f"tcs_sales_return.{fmt}", "w", force_zip64=True) as member:
+            writer = MEMBER_WRITERS[fmt](member, sum(len(block) for block in returns))
+            for block in returns:
+                writer.append(block)
+            writer.close()
+    return path
+
+
+# ============================================================
+#  STAGE TIMING
+# ============================================================
+def _reset_peak_rss():
+    """
+    Resets the kernel's peak-RSS counter (Linux), so the next reading is the stage's own
+    peak. Process-wide, hence only done here, in the one-case benchmark process.
+    """
+    with contextlib.suppress(OSError):
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+
+class StageTimer:
+    """Wall time and peak RSS of named stages (the best of several repeats)."""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        _reset_peak_rss()
+        started = time.perf_counter()
+        yield
+        seconds = time.perf_counter() - started
+        peak = gst.peak_rss_mib()
+        best = self.stages.get(name)
+        if best is None or seconds < best["seconds"]:
+            self.stages[name] = {"seconds": round(seconds, 4), "peak_mib": round(peak, 1)}
+
+def run_pipeline(zip_path, timer):
+    """The in-memory generate_reports pipeline, one timed stage per step."""
+    with open(zip_path, "rb") as zip_file, tempfile.TemporaryDirectory(prefix="gst-bench-") as work_dir:
+        upload = gst.open_upload(zip_file)
+        with timer.stage("zip_extract"):
+            sales_members, return_members = gst.extract_sales_return(upload, work_dir)
+        with timer.stage("header"):
+            gstin, month, year, _ = gst.export_config(sales_members, return_members)
+        members = [(path, "Sale") for _, path in sales_members] + [(path, "Return") for _, path in return_members]
+
+        with timer.stage("process_file"):
+            frames = gst.parse_members(members, workers=1)
+        with timer.stage("concat"):
+            df_merged = pd.concat(frames, ignore_index=True)
+        del frames
+        with timer.stage("state_mapping"):
+            df_merged = gst.map_state_codes(df_merged)
+        with timer.stage("tax_components"):
+            df_taxed = gst.calculate_tax_components(df_merged, gstin[:2])
+
+        with timer.stage("aggregate"):
+            b2cs_summary, hsn_summary = gst.summarise_taxed(df_taxed)
+        with timer.stage("b2cs_csv"):
+            gst.generate_b2cs_csv(b2cs_summary)
+        with timer.stage("hsn_csv"):
+            gst.generate_hsn_summary(hsn_summary)
+        with timer.stage("gstr1_json"):
+            gst.generate_gstr1_json(b2cs_summary, hsn_summary, gstin, f"{month}{year}", gstin[:2])
+
+        with timer.stage("load_template"):
+            template = gst.load_template()
+        with timer.stage("combo_excel"):
+            gst.generate_combo_excel(
+                df_merged, template, df_taxed=df_taxed, supplier_state=gst.STATE_CODE_NAMES.get(gstin[:2])
+            )
+        return len(df_merged)
+
+def run_case(zip_path, repeat=1):
+    """Runs the pipeline `repeat` times in this process; returns the best time per stage."""
+    timer = StageTimer()
+    for _ in range(repeat):
+        rows = run_pipeline(zip_path, timer)
+    total = sum(stage["seconds"] for stage in timer.stages.values())
+    return {
+        "rows": rows,
+        "stages": timer.stages,
+        "total_seconds": round(total, 4),
+        "peak_mib": round(max(stage["peak_mib"] for stage in timer.stages.values()), 1),
+    }
+
+
+# ============================================================
+#  SUITE, RESULTS AND REGRESSIONS
+# ============================================================
+def parse_size(text):
+    """'10k' -> 10000, '5m' -> 5000000."""
+    text = text.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def current_label():
+    """Short commit id, with -dirty when the working tree has changes (or 'unversioned')."""
+    commit = _git("rev-parse", "--short", "HEAD")
+    if not commit:
+        return "unversioned"
+    return commit + ("-dirty" if _git("status", "--porcelain", "--untracked-files=no") else "")
+
+def dataset_path(rows, fmt, data_dir, seed=0):
+    """Generates the synthetic export for (rows, fmt) once and returns its path."""
+    path = os.path.join(data_dir, f"export_{rows}_{seed}.{fmt}.zip")
+    if not os.path.isfile(path):
+        os.makedirs(data_dir, exist_ok=True)
+        tmp_path = path + ".tmp"
+        generate_export(tmp_path, rows, fmt, seed=seed)
+        os.replace(tmp_path, path)
+    return path
+
+def run_suite(sizes, formats, repeat=1, data_dir=None, label=None, on_case=None):
+    """
+    Runs every (size, format) case in a fresh interpreter and returns the results
+    document; on_case(name, result) is called as each case finishes.
+    """
+    data_dir = data_dir or os.path.join(BENCH_DIR, "data")
+    cases = {}
+    for rows in sizes:
+        for fmt in formats:
+            path = dataset_path(rows, fmt, data_dir)
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "case", path, "--repeat", str(repeat)],
+                capture_output=True, text=True,
+            )
+            name = f"{rows}-{fmt}"
+            if completed.returncode != 0:
+                cases[name] = {"error": completed.stderr.strip().splitlines()[-1:] or ["failed"]}
+            else:
+                cases[name] = json.loads(completed.stdout.strip().splitlines()[-1])
+            cases[name].update(format=fmt, input_rows=rows)
+            if on_case:
+                on_case(name, cases[name])
+
+    return {
+        "label": label or current_label(),
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "repeat": repeat,
+        "environment": {
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "cases": cases,
+    }
+
+def save_results(result, results_dir=None):
+    results_dir = results_dir or os.path.join(BENCH_DIR, "results")
+    os.makedirs(results_dir, exist_ok=True)
+    path = os.path.join(results_dir, f"{result['label']}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    return path
+
+def load_results(label_or_path, results_dir=None):
+    results_dir = results_dir or os.path.join(BENCH_DIR, "results")
+    path = label_or_path if os.path.isfile(label_or_path) else os.path.join(results_dir, f"{label_or_path}.json")
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def find_regressions(base, current, threshold=REGRESSION_THRESHOLD):
+    """(case, stage, metric, base, current) for every stage that got slower or bigger beyond the thresholds."""
+    regressions = []
+    for case, result in current["cases"].items():
+        base_stages = base["cases"].get(case, {}).get("stages", {})
+        for stage, now in result.get("stages", {}).items():
+            before = base_stages.get(stage)
+            if before is None:
+                continue
+            if (now["seconds"] > before["seconds"] * (1 + threshold)
+                    and now["seconds"] - before["seconds"] >= REGRESSION_MIN_SECONDS):
+                regressions.append((case, stage, "seconds", before["seconds"], now["seconds"]))
+            if (now["peak_mib"] > before["peak_mib"] * (1 + threshold)
+                    and now["peak_mib"] - before["peak_mib"] >= REGRESSION_MIN_MIB):
+                regressions.append((case, stage, "peak_mib", before["peak_mib"], now["peak_mib"]))
+    return regressions
+
+
+# ============================================================
+#  COMMAND LINE
+# ============================================================
+def _print_case(name, result):
+    if "error" in result:
+        print(f"{name}: FAILED {' '.join(result['error'])}")
+        return
+    print(f"{name}: {result['rows']:,} rows, {result['total_seconds']:.2f}s, peak {result['peak_mib']:,.0f} MiB")
+    for stage, values in result["stages"].items():
+        print(f"    {stage:<15} {values['seconds']:9.3f}s  {values['peak_mib']:9,.0f} MiB")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the GSTR-1 pipeline on synthetic Meesho exports.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="write one synthetic export ZIP")
+    generate.add_argument("-o", "--output", required=True)
+    generate.add_argument("--rows", default="100k", help="sales rows, e.g. 10k, 1m (default: %(default)s)")
+    generate.add_argument("--format", choices=("xlsx", "csv"), default="xlsx")
+    generate.add_argument("--seed", type=int, default=0)
+
+    run = commands.add_parser("run", help="run the suite and store the results")
+    run.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated sales row counts (default: %(default)s)")
+    run.add_argument("--formats", default=DEFAULT_FORMATS, help="comma-separated: xlsx, csv (default: %(default)s)")
+    run.add_argument("--repeat", type=int, default=3, help="runs per case; the best time counts (default: %(default)s)")
+    run.add_argument("--label", help="name for the stored results (default: short commit id)")
+    run.add_argument("--compare", help="label or path of earlier results to check for regressions")
+    run.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                     help="relative change that counts as a regression (default: %(default)s)")
+    run.add_argument("--data-dir", help=f"generated exports (default: {os.path.join(BENCH_DIR, 'data')})")
+    run.add_argument("--results-dir", help=f"stored results (default: {os.path.join(BENCH_DIR, 'results')})")
+
+    case = commands.add_parser("case", help=argparse.SUPPRESS)  # one case in a fresh process (used by run)
+    case.add_argument("zip_path")
+    case.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        generate_export(args.output, parse_size(args.rows), args.format, seed=args.seed)
+        print(args.output)
+        return 0
+
+    if args.command == "case":
+        print(json.dumps(run_case(args.zip_path, args.repeat)))
+        return 0
+
+    sizes = [parse_size(size) for size in args.sizes.split(",")]
+    formats = [fmt.strip() for fmt in args.formats.split(",")]
+    result = run_suite(sizes, formats, args.repeat, args.data_dir, args.label, on_case=_print_case)
+    print(f"results: {save_results(result, args.results_dir)}")
+
+    if args.compare:
+        regressions = find_regressions(load_results(args.compare, args.results_dir), result, args.threshold)
+        for case_name, stage, metric, before, now in regressions:
+            print(f"REGRESSION {case_name} {stage} {metric}: {before} -> {now}")
+        if regressions:
+            return 1
+        print(f"no regressions vs {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
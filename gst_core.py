@@ -0,0 +1,2925 @@
+"""
+GSTR-1 report processing core: reads a seller's Meesho Sales/Return export ZIP and
+builds the combo workbook, B2CS CSV, HSN CSV and GSTR-1 JSON. No Streamlit here, so
+it can be imported by the app, batch workers, tests and benchmarks alike.
+
+    python gst_core.py seller.zip -o reports/
+"""
+import pandas as pd
+import numpy as np
+import argparse
+import collections
+import contextlib
+import datetime
+import functools
+import io
+import os
+import sys
+import time
+import hashlib
+import itertools
+import shutil
+import tempfile
+import threading
+import zipfile
+import json
+import multiprocessing
+import re
+import posixpath
+import secrets
+import weakref
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from pandas.io.parsers import TextParser
+# openpyxl (streaming reads) and requests (template download) are imported where
+# they are used: most runs need neither, and each adds ~0.1–0.3 s to a cold start.
+
+try:
+    import pyarrow  # noqa: F401 – optional: Arrow-backed order numbers, multi-threaded CSV reader
+    from pyarrow.lib import ArrowException
+    ORDER_NUM_DTYPE = "string[pyarrow]"
+    CSV_ENGINE = "pyarrow"
+except ImportError:
+    ArrowException = OSError # never raised without pyarrow; keeps the except clauses valid
+    ORDER_NUM_DTYPE = None
+    CSV_ENGINE = "c"
+
+try:
+    import orjson  # optional: faster records for the compact GSTR-1 JSON
+except ImportError:
+    orjson = None
+
+# ============================================================
+#  GLOBAL MAPPING & CONSTANTS
+# ============================================================
+GITHUB_TEMPLATE_URL = "https://raw.githubusercontent.com/Biswa-hack/Messo_GST/main/MESSO%20GST%20Template.xlsx"
+
+# Template sources, in order: copy shipped with the app, local cache, GitHub
+BUNDLED_TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "MESSO GST Template.xlsx")
+TEMPLATE_CACHE_DIR = os.environ.get(
+    "MESSO_GST_TEMPLATE_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "messo_gst", "templates")
+)
+TEMPLATE_DOWNLOAD_TIMEOUT = 15      # seconds (connect + read)
+TEMPLATE_REVALIDATE_SECONDS = 3600  # how often the cached copy is re-checked against GitHub
+
+# Finished reports, keyed by the ZIP bytes + code/template version (see ResultCache)
+RESULT_CACHE_DIR = os.environ.get(
+    "MESSO_GST_RESULT_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "messo_gst", "results")
+)
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("MESSO_GST_RESULT_CACHE_MAX_BYTES", 512 * 1024 ** 2))
+
+# Parsed + normalised Sales / Return members as Parquet, keyed by member content (see MemberCache)
+MEMBER_CACHE_DIR = os.environ.get(
+    "MESSO_GST_MEMBER_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "messo_gst", "members")
+)
+MEMBER_CACHE_MAX_BYTES = int(os.environ.get("MESSO_GST_MEMBER_CACHE_MAX_BYTES", 1024 ** 3))
+
+# Artifacts of live app sessions (report bundles, profile dumps), shared by all sessions of a
+# process: spilled to a per-process temp directory under SESSION_STORE_DIR (default: the system
+# temp dir), the most recently used kept in memory too (see SessionResultStore)
+SESSION_STORE_DIR = os.environ.get("MESSO_GST_SESSION_STORE") or None
+SESSION_STORE_MAX_BYTES = int(os.environ.get("MESSO_GST_SESSION_STORE_MAX_BYTES", 2 * 1024 ** 3))
+SESSION_STORE_MEMORY_BYTES = int(os.environ.get("MESSO_GST_SESSION_STORE_MEMORY_BYTES", 128 * 1024 ** 2))
+SESSION_STORE_TTL_SECONDS = int(os.environ.get("MESSO_GST_SESSION_STORE_TTL_SECONDS", 4 * 3600))
+
+# Upload ingestion: a non-seekable upload is spooled (in memory up to SPOOL_MEMORY_BYTES, then
+# on disk); Sales / Return members are extracted to a per-run temp directory. Limits reject ZIP
+# bombs before anything is decompressed (sizes from the central directories).
+SPOOL_MEMORY_BYTES = 8 * 1024 ** 2
+COPY_CHUNK_BYTES = 1024 ** 2
+MAX_MEMBER_BYTES = int(os.environ.get("MESSO_GST_MAX_MEMBER_BYTES", 1024 ** 3))           # one .xlsx in the upload
+MAX_WORKBOOK_XML_BYTES = int(os.environ.get("MESSO_GST_MAX_WORKBOOK_XML_BYTES", 4 * 1024 ** 3))  # all parts of one .xlsx
+MAX_COMPRESSION_RATIO = 200  # uncompressed / compressed, for anything larger than SPOOL_MEMORY_BYTES
+
+# Several Sales / Return workbooks in one ZIP are parsed in parallel worker processes
+# (openpyxl parsing is pure Python, so threads would not overlap) once there is enough to parse.
+# Workers are spawned, not forked (see spawn_pool)
+PARSE_WORKERS = int(os.environ.get("MESSO_GST_PARSE_WORKERS", os.cpu_count() or 1))
+PARALLEL_PARSE_MIN_BYTES = 4 * 1024 ** 2  # below this, starting worker processes costs more than it saves
+
+# Run records (see RunRecorder): lines kept from the cProfile / tracemalloc dumps of a profiled run
+PROFILE_TOP_FUNCTIONS = 60
+PROFILE_TOP_ALLOCATIONS = 40
+
+# Combo workbook: sheet that receives the merged rows, first data row and last column written (O)
+RAW_SHEET_NAME = "raw"
+COMBO_START_ROW = 3
+COMBO_LAST_COL = 15
+COMBO_DEFLATE_LEVEL = 1  # fast deflate: the generated sheet XML dominates the write time
+SUPPLIER_STATE_CELL = "X22"  # raw-sheet cell the K–M formulas compare J against ($X$22)
+# Dates go in as Excel serial numbers shown with this format (openpyxl's, which first filled the sheet)
+COMBO_DATE_FORMAT = "yyyy-mm-dd h:mm:ss"
+
+# How combo columns K–O (CGST, SGST, IGST, Total, tax ratio) are written:
+#   "shared"   – the original formulas, written once per column per block of rows as
+#                shared formulas, with the paise results of calculate_tax_components cached
+#   "values"   – literal values from calculate_tax_components, no formulas
+#   "formulas" – the original formula in every cell (original layout)
+# The formulas are unrounded, so once recalculated K–O can differ from the paise
+# summaries by under a paisa per row.
+COMBO_FORMULA_MODES = ("shared", "values", "formulas")
+DEFAULT_COMBO_FORMULA_MODE = "shared"
+
+# How the GSTR-1 JSON is laid out (same content either way):
+#   "pretty"  – indented by 4 spaces, as json.dumps(indent=4) writes it
+#   "compact" – no whitespace at all, about half the size, for uploading to the portal
+GSTR1_JSON_STYLES = ("pretty", "compact")
+DEFAULT_GSTR1_JSON_STYLE = "pretty"
+GSTR1_JSON_WRITE_RECORDS = 2048  # records encoded per write to the output stream
+
+COLUMN_MAPPING = {
+    'order_date': 'order_date',
+    'sub_order_num': 'order_num',
+    'hsn_code': 'hsn_code',
+    'gst_rate': 'gst_rate',
+    'total_taxable_sale_value': 'tcs_taxable_amount',
+    'end_customer_state_new': 'end_customer_state_new',
+    'quantity': 'QTY'
+}
+
+WRITE_COL_ORDER = [
+    'order_date',             # B
+    'order_num',              # C
+    'hsn_code',               # D
+    'gst_rate',               # E
+    'tcs_taxable_amount',     # F
+    'end_customer_state_new', # G
+    'TYPE',                   # H
+    'QTY'                     # I
+]
+
+TYPE_DTYPE = pd.CategoricalDtype(["Sale", "Return"])
+
+STATE_MAPPING = {
+    "Jammu And Kashmir": "01-Jammu & Kashmir", "Jammu & Kashmir": "01-Jammu & Kashmir",
+    "Himachal Pradesh": "02-Himachal Pradesh", "Punjab": "03-Punjab",
+    "Chandigarh": "04-Chandigarh", "Uttarakhand": "05-Uttarakhand",
+    "Haryana": "06-Haryana", "Delhi": "07-Delhi",
+    "Rajasthan": "08-Rajasthan", "Uttar Pradesh": "09-Uttar Pradesh",
+    "Bihar": "10-Bihar", "Sikkim": "11-Sikkim",
+    "Arunachal Pradesh": "12-Arunachal Pradesh", "Nagaland": "13-Nagaland",
+    "Manipur": "14-Manipur", "Mizoram": "15-Mizoram",
+    "Tripura": "16-Tripura", "Megalaya": "17-Meghalaya",
+    "Meghalaya": "17-Meghalaya", "Assam": "18-Assam",
+    "West Bengal": "19-West Bengal", "Jharkhand": "20-Jharkhand",
+    "Odisha": "21-Odisha", "Chhattisgarh": "22-Chhattisgarh",
+    "Madhya Pradesh": "23-Madhya Pradesh", "Gujarat": "24-Gujarat",
+    "Daman And Diu": "25-Daman & Diu", "Daman & Diu": "25-Daman & Diu",
+    "The Dadra And Nagar Haveli And Daman And Diu": "26-Dadra & Nagar Haveli & Daman & Diu",
+    "Dadra & Nagar Haveli & Daman & Diu": "26-Dadra & Nagar Haveli & Daman & Diu",
+    "Dadra And Nagar Haveli": "26-Dadra & Nagar Haveli & Daman & Diu",
+    "Maharashtra": "27-Maharashtra", "Karnataka": "29-Karnataka",
+    "Goa": "30-Goa", "Lakshadweep": "31-Lakshdweep",
+    "Kerala": "32-Kerala", "Tamil Nadu": "33-Tamil Nadu",
+    "Pondicherry": "34-Puducherry", "Puducherry": "34-Puducherry",
+    "Andaman And Nico.In.": "35-Andaman & Nicobar Islands",
+    "Andaman And Nicobar Islands": "35-Andaman & Nicobar Islands",
+    "Andaman & Nicobar Islands": "35-Andaman & Nicobar Islands",
+    "Telangana": "36-Telangana", "Andhra Pradesh": "37-Andhra Pradesh",
+    "Ladakh": "38-Ladakh", "Other Territory": "97-Other Territory",
+    "Orissa": "21-Odisha",
+  "ORISSA": "21-Odisha",
+  "Andaman & Nicobar": "35-Andaman & Nicobar Islands",
+  "ANDAMAN & NICOBAR": "35-Andaman & Nicobar Islands"
+}
+
+# GSTIN state code -> "NN-State" label as it appears in J_mapped (and in raw!X22)
+STATE_CODE_NAMES = {}
+for _state_label in STATE_MAPPING.values():
+    STATE_CODE_NAMES.setdefault(_state_label[:2], _state_label)
+
+# J_mapped is categorical over every POS label ("" = unmapped state), in label order
+POS_DTYPE = pd.CategoricalDtype([""] + sorted(set(STATE_MAPPING.values())))
+
+# Sales header cells holding the configuration (GSTIN, reporting month / year)
+HEADER_CELLS = {"gstin": "C2", "month": "P2", "year": "O2"}
+# ... and the columns holding them in a CSV export (same columns, first data row)
+CSV_HEADER_COLUMNS = {"gstin": "gstin", "month": "month_number", "year": "financial_year"}
+GSTIN_PATTERN = re.compile(r"[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z][1-9A-Z]Z[0-9A-Z]")
+
+# Streaming (low-memory) mode: rows read from each sheet per chunk
+STREAM_CHUNK_ROWS = 50_000
+
+# Accepted export members. Meesho's CSV export has the same columns as the .xlsx one; only the
+# columns in COLUMN_MAPPING are read, text columns as str (numbers are inferred, as for .xlsx)
+INPUT_EXTENSIONS = (".xlsx", ".xls", ".csv")
+CSV_TEXT_COLUMNS = ["sub_order_num", "end_customer_state_new"]
+
+# Group keys and summed columns shared by the B2CS / HSN summaries and the JSON
+B2CS_GROUP_KEYS = ["J_mapped", "gst_rate"]
+B2CS_SUM_COLS = ["tcs_taxable_amount", "IGST", "CGST", "SGST"]
+HSN_GROUP_KEYS = ["hsn_code", "gst_rate"]
+HSN_SUM_COLS = ["QTY", "Total Value", "tcs_taxable_amount", "IGST", "CGST", "SGST"]
+# Finest grain both summaries roll up from: one pass over the taxed rows fills it
+CUBE_GROUP_KEYS = ["J_mapped", "hsn_code", "gst_rate"]
+CUBE_SUM_COLS = ["tcs_taxable_amount", "QTY", "IGST", "CGST", "SGST", "Total Value"]
+
+# Tax is computed per row in whole paise (int64): the taxable value is rounded to paise,
+# then CGST = SGST = taxable × rate / 2 and IGST = taxable × rate, each rounded to the
+# paisa half away from zero (so a return exactly cancels its sale). Summaries add up
+# these paise exactly; rupees (paise / 100) are derived only where written (see tax_rupees).
+PAISE_COLUMNS = {
+    "tcs_taxable_amount": "taxable_paise",
+    "IGST": "igst_paise",
+    "CGST": "cgst_paise",
+    "SGST": "sgst_paise",
+    "Total Value": "total_value_paise",
+}
+
+
+# ============================================================
+#  HELPER FUNCTIONS
+# ============================================================
+class TemplateUnavailableError(Exception):
+    """Raised when no template copy can be found locally or downloaded."""
+
+class ReportError(Exception):
+    """
+    A processing failure with a plain-text message meant for the user (shown as-is by
+    the CLI and batch tools). `emphasis` lists phrases of it the app shows in bold.
+    """
+
+    def __init__(self, message, emphasis=()):
+        super().__init__(message)
+        self.emphasis = tuple(emphasis)
+
+
+class TemplateProvider:
+    """
+    Process-wide source of the combo template.
+
+    The bundled copy is used when present. Otherwise the template comes from an
+    on-disk cache keyed by its SHA-256, revalidated against GitHub with a conditional
+    request (ETag / Last-Modified) at most every TEMPLATE_REVALIDATE_SECONDS; when
+    GitHub is unreachable the cached copy is used as is. The template is parsed once
+    into a single ComboTemplate, shared read-only by every run; it is dropped and
+    prepared again when the template content (its SHA-256 version) changes.
+    """
+
+    def __init__(self, bundled_path=BUNDLED_TEMPLATE_PATH, cache_dir=TEMPLATE_CACHE_DIR,
+                 url=GITHUB_TEMPLATE_URL):
+        self.bundled_path = bundled_path
+        self.cache_dir = cache_dir
+        self.url = url
+        self._lock = threading.Lock()
+        self._content = None
+        self._version = None
+        self._checked_at = 0.0
+        self._prepared = None # ComboTemplate of the current version
+
+    # --- raw bytes -------------------------------------------------------
+    def template_bytes(self):
+        """Returns (content, sha256) of the current template."""
+        with self._lock:
+            if self._content is None or self._needs_revalidation():
+                self._load()
+            return self._content, self._version
+
+    def _needs_revalidation(self):
+        if self._version is not None and self._from_bundle():
+            return False
+        return time.time() - self._checked_at > TEMPLATE_REVALIDATE_SECONDS
+
+    def _from_bundle(self):
+        return self.bundled_path and os.path.isfile(self.bundled_path)
+
+    def _set_content(self, content):
+        version = hashlib.sha256(content).hexdigest()
+        if version != self._version:
+            self._prepared = None # prepared for the old version
+        self._content, self._version = content, version
+        self._checked_at = time.time()
+
+    def _load(self):
+        if self._from_bundle():
+            with open(self.bundled_path, "rb") as f:
+                self._set_content(f.read())
+            return
+
+        index = self._read_cache_index()
+        cached = self._read_cached(index.get("sha256")) if index else None
+        headers = {}
+        if cached is not None:
+            if index.get("etag"):
+                headers["If-None-Match"] = index["etag"]
+            if index.get("last_modified"):
+                headers["If-Modified-Since"] = index["last_modified"]
+
+        import requests
+
+        try:
+            r = requests.get(self.url, headers=headers, timeout=TEMPLATE_DOWNLOAD_TIMEOUT)
+        except requests.RequestException as e:
+            if cached is None:
+                raise TemplateUnavailableError(f"Could not download template from GitHub: {e}") from e
+            self._set_content(cached) # offline: keep using the cached copy
+            return
+
+        if r.status_code == 304 and cached is not None:
+            self._set_content(cached)
+        elif r.status_code == 200:
+            self._set_content(r.content)
+            self._write_cache(r.content, r.headers.get("ETag"), r.headers.get("Last-Modified"))
+        elif cached is not None:
+            self._set_content(cached)
+        else:
+            raise TemplateUnavailableError(
+                "Could not download template from GitHub. Status Code: " + str(r.status_code)
+            )
+
+    # --- on-disk cache ---------------------------------------------------
+    def _index_path(self):
+        return os.path.join(self.cache_dir, "index.json")
+
+    def _read_cache_index(self):
+        try:
+            with open(self._index_path(), "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return index if index.get("url") == self.url else None
+
+    def _read_cached(self, sha256):
+        if not sha256:
+            return None
+        try:
+            with open(os.path.join(self.cache_dir, f"{sha256}.xlsx"), "rb") as f:
+                content = f.read()
+        except OSError:
+            return None
+        # Ignore a cached file that was truncated or edited
+        return content if hashlib.sha256(content).hexdigest() == sha256 else None
+
+    def _write_cache(self, content, etag, last_modified):
+        sha256 = hashlib.sha256(content).hexdigest()
+        index = {"url": self.url, "sha256": sha256, "etag": etag, "last_modified": last_modified}
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            _atomic_write(os.path.join(self.cache_dir, f"{sha256}.xlsx"), content)
+            _atomic_write(self._index_path(), json.dumps(index).encode("utf-8"))
+        except OSError:
+            pass # the cache is an optimisation; a read-only disk must not fail the run
+
+    # --- prepared template -----------------------------------------------
+    def combo_template(self):
+        """Returns the ComboTemplate of the current template version (prepared once)."""
+        content, version = self.template_bytes()
+        with self._lock:
+            if self._prepared is None or self._prepared.version != version:
+                self._prepared = ComboTemplate(content)
+            return self._prepared
+
+
+def _atomic_write(path, content):
+    """Writes via a temp file + rename so concurrent readers never see a partial file."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@functools.lru_cache(maxsize=None)
+def get_template_provider():
+    """One TemplateProvider per process, shared by all sessions, reruns and batch jobs."""
+    return TemplateProvider()
+
+def load_template():
+    """Returns the prepared combo template (bundled copy, then local cache, then GitHub)."""
+    try:
+        return get_template_provider().combo_template()
+    except TemplateUnavailableError as e:
+        raise ReportError(str(e)) from e
+    except (zipfile.BadZipFile, KeyError, ValueError) as e:
+        raise ReportError(f"The combo template is not a usable .xlsx with a '{RAW_SHEET_NAME}' sheet: {e}") from e
+
+def template_version():
+    """SHA-256 of the template the next run will use (part of the result cache key)."""
+    try:
+        return get_template_provider().template_bytes()[1]
+    except TemplateUnavailableError as e:
+        raise ReportError(str(e)) from e
+
+def detect_format(path):
+    """
+    'excel' for .xlsx / .xls content (by signature, not by name), otherwise 'csv'.
+    Takes a path or a seekable file object, which is left at the position it was at.
+    """
+    if hasattr(path, "read"):
+        position = path.tell()
+        signature = path.read(8)
+        path.seek(position)
+    else:
+        with open(path, "rb") as f:
+            signature = f.read(8)
+    if signature.startswith((b"PK\x03\x04", b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1")):
+        return "excel"
+    return "csv"
+
+def _csv_options(**overrides):
+    options = {
+        "usecols": list(COLUMN_MAPPING),
+        "dtype": {col: "str" for col in CSV_TEXT_COLUMNS},
+        "parse_dates": ["order_date"],
+        "encoding": "utf-8-sig",
+    }
+    options.update(overrides)
+    return options
+
+def read_csv_export(path, **overrides):
+    """Reads the COLUMN_MAPPING columns of a CSV export, with the multi-threaded Arrow engine when available."""
+    if CSV_ENGINE == "pyarrow":
+        # No dtype map here: with one, the Arrow engine casts every column and fails on
+        # blank numeric cells. The text columns are cast afterwards instead.
+        position = path.tell() if hasattr(path, "read") else None
+        df = pd.read_csv(path, **_csv_options(engine="pyarrow", dtype=None, **overrides))
+        text_cols = [col for col in CSV_TEXT_COLUMNS if col in df.columns]
+        if all(pd.api.types.is_string_dtype(df[col]) or df[col].isna().all() for col in text_cols):
+            return df.astype({col: "str" for col in text_cols})
+        # Arrow read an all-numeric text column as numbers (leading zeros lost): re-read as text
+        if position is not None:
+            path.seek(position)
+    return pd.read_csv(path, **_csv_options(engine="c", **overrides))
+
+def process_file(file_data, data_type):
+    """Reads Excel or CSV, renames columns, and adjusts values for Sales/Return."""
+    if detect_format(file_data) == "csv":
+        df = read_csv_export(file_data)
+    else:
+        df = pd.read_excel(file_data)
+    return normalise_frame(df, data_type)
+
+def normalise_frame(df, data_type):
+    """Renames columns, keeps the required ones, and applies the Sale/Return sign convention."""
+    df_processed = df.rename(columns=COLUMN_MAPPING)
+
+    # Filter and create the final DataFrame with required columns (a new frame; no extra copy needed)
+    df_final = df_processed[list(COLUMN_MAPPING.values())]
+    df_final["TYPE"] = data_type
+
+    df_final["tcs_taxable_amount"] = pd.to_numeric(df_final["tcs_taxable_amount"], errors="coerce")
+    df_final["QTY"] = pd.to_numeric(df_final["QTY"], errors="coerce")
+
+    # Apply sign convention based on data type
+    if data_type == "Return":
+        df_final["tcs_taxable_amount"] = df_final["tcs_taxable_amount"].abs() * -1
+        df_final["QTY"] = df_final["QTY"].abs() * -1
+    else:
+        df_final["tcs_taxable_amount"] = df_final["tcs_taxable_amount"].abs()
+        df_final["QTY"] = df_final["QTY"].abs()
+
+    return compact_frame(df_final)
+
+def compact_frame(df):
+    """
+    Shrinks the canonical columns in place: TYPE as a categorical, HSN / rate / quantity
+    in the smallest integer dtype that holds them (when they are whole numbers without
+    gaps) and Arrow-backed order numbers. Values and the reports built from them are unchanged.
+    """
+    df["TYPE"] = df["TYPE"].astype(TYPE_DTYPE)
+    for col in ("hsn_code", "gst_rate", "QTY"):
+        if pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast="integer")
+    order_num = df["order_num"]
+    if ORDER_NUM_DTYPE and order_num.dtype == object and pd.api.types.infer_dtype(order_num, skipna=True) == "string":
+        df["order_num"] = order_num.astype(ORDER_NUM_DTYPE)
+    return df
+
+def memory_report(df):
+    """Per-column dtype and deep memory use (bytes) of a frame, with a TOTAL row."""
+    usage = df.memory_usage(deep=True)
+    report = pd.DataFrame({
+        "dtype": [str(df.index.dtype)] + [str(dtype) for dtype in df.dtypes],
+        "bytes": usage.to_numpy(),
+    }, index=usage.index)
+    report.loc["TOTAL"] = ["", int(usage.sum())]
+    return report
+
+def _state_key(name):
+    """Spelling-insensitive lookup key: upper case, single spaces, '&' as AND, no leading THE."""
+    key = " ".join(name.replace("&", " AND ").split()).upper()
+    return key[4:] if key.startswith("THE ") else key
+
+class StateNormaliser:
+    """
+    Resolves raw customer-state spellings to POS labels. Each distinct spelling is
+    resolved once per server process; a column only pays for its unique values.
+    """
+
+    def __init__(self, mapping=STATE_MAPPING):
+        self._lookup = {_state_key(name): label for name, label in mapping.items()}
+        self._resolved = {}  # raw value -> (title-cased text, POS label or "")
+        self._lock = threading.Lock()
+
+    def resolve(self, raw):
+        found = self._resolved.get(raw)
+        if found is None:
+            text = str(raw)
+            found = (text.title(), self._lookup.get(_state_key(text), ""))
+            with self._lock:
+                self._resolved[raw] = found
+        return found
+
+    def normalise(self, states):
+        """Returns (title-cased state, POS label) for a column as two categorical Series."""
+        codes, uniques = pd.factorize(states)
+        resolved = [self.resolve(value) for value in uniques.tolist()]
+        titles = [title for title, _ in resolved]
+        labels = [label for _, label in resolved]
+
+        # Distinct spellings can share a title ("ORISSA", "orissa"), so factorise the titles again
+        title_codes, title_uniques = pd.factorize(pd.Index(titles, dtype=object))
+        title_codes = np.append(title_codes, -1) # code -1: missing state
+        label_codes = np.append(POS_DTYPE.categories.get_indexer(labels), 0)
+        return (
+            pd.Series(pd.Categorical.from_codes(title_codes[codes], title_uniques), index=states.index),
+            pd.Series(pd.Categorical.from_codes(label_codes[codes], dtype=POS_DTYPE), index=states.index),
+        )
+
+@functools.lru_cache(maxsize=None)
+def get_state_normaliser():
+    """One StateNormaliser per process, so resolved spellings carry across runs."""
+    return StateNormaliser()
+
+def map_state_codes(df):
+    """Title-cases the customer state and maps it to the 'XX-State Name' code in J_mapped."""
+    df["end_customer_state_new"], df["J_mapped"] = get_state_normaliser().normalise(df["end_customer_state_new"])
+    return df
+
+def _intra_state_mask(pos, supplier_state_code_numeric):
+    """True where the POS (J_mapped) has the supplier's two-digit state code."""
+    if not isinstance(pos.dtype, pd.CategoricalDtype) or pos.dtype != POS_DTYPE:
+        pos = pos.astype(POS_DTYPE)
+    intra_codes = [
+        code for code, label in enumerate(POS_DTYPE.categories) if label[:2] == supplier_state_code_numeric
+    ]
+    return pd.Series(np.isin(pos.cat.codes.to_numpy(), intra_codes), index=pos.index)
+
+def _to_hundredths(values):
+    """
+    Numbers -> int64 hundredths (rupees -> paise, % -> basis points), rounded half away
+    from zero; also returns the mask of finite values (the others become 0).
+    """
+    if values.dtype.kind in "iu":
+        return values.to_numpy(dtype=np.int64) * 100, np.ones(len(values), dtype=bool)
+    arr = values.to_numpy(dtype=np.float64, na_value=np.nan)
+    present = np.isfinite(arr)
+    scaled = np.where(present, arr, 0.0) * 100
+    # The 1e-6 absorbs binary noise at the half: 1.005 * 100 is 100.49999999999999
+    return np.trunc(scaled + np.copysign(0.5 + 1e-6, scaled)).astype(np.int64), present
+
+def _divide_half_up(numerators, denominators):
+    """int64 numerators / even denominators, rounded half away from zero."""
+    magnitudes = (np.abs(numerators) + denominators // 2) // denominators
+    return np.where(numerators < 0, -magnitudes, magnitudes)
+
+def calculate_tax_components(df, supplier_state_code_numeric):
+    """
+    Calculates CGST, SGST, IGST based on the dynamically provided supplier state code,
+    in whole paise per row (see PAISE_COLUMNS). Adds only the int64 paise columns the
+    summaries add up and the boolean intra_state; tax_rupees() gives the rupee amounts.
+    """
+    df_taxed = df.copy(deep=False) # new columns only; the caller's frame is left as it was
+    
+    # Check if Place of Supply is the same as Supplier State Code (Intra-State);
+    # J_mapped labels start with the state code (e.g., '27-Maharashtra'), compared per category
+    is_intra_state = _intra_state_mask(df_taxed["J_mapped"], supplier_state_code_numeric).to_numpy()
+    
+    df_taxed["gst_rate"] = pd.to_numeric(df_taxed["gst_rate"], errors='coerce').fillna(0)
+
+    taxable_paise, _ = _to_hundredths(df_taxed["tcs_taxable_amount"])
+    rate_basis_points, _ = _to_hundredths(df_taxed["gst_rate"])
+    tax_numerators = taxable_paise * rate_basis_points # paise × 10,000
+
+    # Intra-state rows get half the rate twice (CGST, SGST), the others the full rate once (IGST)
+    tax_paise = _divide_half_up(tax_numerators, np.where(is_intra_state, 20_000, 10_000))
+    cgst_paise = np.where(is_intra_state, tax_paise, 0)
+    igst_paise = np.where(is_intra_state, 0, tax_paise)
+    total_tax_paise = cgst_paise + tax_paise # 2 × CGST or IGST
+
+    df_taxed["intra_state"] = is_intra_state
+    df_taxed["taxable_paise"] = taxable_paise
+    df_taxed["cgst_paise"] = cgst_paise
+    df_taxed["sgst_paise"] = cgst_paise
+    df_taxed["igst_paise"] = igst_paise
+    df_taxed["total_value_paise"] = taxable_paise + total_tax_paise
+    
+    return df_taxed
+
+def tax_rupees(df_taxed):
+    """
+    The rupee amounts (float64 arrays, paise / 100) of a calculate_tax_components frame,
+    keyed CGST, SGST, IGST, Total Tax, Total Value. A row without a taxable value has no
+    amount (NaN) where the tax applies.
+    """
+    taxable = df_taxed["tcs_taxable_amount"]
+    if taxable.dtype.kind in "iu":
+        has_taxable = np.ones(len(taxable), dtype=bool)
+    else:
+        has_taxable = np.isfinite(taxable.to_numpy(dtype=np.float64, na_value=np.nan))
+    intra_state = df_taxed["intra_state"].to_numpy()
+    all_taxable = has_taxable.all()
+
+    def rupees(paise, applies=None):
+        amounts = paise / 100
+        if all_taxable:
+            return amounts
+        return np.where(has_taxable if applies is None else has_taxable | ~applies, amounts, np.nan)
+
+    cgst_paise = df_taxed["cgst_paise"].to_numpy()
+    igst_paise = df_taxed["igst_paise"].to_numpy()
+    total_value_paise = df_taxed["total_value_paise"].to_numpy()
+    cgst = rupees(cgst_paise, intra_state)
+    return {
+        "CGST": cgst,
+        "SGST": cgst,
+        "IGST": rupees(igst_paise, ~intra_state),
+        "Total Tax": rupees(total_value_paise - df_taxed["taxable_paise"].to_numpy()),
+        "Total Value": rupees(total_value_paise),
+    }
+
+# ============================================================
+#  COMBO WORKBOOK (RAW SHEET SPLICE)
+# ============================================================
+_ROW_RE = re.compile(r"<row\b([^>]*?)(?:/>|>(.*?)</row>)", re.S)
+_CELL_RE = re.compile(r"<c\b([^>]*?)(?:/>|>.*?</c>)", re.S)
+_ATTR_R_RE = re.compile(r'\br="([A-Z]*)([0-9]+)"')
+_ATTR_S_RE = re.compile(r'\bs="([0-9]+)"')
+_SHARED_INDEX_RE = re.compile(r'\bsi="([0-9]+)"')
+_SPANS_RE = re.compile(r'\s+spans="[^"]*"')
+_ILLEGAL_XML_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_CALC_CHAIN_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/calcChain"
+
+def _column_index(letters):
+    index = 0
+    for ch in letters:
+        index = index * 26 + ord(ch) - 64
+    return index
+
+def column_letter(index):
+    """Spreadsheet column letters of a 1-based column index (1 -> 'A', 27 -> 'AA')."""
+    letters = ""
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+_COMBO_COL_LETTERS = [column_letter(i) for i in range(1, COMBO_LAST_COL + 1)]
+_EXCEL_EPOCH = pd.Timestamp("1899-12-30")
+
+def _xml_text(value):
+    return _ILLEGAL_XML_CHARS.sub("", str(value)).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+class ComboTemplate:
+    """
+    The template package prepared for splicing: every part except the 'raw' sheet is
+    kept as is, and the raw sheet is split around <sheetData> into the rows above
+    COMBO_START_ROW and, for the data rows, only the cells right of column O.
+
+    Only four small parts are edited: calcChain.xml is dropped (Excel rebuilds it),
+    its references go from the content types / workbook rels, workbook.xml gets
+    fullCalcOnLoad so the K–O formulas are calculated when the file is opened, and
+    styles.xml gets a COMBO_DATE_FORMAT copy of each data-column style for date cells.
+    """
+
+    def __init__(self, content):
+        self.version = hashlib.sha256(content).hexdigest()
+        with zipfile.ZipFile(io.BytesIO(content)) as z:
+            self.raw_path = _sheet_path(z, RAW_SHEET_NAME)
+            self.parts = []
+            for info in z.infolist():
+                data = z.read(info.filename)
+                if info.filename == self.raw_path:
+                    self._split_raw_sheet(data.decode("utf-8"))
+                    continue
+                self.parts.append((info, data))
+        self._drop_calc_chain()
+        self._add_date_styles()
+
+    def _split_raw_sheet(self, sheet_xml):
+        start = sheet_xml.index("<sheetData")
+        open_end = sheet_xml.index(">", start) + 1
+        if sheet_xml[open_end - 2] == "/": # <sheetData/>
+            body, close_end = "", open_end
+        else:
+            close = sheet_xml.index("</sheetData>", open_end)
+            body, close_end = sheet_xml[open_end:close], close + len("</sheetData>")
+        self.head = sheet_xml[:start] + "<sheetData>"
+        self.tail = "</sheetData>" + sheet_xml[close_end:]
+
+        self.header_rows = []   # raw XML of rows above COMBO_START_ROW
+        self.kept_rows = {}     # row number -> (row attributes, XML of cells right of O)
+        self.cell_styles = {}   # column index -> style id taken from the first data row
+        self.max_col = COMBO_LAST_COL
+        self.next_shared_index = 0 # first shared-formula index not used by the kept cells
+        for row in _ROW_RE.finditer(body):
+            attrs, inner = row.group(1), row.group(2) or ""
+            row_number = int(re.search(r'\br="([0-9]+)"', attrs).group(1))
+            if row_number < COMBO_START_ROW:
+                self.header_rows.append(row.group(0))
+                for index in _SHARED_INDEX_RE.findall(row.group(0)):
+                    self.next_shared_index = max(self.next_shared_index, int(index) + 1)
+                continue
+            kept = []
+            for cell in _CELL_RE.finditer(inner):
+                ref = _ATTR_R_RE.search(cell.group(1))
+                col = _column_index(ref.group(1))
+                if col > COMBO_LAST_COL:
+                    kept.append(cell.group(0))
+                    self.max_col = max(self.max_col, col)
+                    for index in _SHARED_INDEX_RE.findall(cell.group(0)):
+                        self.next_shared_index = max(self.next_shared_index, int(index) + 1)
+                elif row_number == COMBO_START_ROW:
+                    style = _ATTR_S_RE.search(cell.group(1))
+                    if style:
+                        self.cell_styles[col] = style.group(1)
+            if kept:
+                self.kept_rows[row_number] = (_SPANS_RE.sub("", attrs), "".join(kept))
+
+    def _drop_calc_chain(self):
+        parts = []
+        for info, data in self.parts:
+            name = info.filename
+            if name == "xl/calcChain.xml":
+                continue
+            if name == "[Content_Types].xml":
+                data = re.sub(rb'<Override[^>]*PartName="/xl/calcChain.xml"[^>]*/>', b"", data)
+            elif name == "xl/_rels/workbook.xml.rels":
+                data = re.sub(rb'<Relationship[^>]*Type="' + _CALC_CHAIN_TYPE.encode() + rb'"[^>]*/>', b"", data)
+            elif name == "xl/workbook.xml":
+                if re.search(rb"<calcPr\b", data):
+                    data = re.sub(rb'\s+fullCalcOnLoad="[^"]*"', b"", data)
+                    data = re.sub(rb"<calcPr\b", b'<calcPr fullCalcOnLoad="1"', data, count=1)
+                self.workbook_index = len(parts)
+            parts.append((info, data))
+        self.parts = parts
+
+    def _add_date_styles(self):
+        self.date_styles = {}  # column index -> style id of its date cells
+        for index, (info, data) in enumerate(self.parts):
+            if info.filename == "xl/styles.xml":
+                break
+        else:
+            return
+        xml = data.decode("utf-8")
+
+        fmt_id = max([163] + [int(i) for i in re.findall(r'<numFmt\b[^>]*\bnumFmtId="([0-9]+)"', xml)]) + 1
+        num_fmt = f'<numFmt numFmtId="{fmt_id}" formatCode="{COMBO_DATE_FORMAT}"/>'
+        if re.search(r"<numFmts\b[^>]*>", xml) and "</numFmts>" in xml:
+            xml = re.sub(r'(<numFmts\b[^>]*\bcount=")([0-9]+)"', lambda m: f'{m.group(1)}{int(m.group(2)) + 1}"', xml, count=1)
+            xml = xml.replace("</numFmts>", num_fmt + "</numFmts>", 1)
+        else:
+            xml = re.sub(r"(<styleSheet\b[^>]*>)", lambda m: f'{m.group(1)}<numFmts count="1">{num_fmt}</numFmts>', xml, count=1)
+
+        start = xml.index("<cellXfs")
+        body_start = xml.index(">", start) + 1
+        body_end = xml.index("</cellXfs>", body_start)
+        xfs = re.findall(r"<xf\b[^>]*?(?:/>|>.*?</xf>)", xml[body_start:body_end], re.S)
+        added = {}  # base style id -> date style id
+        for col in range(1, COMBO_LAST_COL + 1):
+            base = int(self.cell_styles.get(col, 0))
+            if base not in added:
+                xf = re.sub(r'\bnumFmtId="[0-9]+"', f'numFmtId="{fmt_id}"', xfs[base], count=1)
+                xf = re.sub(r'\s+applyNumberFormat="[^"]*"', "", xf)
+                xf = xf.replace("<xf", '<xf applyNumberFormat="1"', 1)
+                added[base] = len(xfs)
+                xfs.append(xf)
+            self.date_styles[col] = str(added[base])
+        head = re.sub(r'\bcount="[0-9]+"', f'count="{len(xfs)}"', xml[start:body_start], count=1)
+        xml = xml[:start] + head + "".join(xfs) + xml[body_end:]
+        self.parts[index] = (info, xml.encode("utf-8"))
+
+    def style_attr(self, col):
+        style = self.cell_styles.get(col)
+        return f' s="{style}"' if style else ""
+
+    def date_style_attr(self, col):
+        style = self.date_styles.get(col)
+        return f' s="{style}"' if style else self.style_attr(col)
+
+
+class ComboWorkbookWriter:
+    """
+    Writes the combo workbook by splicing a newly generated 'raw' sheet into the
+    template package. Rows can be appended chunk by chunk (streaming mode) or all at
+    once (generate_combo_excel); they are spooled as sheet XML and only assembled into
+    the .xlsx in getvalue(). Pivot tables, other sheets and styles are left untouched.
+    """
+
+    START_ROW = COMBO_START_ROW
+
+    def __init__(self, template, formula_mode=DEFAULT_COMBO_FORMULA_MODE, supplier_state=None):
+        if formula_mode not in COMBO_FORMULA_MODES:
+            raise ValueError(f"formula_mode must be one of {COMBO_FORMULA_MODES}, not {formula_mode!r}")
+        self.template = template
+        self.formula_mode = formula_mode
+        self.next_row = self.START_ROW
+        self._rows = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
+        self._next_shared_index = template.next_shared_index
+        self._kept_rows = template.kept_rows
+        if supplier_state:
+            self._kept_rows = _with_text_cell(template.kept_rows, SUPPLIER_STATE_CELL, supplier_state)
+
+    def append(self, df_chunk, df_taxed=None):
+        """
+        Writes one block of merged rows (A–O) below the rows already written.
+        `df_taxed` (the same rows after calculate_tax_components) supplies the K–O
+        values for the "values" mode and the cached results for the "shared" mode.
+        """
+        num_rows = len(df_chunk)
+        if num_rows == 0:
+            return
+
+        # Ensure all required columns exist before proceeding
+        required_cols = WRITE_COL_ORDER + ["J_mapped"]
+        missing_cols = [col for col in required_cols if col not in df_chunk.columns]
+        if missing_cols:
+            raise ReportError(f"Internal Error: Missing columns {missing_cols} needed for Excel generation.")
+
+        if self.formula_mode == "values" and df_taxed is None:
+            raise ReportError("Internal Error: Tax columns are needed to write the combo sheet as values.")
+
+        kept_rows = self._kept_rows
+        start_row = self.next_row
+        row_numbers = [str(r) for r in range(start_row, start_row + num_rows)]
+
+        # A = Messo, B → I = WRITE_COL_ORDER, J = mapped state, K → O = formulas
+        columns = [self._constant_cells(1, "Messo", row_numbers)]
+        for col, name in enumerate(WRITE_COL_ORDER, start=2):
+            columns.append(self._value_cells(col, df_chunk[name], row_numbers))
+        columns.append(self._value_cells(10, df_chunk["J_mapped"], row_numbers))
+        columns.extend(self._tax_cells(row_numbers, df_taxed))
+
+        xml_rows = []
+        for r, cells in zip(row_numbers, zip(*columns)):
+            kept = kept_rows.get(int(r)) if kept_rows else None
+            if kept is None:
+                xml_rows.append(f'<row r="{r}">' + "".join(cells) + "</row>")
+            else:
+                # Template rows in this range keep their own cells right of column O
+                attrs, kept_cells = kept
+                xml_rows.append(f"<row{attrs}>" + "".join(cells) + kept_cells + "</row>")
+
+        self._rows.write("".join(xml_rows).encode("utf-8"))
+        self.next_row += num_rows
+
+    def _constant_cells(self, col, text, row_numbers):
+        head = f'<c r="{_COMBO_COL_LETTERS[col - 1]}'
+        tail = f'"{self.template.style_attr(col)} t="inlineStr"><is><t>{_xml_text(text)}</t></is></c>'
+        return [head + r + tail for r in row_numbers]
+
+    def _value_cells(self, col, series, row_numbers):
+        """Cell XML per row for one column: numbers as <v>, text as inline strings, blanks as ''."""
+        head = f'<c r="{_COMBO_COL_LETTERS[col - 1]}'
+        style = self.template.style_attr(col)
+        values = series.reset_index(drop=True)
+
+        if values.dtype.kind in "iuf":
+            present = values.notna().tolist()
+            texts = values.astype(str).tolist()
+            return [
+                f'{head}{r}"{style}><v>{text}</v></c>' if ok else ""
+                for r, text, ok in zip(row_numbers, texts, present)
+            ]
+        if values.dtype.kind == "b":
+            return [f'{head}{r}"{style} t="b"><v>{int(v)}</v></c>' for r, v in zip(row_numbers, values.tolist())]
+
+        # Text, dates and mixed object columns: build each distinct value's cell body once
+        codes, uniques = pd.factorize(values)
+        date_style = self.template.date_style_attr(col)
+        bodies = [self._cell_body(value, style, date_style) for value in uniques.tolist()]
+        bodies.append("") # code -1: missing value
+        return [head + r + bodies[code] if bodies[code] else "" for r, code in zip(row_numbers, codes.tolist())]
+
+    @staticmethod
+    def _cell_body(value, style, date_style):
+        """Everything after the cell reference for one value; '' for a blank cell."""
+        if value is None or value is pd.NaT or (isinstance(value, float) and value != value):
+            return ""
+        if isinstance(value, (bool, np.bool_)):
+            return f'"{style} t="b"><v>{int(value)}</v></c>'
+        if isinstance(value, (int, float, np.integer, np.floating)):
+            number = value.item() if isinstance(value, np.generic) else value
+            return f'"{style}><v>{number!r}</v></c>'
+        if isinstance(value, (datetime.date, np.datetime64)):
+            # Excel serial date (days since 1899-12-30); text dates stay text below
+            days = (pd.Timestamp(value).tz_localize(None) - _EXCEL_EPOCH) / pd.Timedelta(days=1)
+            number = int(days) if days.is_integer() else days
+            return f'"{date_style}><v>{number!r}</v></c>'
+        text = _xml_text(value)
+        if not text:
+            return ""
+        space = ' xml:space="preserve"' if text != text.strip() else ""
+        return f'"{style} t="inlineStr"><is><t{space}>{text}</t></is></c>'
+
+    def _tax_cells(self, row_numbers, df_taxed):
+        """Columns K–O in the configured formula_mode ($X$22 holds the supplier state code string)."""
+        letters = _COMBO_COL_LETTERS
+        style = {col: self.template.style_attr(col) for col in range(11, 16)}
+        if self.formula_mode == "formulas":
+            return [
+                [f'<c r="{letters[10]}{r}"{style[11]}><f>IF(J{r}=$X$22,F{r}*E{r}/100/2,0)</f></c>' for r in row_numbers],
+                [f'<c r="{letters[11]}{r}"{style[12]}><f>IF(J{r}=$X$22,F{r}*E{r}/100/2,0)</f></c>' for r in row_numbers],
+                [f'<c r="{letters[12]}{r}"{style[13]}><f>IF(J{r}&lt;&gt;$X$22,F{r}*E{r}/100,0)</f></c>' for r in row_numbers],
+                [f'<c r="{letters[13]}{r}"{style[14]}><f>K{r}+L{r}+M{r}+F{r}</f></c>' for r in row_numbers],
+                [f'<c r="{letters[14]}{r}"{style[15]}><f>(K{r}+L{r}+M{r})/F{r}</f></c>' for r in row_numbers],
+            ]
+
+        # Results per column, in the same order as K–O
+        if df_taxed is not None:
+            taxable = df_taxed["tcs_taxable_amount"].to_numpy(dtype=np.float64, na_value=np.nan)
+            rupees = tax_rupees(df_taxed)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                ratio = rupees["Total Tax"] / taxable
+            results = [rupees["CGST"], rupees["SGST"], rupees["IGST"], rupees["Total Value"], ratio]
+            results = [_number_texts(values) for values in results]
+        else:
+            results = [[""] * len(row_numbers)] * 5
+
+        if self.formula_mode == "values":
+            return [
+                [f'<c r="{letters[col - 1]}{r}"{style[col]}><v>{v}</v></c>' if v else "" for r, v in zip(row_numbers, texts)]
+                for col, texts in zip(range(11, 16), results)
+            ]
+
+        # "shared": the first row of the block holds each column's formula, the rest refer to it
+        first, last = row_numbers[0], row_numbers[-1]
+        masters = {
+            11: f"IF(J{first}=$X$22,F{first}*E{first}/100/2,0)",
+            12: f"IF(J{first}=$X$22,F{first}*E{first}/100/2,0)",
+            13: f"IF(J{first}&lt;&gt;$X$22,F{first}*E{first}/100,0)",
+            14: f"K{first}+L{first}+M{first}+F{first}",
+            15: f"(K{first}+L{first}+M{first})/F{first}",
+        }
+        columns = []
+        for col, texts in zip(range(11, 16), results):
+            letter = letters[col - 1]
+            si = self._next_shared_index
+            self._next_shared_index += 1
+            child = f'<f t="shared" si="{si}"/>'
+            cells = [
+                f'<c r="{letter}{r}"{style[col]}>{child}<v>{v}</v></c>' if v else f'<c r="{letter}{r}"{style[col]}>{child}</c>'
+                for r, v in zip(row_numbers, texts)
+            ]
+            master = f'<f t="shared" ref="{letter}{first}:{letter}{last}" si="{si}">{masters[col]}</f>'
+            cells[0] = cells[0].replace(child, master, 1)
+            columns.append(cells)
+        return columns
+
+    def getvalue(self):
+        """Assembles the .xlsx from the template parts and the rows written so far."""
+        tpl = self.template
+        last_data_row = self.next_row - 1
+
+        # Template rows below the new data keep only their cells right of column O
+        trailing = "".join(
+            f"<row{attrs}>{kept_cells}</row>"
+            for row_number, (attrs, kept_cells) in sorted(tpl.kept_rows.items())
+            if row_number > last_data_row
+        )
+        last_row = max([last_data_row, COMBO_START_ROW - 1] + list(tpl.kept_rows))
+        dimension = f"A1:{column_letter(tpl.max_col)}{last_row}"
+        head = re.sub(r'<dimension ref="[^"]*"', f'<dimension ref="{dimension}"', tpl.head, count=1)
+        # A header auto-filter (starting above the data) is stretched to the last data row
+        tail = re.sub(
+            r'(<autoFilter ref="[A-Z]+[0-9]+:[A-Z]+)([0-9]+)"',
+            lambda m: f'{m.group(1)}{max(int(m.group(2)), last_row)}"',
+            tpl.tail, count=1,
+        )
+
+        output = io.BytesIO()
+        with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED, compresslevel=COMBO_DEFLATE_LEVEL) as zout:
+            for info, data in tpl.parts:
+                zout.writestr(info, data)
+            with zout.open(tpl.raw_path, "w", force_zip64=True) as f:
+                f.write(head.encode("utf-8"))
+                f.write("".join(tpl.header_rows).encode("utf-8"))
+                self._rows.seek(0)
+                shutil.copyfileobj(self._rows, f, 1024 * 1024)
+                f.write(trailing.encode("utf-8"))
+                f.write(tail.encode("utf-8"))
+        self._rows.close()
+        return output.getvalue()
+
+
+def _number_texts(values):
+    """Shortest round-trip text of each number; '' for missing or non-finite values."""
+    arr = pd.Series(values).to_numpy(dtype=np.float64, na_value=np.nan)
+    texts = pd.Series(arr).astype(str).tolist()
+    return [text if ok else "" for text, ok in zip(texts, np.isfinite(arr).tolist())]
+
+def _with_text_cell(kept_rows, ref, text):
+    """Returns a copy of kept_rows with cell `ref` (right of column O) replaced by a text value."""
+    col_letters, row_number = _CELL_REF.fullmatch(ref).groups()
+    row_number = int(row_number)
+    attrs, cells = kept_rows.get(row_number, (f' r="{row_number}"', ""))
+
+    style = ""
+    remaining = []
+    col = _column_index(col_letters)
+    for cell in _CELL_RE.finditer(cells):
+        cell_col = _column_index(_ATTR_R_RE.search(cell.group(1)).group(1))
+        if cell_col == col:
+            found = _ATTR_S_RE.search(cell.group(1))
+            style = f' s="{found.group(1)}"' if found else ""
+            continue
+        remaining.append((cell_col, cell.group(0)))
+    remaining.append((col, f'<c r="{ref}"{style} t="inlineStr"><is><t>{_xml_text(text)}</t></is></c>'))
+    remaining.sort(key=lambda item: item[0])
+
+    updated = dict(kept_rows)
+    updated[row_number] = (attrs, "".join(cell for _, cell in remaining))
+    return updated
+
+def generate_combo_excel(df_merged, template, formula_mode=DEFAULT_COMBO_FORMULA_MODE,
+                         df_taxed=None, supplier_state=None):
+    """Fills the raw data into the Excel template and returns the bytes."""
+    writer = ComboWorkbookWriter(template, formula_mode=formula_mode, supplier_state=supplier_state)
+    writer.append(df_merged, df_taxed)
+    return writer.getvalue()
+
+
+# ============================================================
+#  SALES HEADER PROBE (C2 / P2 / O2)
+# ============================================================
+_SHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_DOC_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_PKG_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+_CELL_REF = re.compile(r"([A-Z]+)([0-9]+)")
+
+def _sheet_path(z, sheet_name=None):
+    """Resolves the part name of a sheet by name, or of the active sheet (first if none is marked)."""
+    workbook = ET.fromstring(z.read("xl/workbook.xml"))
+    sheets = workbook.findall(f"{_SHEET_NS}sheets/{_SHEET_NS}sheet")
+    if sheet_name is None:
+        view = workbook.find(f"{_SHEET_NS}bookViews/{_SHEET_NS}workbookView")
+        active = int(view.get("activeTab", 0)) if view is not None else 0
+        sheet = sheets[active] if active < len(sheets) else sheets[0]
+    else:
+        matches = [sheet for sheet in sheets if sheet.get("name") == sheet_name]
+        if not matches:
+            raise KeyError(f"Worksheet {sheet_name!r} does not exist")
+        sheet = matches[0]
+    rel_id = sheet.get(f"{_DOC_REL_NS}id")
+
+    rels = ET.fromstring(z.read("xl/_rels/workbook.xml.rels"))
+    for rel in rels.iter(f"{_PKG_REL_NS}Relationship"):
+        if rel.get("Id") == rel_id:
+            target = rel.get("Target")
+            if target.startswith("/"):
+                return target.lstrip("/")
+            return posixpath.normpath(posixpath.join("xl", target))
+    raise KeyError(f"Sheet relationship {rel_id} not found")
+
+def _shared_strings(z, wanted_indexes):
+    """Reads shared strings only up to the highest index needed."""
+    if not wanted_indexes or "xl/sharedStrings.xml" not in z.namelist():
+        return {}
+    last = max(wanted_indexes)
+    found = {}
+    index = 0
+    with z.open("xl/sharedStrings.xml") as f:
+        for _, elem in ET.iterparse(f):
+            if elem.tag != f"{_SHEET_NS}si":
+                continue
+            if index in wanted_indexes:
+                # Plain text, or rich text runs concatenated (phonetic hints are skipped)
+                plain = elem.find(f"{_SHEET_NS}t")
+                runs = elem.findall(f"{_SHEET_NS}r/{_SHEET_NS}t")
+                found[index] = (plain.text or "") if plain is not None else "".join(t.text or "" for t in runs)
+            elem.clear()
+            if index >= last:
+                break
+            index += 1
+    return found
+
+def _cell_value(cell_type, raw, strings):
+    """Converts a raw <c> value the way openpyxl does (numbers without '.'/'E' become int)."""
+    if raw is None:
+        return None
+    if cell_type == "s":
+        return strings.get(int(raw))
+    if cell_type in ("inlineStr", "str", "e"):
+        return raw
+    if cell_type == "b":
+        return bool(int(raw))
+    if "." in raw or "E" in raw or "e" in raw:
+        return float(raw)
+    return int(raw)
+
+def probe_header_cells(file_data, cell_refs=tuple(HEADER_CELLS.values())):
+    """
+    Reads a few cells from the top of the active sheet without loading the workbook.
+    Only the sheet XML up to the last requested row (and the shared strings up to the
+    highest index used) is parsed, so the cost does not grow with the number of rows.
+    Cell styles are not applied (a date-formatted number is returned as a number).
+    """
+    wanted = {ref: _CELL_REF.fullmatch(ref).groups() for ref in cell_refs}
+    wanted = {ref: (_column_index(col), int(row)) for ref, (col, row) in wanted.items()}
+    wanted_keys = set(wanted.values())
+    last_row = max(row for _, row in wanted_keys)
+    raw_cells = {}
+
+    with zipfile.ZipFile(file_data) as z:
+        with z.open(_sheet_path(z)) as f:
+            row_number = 0
+            col_number = 0
+            for event, elem in ET.iterparse(f, events=("start", "end")):
+                if event == "start":
+                    if elem.tag == f"{_SHEET_NS}row":
+                        row_number = int(elem.get("r", row_number + 1))
+                        col_number = 0
+                        if row_number > last_row:
+                            break
+                    continue
+
+                if elem.tag == f"{_SHEET_NS}c":
+                    ref = elem.get("r")
+                    col_number = _column_index(_CELL_REF.fullmatch(ref).group(1)) if ref else col_number + 1
+                    key = (col_number, row_number)
+                    if key in wanted_keys:
+                        cell_type = elem.get("t", "n")
+                        if cell_type == "inlineStr":
+                            raw = "".join(t.text or "" for t in elem.iter(f"{_SHEET_NS}t"))
+                        else:
+                            v = elem.find(f"{_SHEET_NS}v")
+                            raw = v.text if v is not None else None
+                        raw_cells[key] = (cell_type, raw)
+                elif elem.tag == f"{_SHEET_NS}row":
+                    elem.clear()
+
+        shared_indexes = {int(raw) for cell_type, raw in raw_cells.values() if cell_type == "s" and raw is not None}
+        strings = _shared_strings(z, shared_indexes)
+
+    values = {}
+    for ref, key in wanted.items():
+        cell_type, raw = raw_cells.get(key, ("n", None))
+        values[ref] = _cell_value(cell_type, raw, strings)
+    return values
+
+def validate_reporting_header(gstin_value, month_value, year_value):
+    """
+    Validates the Sales header values and returns (gstin, month_str, year_str).
+    Raises ValueError with a user-facing message when something is missing or malformed.
+    """
+    dynamic_gstin = str(gstin_value).strip().upper() if gstin_value is not None else None
+    if not (dynamic_gstin and len(dynamic_gstin) == 15 and GSTIN_PATTERN.fullmatch(dynamic_gstin)):
+        raise ValueError("GSTIN in C2 is invalid or missing.")
+    if not (month_value and year_value):
+        raise ValueError("Reporting Month (P2) or Year (O2) is missing.")
+
+    month_str = str(month_value).strip().zfill(2)
+    year_str = str(year_value).strip()
+    if len(year_str) == 2:
+        year_str = '20' + year_str
+    if not (month_str.isdigit() and 1 <= int(month_str) <= 12):
+        raise ValueError(f"Reporting Month (P2) '{month_value}' is not a month number (1-12).")
+    if not (year_str.isdigit() and len(year_str) == 4):
+        raise ValueError(f"Reporting Year (O2) '{year_value}' is not a valid year.")
+    return dynamic_gstin, month_str, year_str
+
+
+# ============================================================
+#  STREAMING (CHUNKED) INGESTION
+# ============================================================
+
+def _convert_cell(cell):
+    """Converts an openpyxl cell the same way pd.read_excel does (blank → '', whole floats → int)."""
+    value = cell.value
+    if value is None:
+        return ""
+    if cell.data_type == "e":
+        return np.nan
+    if cell.data_type == "n":
+        int_value = int(value)
+        return int_value if int_value == value else float(value)
+    return value
+
+def iter_excel_chunks(file_data, chunk_rows=STREAM_CHUNK_ROWS):
+    """
+    Reads the first sheet in read-only mode and yields DataFrames of at most
+    `chunk_rows` rows. Cells are converted and typed exactly as pd.read_excel would,
+    so only one chunk of rows is held in memory at a time.
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(file_data, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        ws.reset_dimensions()
+
+        header = None
+        rows = []
+        pending_blank = [] # blank rows are kept only if data follows them (pandas trims trailing ones)
+        for cells in ws.iter_rows():
+            row = [_convert_cell(cell) for cell in cells]
+            while row and row[-1] == "":
+                row.pop()
+
+            if header is None:
+                header = row
+                continue
+            if not row:
+                pending_blank.append(row)
+                continue
+
+            rows.extend(pending_blank)
+            pending_blank = []
+            rows.append(row)
+            if len(rows) >= chunk_rows:
+                yield _rows_to_frame(header, rows)
+                rows = []
+
+        if rows or header is None:
+            yield _rows_to_frame(header or [], rows)
+    finally:
+        wb.close()
+
+def _rows_to_frame(header, rows):
+    """Parses one block of converted rows with the same TextParser settings as pd.read_excel."""
+    width = len(header)
+    data = [header] + [row + [""] * (width - len(row)) for row in rows]
+    if not header:
+        return pd.DataFrame()
+    return TextParser(data, header=0, skip_blank_lines=False).read()
+
+def iter_csv_chunks(file_data, chunk_rows=STREAM_CHUNK_ROWS):
+    """CSV counterpart of iter_excel_chunks (the C engine: the Arrow one cannot read in chunks)."""
+    with pd.read_csv(file_data, **_csv_options(engine="c", chunksize=chunk_rows)) as reader:
+        yield from reader
+
+def iter_processed_chunks(file_data, data_type, chunk_rows=STREAM_CHUNK_ROWS):
+    """Streaming counterpart of process_file: yields renamed, sign-adjusted chunks."""
+    reader = iter_csv_chunks if detect_format(file_data) == "csv" else iter_excel_chunks
+    for chunk in reader(file_data, chunk_rows):
+        yield normalise_frame(chunk, data_type)
+
+
+# ============================================================
+#  SUMMARY GENERATION FUNCTIONS
+# ============================================================
+
+# Integer columns (the paise amounts) are summed with float64 bincount while every partial sum is exact
+_BINCOUNT_EXACT_LIMIT = 2.0 ** 52
+
+def _add_int_sums(int_sums, slots, arr):
+    """Adds the int64 values arr into int_sums[slots], exactly."""
+    if np.abs(arr).sum(dtype=np.float64) < _BINCOUNT_EXACT_LIMIT:
+        int_sums += np.bincount(slots, weights=arr, minlength=len(int_sums)).astype(np.int64)
+    else:
+        np.add.at(int_sums, slots, arr)
+
+
+class GroupSumAccumulator:
+    """
+    Running per-group sums that can be fed a whole frame or one chunk at a time.
+
+    Integer columns (the paise amounts, QTY) and whole-number floats are summed in int64,
+    so the totals do not depend on row order or on how the rows were split into chunks.
+    Fractional or infinite floats, which the paise engine never produces, go to a plain
+    float64 sum per group. Missing values are skipped, as in DataFrame.groupby(...).sum().
+    Rows with a missing key are dropped, unless dropna=False keeps them as their own
+    groups (see rollup()).
+    """
+
+    def __init__(self, keys, sum_cols, dropna=True):
+        self.keys = list(keys)
+        self.sum_cols = list(sum_cols)
+        self.dropna = dropna
+        self._slots = {}       # key tuple -> group slot
+        self._key_frames = []  # keys in slot order (first occurrence per chunk)
+        self._int_sums = {col: np.zeros(0, dtype=np.int64) for col in self.sum_cols}
+        self._float_sums = {col: np.zeros(0) for col in self.sum_cols}  # fractional / infinite floats
+        self._is_float = dict.fromkeys(self.sum_cols, False)
+
+    def update(self, df):
+        key_df = df[self.keys]
+        if self.dropna:
+            has_key = key_df.notna().all(axis=1).to_numpy()
+            if not has_key.all():
+                df = df[has_key]
+                key_df = key_df[has_key]
+        if len(df) == 0:
+            return
+
+        # Factorise the chunk's keys locally, then translate them to global slots
+        local_codes = key_df.groupby(self.keys, sort=False, dropna=self.dropna).ngroup().to_numpy()
+        uniques = key_df.drop_duplicates()
+        local_to_slot = np.empty(len(uniques), dtype=np.intp)
+        new_positions = []
+        for pos, key in enumerate(uniques.itertuples(index=False, name=None)):
+            key = tuple(None if pd.isna(part) else part for part in key)  # NaN != NaN as a dict key
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._slots[key] = len(self._slots)
+                new_positions.append(pos)
+            local_to_slot[pos] = slot
+        if new_positions:
+            self._key_frames.append(uniques.iloc[new_positions])
+        slots = local_to_slot[local_codes]
+        num_slots = len(self._slots)
+
+        for col in self.sum_cols:
+            self._grow(col, num_slots)
+            int_sums = self._int_sums[col]
+
+            values = df[col]
+            if values.dtype == object:
+                values = pd.to_numeric(values, errors="coerce")
+            if values.dtype.kind in "iub":
+                _add_int_sums(int_sums, slots, values.to_numpy(dtype=np.int64))
+                continue
+
+            self._is_float[col] = True
+            arr = values.to_numpy(dtype=np.float64, na_value=np.nan)
+            present = ~np.isnan(arr)
+            arr, float_slots = arr[present], slots[present]
+            whole = (arr == np.trunc(arr)) & (np.abs(arr) < _BINCOUNT_EXACT_LIMIT)  # False for inf
+            if not whole.all():
+                self._float_sums[col] += np.bincount(float_slots[~whole], weights=arr[~whole], minlength=num_slots)
+                arr, float_slots = arr[whole], float_slots[whole]
+            _add_int_sums(int_sums, float_slots, arr.astype(np.int64))
+
+    def merge(self, other):
+        """
+        Adds the group sums of another accumulator over the same keys and columns (e.g. of
+        another period): the result equals feeding both sets of rows to one.
+        """
+        if other.keys != self.keys or other.sum_cols != self.sum_cols:
+            raise ValueError("can only merge accumulators with the same keys and sum columns")
+        other_keys = other._key_frame()
+        if len(other_keys) == 0:
+            return
+
+        other_to_slot = np.empty(len(other_keys), dtype=np.intp)
+        new_positions = []
+        for pos, key in enumerate(other_keys.itertuples(index=False, name=None)):
+            key = tuple(None if pd.isna(part) else part for part in key)
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._slots[key] = len(self._slots)
+                new_positions.append(pos)
+            other_to_slot[pos] = slot
+        if new_positions:
+            self._key_frames.append(other_keys.iloc[new_positions])
+        num_slots = len(self._slots)
+
+        for col in self.sum_cols:
+            self._grow(col, num_slots)
+            target = other_to_slot[:len(other._int_sums[col])]  # slots are unique: plain fancy adds
+            self._int_sums[col][target] += other._int_sums[col]
+            self._float_sums[col][target] += other._float_sums[col]
+            self._is_float[col] = self._is_float[col] or other._is_float[col]
+
+    def _grow(self, col, num_slots):
+        """Extends the per-slot sums of col to num_slots slots."""
+        grow = num_slots - len(self._int_sums[col])
+        if grow > 0:
+            self._int_sums[col] = np.concatenate([self._int_sums[col], np.zeros(grow, dtype=np.int64)])
+            self._float_sums[col] = np.concatenate([self._float_sums[col], np.zeros(grow)])
+
+    def _key_frame(self):
+        if self._key_frames:
+            return pd.concat(self._key_frames, ignore_index=True)
+        return pd.DataFrame(columns=self.keys)
+
+    def _column_result(self, col, groups, num_groups):
+        """Sums of `col` per output group; groups[slot] is the slot's group (-1: dropped)."""
+        keep = groups >= 0
+        target = groups[keep]
+        int_sums = np.zeros(num_groups, dtype=np.int64)
+        np.add.at(int_sums, target, self._int_sums[col][:len(groups)][keep])
+        if not self._is_float[col]:
+            return int_sums
+
+        float_sums = np.zeros(num_groups)
+        np.add.at(float_sums, target, self._float_sums[col][:len(groups)][keep])
+        return int_sums + float_sums
+
+    def rollup(self, keys, sum_cols=None):
+        """
+        Group sums over a subset of the keys, sorted like groupby(keys, sort=True).sum().
+        Rolled up from the exact per-group sums, so the result matches grouping the rows
+        directly; groups with a missing value in `keys` are dropped.
+        """
+        keys = list(keys)
+        sum_cols = self.sum_cols if sum_cols is None else list(sum_cols)
+        key_frame = self._key_frame()
+        if len(key_frame) == 0:
+            return pd.DataFrame(columns=keys + sum_cols)
+
+        groups = key_frame[keys].groupby(keys, sort=False).ngroup()  # NaN where a key is missing
+        groups = groups.fillna(-1).to_numpy(dtype=np.intp)
+        result = key_frame.loc[groups >= 0, keys].drop_duplicates().reset_index(drop=True)
+        for col in sum_cols:
+            result[col] = self._column_result(col, groups, len(result))
+        return result.sort_values(keys, kind="mergesort", ignore_index=True)
+
+    def to_frame(self):
+        """Returns the group keys and their sums, sorted by key like groupby(sort=True)."""
+        return self.rollup(self.keys)
+
+    def state(self):
+        """
+        The running sums as plain JSON-serialisable data,
+        for resuming later with from_state(); cost grows with the groups, not the rows.
+        """
+        key_rows = [
+            [_plain_value(part) for part in key]
+            for key in self._key_frame().itertuples(index=False, name=None)
+        ]
+        return {
+            "keys": self.keys,
+            "sum_cols": self.sum_cols,
+            "dropna": self.dropna,
+            "key_rows": key_rows,
+            "int_sums": {col: sums.tolist() for col, sums in self._int_sums.items()},
+            "float_sums": {col: sums.tolist() for col, sums in self._float_sums.items()},
+            "is_float": self._is_float,
+        }
+
+    @classmethod
+    def from_state(cls, state, key_dtypes=None):
+        """Rebuilds an accumulator from state(); key_dtypes restores key column dtypes (e.g. categoricals)."""
+        acc = cls(state["keys"], state["sum_cols"], dropna=state["dropna"])
+        key_frame = pd.DataFrame(state["key_rows"], columns=acc.keys)
+        if len(key_frame) == 0:
+            return acc
+        for col, dtype in (key_dtypes or {}).items():
+            key_frame[col] = key_frame[col].astype(dtype)
+
+        acc._key_frames = [key_frame]
+        acc._slots = {
+            tuple(None if pd.isna(part) else part for part in key): slot
+            for slot, key in enumerate(key_frame.itertuples(index=False, name=None))
+        }
+        acc._int_sums = {col: np.array(sums, dtype=np.int64) for col, sums in state["int_sums"].items()}
+        acc._float_sums = {col: np.array(sums, dtype=np.float64) for col, sums in state["float_sums"].items()}
+        acc._is_float = dict(state["is_float"])
+        return acc
+
+def _plain_value(value):
+    """numpy scalar -> Python scalar, missing -> None (for JSON)."""
+    if value is None or pd.isna(value):
+        return None
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _paise_columns(sum_cols):
+    return [PAISE_COLUMNS.get(col, col) for col in sum_cols]
+
+
+class GSTAggregationCube:
+    """
+    One pass over the taxed rows into (POS × HSN × rate) group sums; the B2CS
+    (POS × rate) and HSN (HSN × rate) summaries are roll-ups of that cube.
+    """
+
+    def __init__(self):
+        self.cube = GroupSumAccumulator(CUBE_GROUP_KEYS, _paise_columns(CUBE_SUM_COLS), dropna=False)
+
+    def update(self, df_taxed):
+        self.cube.update(df_taxed)
+
+    def merge(self, other):
+        """Adds another cube's sums (e.g. the months of a quarter)."""
+        self.cube.merge(other.cube)
+
+    def _summary(self, keys, sum_cols):
+        """Roll-up over keys with the amount columns back in rupees (exact paise / 100)."""
+        summary = self.cube.rollup(keys, _paise_columns(sum_cols))
+        for col in sum_cols:
+            if col in PAISE_COLUMNS:
+                summary[col] = summary.pop(PAISE_COLUMNS[col]) / 100
+        return summary[keys + sum_cols]
+
+    def result(self):
+        """Returns (b2cs_summary, hsn_summary) for the summary and JSON generators."""
+        return (
+            self._summary(B2CS_GROUP_KEYS, B2CS_SUM_COLS),
+            self._summary(HSN_GROUP_KEYS, HSN_SUM_COLS),
+        )
+
+    def state(self):
+        return self.cube.state()
+
+    @classmethod
+    def from_state(cls, state):
+        """Resumes a cube saved with state() (e.g. between incremental deliveries)."""
+        cube = cls()
+        cube.cube = GroupSumAccumulator.from_state(state, key_dtypes={"J_mapped": POS_DTYPE})
+        return cube
+
+
+def summarise_taxed(df_merged_taxed):
+    """Builds (b2cs_summary, hsn_summary) from a fully materialised taxed frame."""
+    summaries = GSTAggregationCube()
+    summaries.update(df_merged_taxed)
+    return summaries.result()
+
+def summary_reports(cube, gstin, fp, json_style=DEFAULT_GSTR1_JSON_STYLE):
+    """The B2CS CSV, HSN CSV and GSTR-1 JSON of a GSTAggregationCube, keyed like generate_reports."""
+    b2cs_summary, hsn_summary = cube.result()
+    return {
+        "b2cs_result": generate_b2cs_csv(b2cs_summary),
+        "hsn_result": generate_hsn_summary(hsn_summary),
+        "json_result": generate_gstr1_json(b2cs_summary, hsn_summary, gstin, fp, gstin[:2], style=json_style),
+    }
+
+
+def generate_b2cs_csv(b2cs_summary):
+    """Generates the GSTR-1 B2CS (Table 7) summary in CSV format."""
+    
+    summary_df = b2cs_summary[B2CS_GROUP_KEYS + ['tcs_taxable_amount']].rename(
+        columns={'tcs_taxable_amount': 'Taxable_Value'}
+    )
+
+    summary_df['Type'] = 'OE'
+    summary_df['Place Of Supply'] = summary_df['J_mapped']
+    summary_df['Rate'] = summary_df['gst_rate']
+    summary_df['Applicable % of Tax Rate'] = ''
+    summary_df['Cess Amount'] = 0.0
+    summary_df['E-Commerce GSTIN'] = ''
+    
+    final_b2cs_df = summary_df[[
+        'Type', 'Place Of Supply', 'Rate', 'Applicable % of Tax Rate',
+        'Taxable_Value', 'Cess Amount', 'E-Commerce GSTIN'
+    ]].rename(columns={'Taxable_Value': 'Taxable Value'})
+    
+    csv_output = final_b2cs_df.to_csv(index=False).encode('utf-8')
+    return csv_output
+
+def generate_hsn_summary(hsn_summary):
+    """Generates the GSTR-1 HSN Summary (Table 12) in CSV format."""
+
+    summary_df = hsn_summary.rename(columns={
+        'QTY': 'Total_Quantity',
+        'Total Value': 'Total_Value',
+        'tcs_taxable_amount': 'Total_Taxable_Value',
+        'IGST': 'Integrated_Tax_Amount',
+        'CGST': 'Central_Tax_Amount',
+        'SGST': 'State_UT_Tax_Amount'
+    })
+
+    summary_df['Description'] = ''
+    summary_df['UQC'] = 'NOS-NUMBERS'
+    summary_df['Cess Amount'] = 0.0
+
+    final_hsn_df = summary_df[[
+        'hsn_code', 'Description', 'UQC', 'Total_Quantity',
+        'Total_Value', 'Total_Taxable_Value', 'Integrated_Tax_Amount',
+        'Central_Tax_Amount', 'State_UT_Tax_Amount', 'Cess Amount', 'gst_rate'
+    ]].rename(columns={
+        'hsn_code': 'HSN',
+        'Total_Quantity': 'Total Quantity',
+        'Total_Value': 'Total Value',
+        'Total_Taxable_Value': 'Taxable Value',
+        'Integrated_Tax_Amount': 'Integrated Tax Amount',
+        'Central_Tax_Amount': 'Central Tax Amount',
+        'State_UT_Tax_Amount': 'State/UT Tax Amount',
+        'gst_rate': 'Rate'
+    })
+    
+    # Convert to CSV
+    csv_output = final_hsn_df.to_csv(index=False).encode('utf-8')
+    return csv_output
+
+
+def _round_column(values, ndigits):
+    """
+    round(v, ndigits) for every value, as plain Python numbers. The summaries hold numpy
+    scalars, whose round() is np.round, so numeric arrays are rounded in one call.
+    """
+    if values.dtype.kind in "iuf":
+        return np.round(values, ndigits).tolist()
+    return [round(v, ndigits) for v in values.tolist()]
+
+def generate_gstr1_json(b2cs_summary, hsn_summary, dynamic_gstin, dynamic_fp, supplier_state_code_numeric,
+                        style=DEFAULT_GSTR1_JSON_STYLE, out=None):
+    """
+    Generates the GSTR-1 JSON file structure (Table 7 B2CS and Table 12 HSN)
+    using the strict schema required by the GST portal (based on user feedback).
+    style is one of GSTR1_JSON_STYLES. The records are written to the binary stream
+    `out` as they are built (see write_gstr1_json); without one, the bytes are returned.
+    """
+    
+    # --- 1. B2CS JSON Structure (Table 7) - FLATTENED ---
+    # One summary row per POS and Rate
+    txval = b2cs_summary['tcs_taxable_amount'].to_numpy(dtype=np.float64)
+
+    # Skip groups whose Taxable Value nets to zero (amounts are whole paise, so exactly 0)
+    keep = txval != 0
+    b2cs_rows = b2cs_summary[keep]
+    pos_codes = b2cs_rows['J_mapped'].str[:2] # State Code from 'XX-State Name'
+
+    # Determine Supply Type (sply_ty): INTRA if POS is same as Supplier State Code, else INTER
+    supply_types = np.where(pos_codes == supplier_state_code_numeric, "INTRA", "INTER")
+
+    # Build the B2CS transaction objects (FLAT STRUCTURE REQUIRED BY PORTAL)
+    b2cs_json_list = (
+        {
+            "sply_ty": supply_type,
+            "rt": rate,
+            "typ": "OE", # Other than E-Commerce
+            "pos": pos_code_only,
+            "txval": group_txval,
+            "iamt": group_iamt,
+            "camt": group_camt,
+            "samt": group_samt,
+            "csamt": 0.0
+        }
+        for supply_type, rate, pos_code_only, group_txval, group_iamt, group_camt, group_samt in zip(
+            supply_types.tolist(),
+            b2cs_rows['gst_rate'].to_numpy().astype(np.int64).tolist(),
+            pos_codes.tolist(),
+            txval[keep].tolist(), # amounts are whole paise already (see PAISE_COLUMNS)
+            b2cs_rows['IGST'].to_numpy(dtype=np.float64).tolist(),
+            b2cs_rows['CGST'].to_numpy(dtype=np.float64).tolist(),
+            b2cs_rows['SGST'].to_numpy(dtype=np.float64).tolist(),
+        )
+    )
+
+
+    # --- 2. HSN Summary JSON Structure (Table 12) ---
+    hsn_grouped = hsn_summary.rename(columns={
+        'QTY': 'qty',
+        'tcs_taxable_amount': 'txval',
+        'IGST': 'iamt',
+        'CGST': 'camt',
+        'SGST': 'samt'
+    })[['hsn_code', 'gst_rate', 'qty', 'txval', 'iamt', 'camt', 'samt']]
+
+    # Row-wise values share one dtype (qty becomes float next to the float amounts)
+    hsn_values = hsn_grouped.to_numpy()
+    hsn_codes = pd.Series(hsn_values[:, 0], dtype=hsn_values.dtype)
+    rates = hsn_values[:, 1]
+
+    # Ensure HSN and Rate are valid before adding
+    keep = (hsn_codes.notna() & (hsn_codes.astype(str).str.strip() != "")).to_numpy() & (rates > 0)
+    hsn_values = hsn_values[keep]
+
+    hsn_data_list = (
+        {
+            "num": num_counter,
+            "hsn_sc": hsn_sc,
+            "desc": "", 
+            "uqc": "NOS-NUMBERS", # Changed from 'NOS-NUMBERS' to 'NOS' to match working sample
+            "qty": qty,
+            # Removed 'val' (Total Value) as per working sample
+            "txval": group_txval,
+            "iamt": group_iamt,
+            "camt": group_camt,
+            "samt": group_samt,
+            "csamt": 0.0,
+            "rt": rate,
+        }
+        for num_counter, hsn_sc, qty, group_txval, group_iamt, group_camt, group_samt, rate in zip(
+            range(1, len(hsn_values) + 1),
+            hsn_values[:, 0].astype(np.int64).astype(str).tolist(),
+            _round_column(hsn_values[:, 2], 3),
+            hsn_values[:, 3].astype(np.float64).tolist(),
+            hsn_values[:, 4].astype(np.float64).tolist(),
+            hsn_values[:, 5].astype(np.float64).tolist(),
+            hsn_values[:, 6].astype(np.float64).tolist(),
+            hsn_values[:, 1].astype(np.int64).tolist(),
+        )
+    )
+
+    # --- 3. Combine into Final GSTR-1 JSON Structure ---
+    # Written record by record: neither the whole structure nor a second copy of the text is built
+    buffer = io.BytesIO() if out is None else None
+    write_gstr1_json(
+        out if out is not None else buffer, dynamic_gstin, dynamic_fp, b2cs_json_list, hsn_data_list, style=style
+    )
+    return None if out is not None else buffer.getvalue()
+
+
+_COMPACT_JSON_ENCODER = json.JSONEncoder(separators=(",", ":"))
+
+def _json_records(records, style, depth):
+    """
+    JSON text of a batch of flat records (scalar values), as items of an array at
+    nesting level `depth`. "pretty" reproduces json.dumps(indent=4) with the C encoder:
+    the indentation goes into the item separator of a flat record.
+    """
+    if style == "compact":
+        if orjson is not None:
+            text = orjson.dumps(records)
+            if b"null" not in text: # orjson writes NaN as null; the stdlib keeps NaN
+                return text[1:-1]
+        return _COMPACT_JSON_ENCODER.encode(records)[1:-1].encode("utf-8")
+
+    pad = "\n" + "    " * (depth + 1)
+    encoder = json.JSONEncoder(separators=("," + pad, ": "))
+    close = "\n" + "    " * depth + "}"
+    item_sep = ",\n" + "    " * depth
+    return item_sep.join("{" + pad + encoder.encode(record)[1:-1] + close for record in records).encode("utf-8")
+
+def _write_json_array(out, records, style, depth):
+    """Writes a JSON array of flat records, GSTR1_JSON_WRITE_RECORDS at a time."""
+    item_sep = b"," if style == "compact" else (",\n" + "    " * depth).encode()
+    opening = b"[" if style == "compact" else ("[\n" + "    " * depth).encode()
+    closing = b"]" if style == "compact" else ("\n" + "    " * (depth - 1) + "]").encode()
+
+    written = False
+    records = iter(records)
+    while True:
+        batch = list(itertools.islice(records, GSTR1_JSON_WRITE_RECORDS))
+        if not batch:
+            break
+        out.write(item_sep if written else opening)
+        out.write(_json_records(batch, style, depth))
+        written = True
+    out.write(closing if written else b"[]")
+
+def write_gstr1_json(out, gstin, fp, b2cs_records, hsn_records, style=DEFAULT_GSTR1_JSON_STYLE):
+    """
+    Streams the GSTR-1 document to the binary stream `out`, one batch of records at a
+    time (the records may be a generator). "pretty" output is byte-for-byte what
+    json.dumps(document, indent=4) gives; "compact" has no whitespace.
+    """
+    if style not in GSTR1_JSON_STYLES:
+        raise ValueError(f"style must be one of {GSTR1_JSON_STYLES}, not {style!r}")
+    header = {
+        "gstin": gstin,
+        "fp": fp,
+        "version": "GST3.2.3", # Mandatory field added
+        "hash": "hash", # Mandatory field added (placeholder)
+        # Removed 'gt' and 'cur_gt' to match working sample
+    }
+    if style == "compact":
+        out.write(_COMPACT_JSON_ENCODER.encode(header)[:-1].encode("utf-8") + b',"b2cs":')
+        _write_json_array(out, b2cs_records, style, 2)
+        out.write(b',"hsn":{"hsn_b2c":') # Key changed from 'data' to 'hsn_b2c'
+        _write_json_array(out, hsn_records, style, 3)
+        out.write(b"}}")
+        return
+
+    out.write(json.dumps(header, indent=4)[:-2].encode("utf-8") + b',\n    "b2cs": ')
+    _write_json_array(out, b2cs_records, style, 2)
+    out.write(b',\n    "hsn": {\n        "hsn_b2c": ')
+    _write_json_array(out, hsn_records, style, 3)
+    out.write(b"\n    }\n}")
+
+
+# ============================================================
+#  ZIP INGESTION
+# ============================================================
+def open_upload(zip_file):
+    """
+    Returns a seekable binary file over the upload, rewound. Seekable inputs (an open
+    file, Streamlit's in-memory upload) are used as they are; anything else is
+    spooled once into a SpooledTemporaryFile.
+    """
+    if zip_file.seekable():
+        zip_file.seek(0)
+        return zip_file
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+    shutil.copyfileobj(zip_file, spool, COPY_CHUNK_BYTES)
+    spool.seek(0)
+    return spool
+
+def content_digest(data_file):
+    """SHA-256 of a seekable file's content, read in chunks (in place for BytesIO); leaves it rewound."""
+    if isinstance(data_file, io.BytesIO):
+        with data_file.getbuffer() as view:
+            return hashlib.sha256(view).hexdigest()
+    digest = hashlib.sha256()
+    data_file.seek(0)
+    for block in iter(lambda: data_file.read(COPY_CHUNK_BYTES), b""):
+        digest.update(block)
+    data_file.seek(0)
+    return digest.hexdigest()
+
+def _check_ratio(size, compressed_size, what):
+    if size > SPOOL_MEMORY_BYTES and size > MAX_COMPRESSION_RATIO * max(compressed_size, 1):
+        raise ReportError(f"{what} is compressed more than {MAX_COMPRESSION_RATIO}:1; refusing to unpack it.")
+
+def extract_member(z, info, path):
+    """
+    Decompresses one ZIP member to `path` after checking the size limits. Parsers
+    (and parse workers) open the file themselves, so the member never exists as
+    one bytes object.
+    """
+    if info.file_size > MAX_MEMBER_BYTES:
+        raise ReportError(
+            f"'{info.filename}' unpacks to {info.file_size / 1024 ** 2:,.0f} MiB, "
+            f"above the {MAX_MEMBER_BYTES / 1024 ** 2:,.0f} MiB limit."
+        )
+    _check_ratio(info.file_size, info.compress_size, f"'{info.filename}'")
+
+    with z.open(info) as src, open(path, "wb") as dst:
+        shutil.copyfileobj(src, dst, COPY_CHUNK_BYTES)
+    _check_workbook_parts(path, info.filename)
+    return path
+
+def _check_workbook_parts(path, name):
+    """Applies the size limits to the parts of an .xlsx before openpyxl/pandas inflate them."""
+    try:
+        with zipfile.ZipFile(path) as workbook:
+            parts = workbook.infolist()
+    except zipfile.BadZipFile:
+        return # not an .xlsx container (e.g. legacy .xls); the parsers report what is wrong
+
+    total = sum(part.file_size for part in parts)
+    if total > MAX_WORKBOOK_XML_BYTES:
+        raise ReportError(
+            f"'{name}' unpacks to {total / 1024 ** 2:,.0f} MiB of sheet data, "
+            f"above the {MAX_WORKBOOK_XML_BYTES / 1024 ** 2:,.0f} MiB limit."
+        )
+    for part in parts:
+        _check_ratio(part.file_size, part.compress_size, f"'{name}' ({part.filename})")
+
+
+# ============================================================
+#  RESULT CACHE
+# ============================================================
+_RESULT_META = "meta.json"
+_RESULT_PARTS = ("combo_result", "b2cs_result", "hsn_result", "json_result")
+_RESULT_FIELDS = ("file_name", "dynamic_gstin", "dynamic_fp", "default_state_code_numeric", "warnings")
+
+@functools.lru_cache(maxsize=None)
+def code_version():
+    """Fingerprint of this module and the libraries that shape the output; changes invalidate cached results."""
+    with open(os.path.abspath(__file__), "rb") as f:
+        source = f.read()
+    return hashlib.sha256(source + f"|pandas {pd.__version__}|numpy {np.__version__}".encode()).hexdigest()
+
+class ResultCache:
+    """
+    Disk-backed cache of finished reports, shared by every session, process and restart.
+
+    An entry is one stored ZIP named by the SHA-256 of the upload bytes, the formula
+    mode, the template version and code_version(), so any change to inputs or code
+    misses. Entries are written to a temp file and renamed into place, so readers
+    never see a partial entry. A hit refreshes the entry's mtime; writes evict the
+    least recently used entries once the directory exceeds max_bytes. Any cache
+    failure (unreadable entry, read-only disk, an entry evicted by another process)
+    is treated as a miss.
+    """
+
+    def __init__(self, cache_dir=RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def key(self, zip_digest, formula_mode, template_version, json_style=DEFAULT_GSTR1_JSON_STYLE):
+        """zip_digest is content_digest() of the upload."""
+        parts = (code_version(), template_version, formula_mode, json_style, zip_digest)
+        return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.zip")
+
+    def get(self, key):
+        """Returns the stored generate_reports result for key, or None."""
+        path = self._path(key)
+        try:
+            with zipfile.ZipFile(path) as z:
+                meta = json.loads(z.read(_RESULT_META))
+                results = {name: z.read(name) for name in _RESULT_PARTS}
+            os.utime(path) # mark as recently used
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            return None
+
+        results.update((field, meta[field]) for field in _RESULT_FIELDS)
+        report = meta.get("memory_report")
+        results["memory_report"] = None if report is None else pd.DataFrame(
+            {"dtype": report["dtype"], "bytes": report["bytes"]}, index=report["index"]
+        )
+        return results
+
+    def put(self, key, results):
+        """Stores a generate_reports result under key (best effort) and evicts old entries."""
+        meta = {field: results[field] for field in _RESULT_FIELDS}
+        report = results.get("memory_report")
+        if report is not None:
+            meta["memory_report"] = {
+                "index": [str(name) for name in report.index],
+                "dtype": report["dtype"].tolist(),
+                "bytes": [int(value) for value in report["bytes"]],
+            }
+
+        buffer = io.BytesIO()
+        # The reports are already compressed (xlsx) or small; stored members keep hits cheap
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as z:
+            z.writestr(_RESULT_META, json.dumps(meta))
+            for name in _RESULT_PARTS:
+                z.writestr(name, results[name])
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            _atomic_write(self._path(key), buffer.getvalue())
+        except OSError:
+            return # the cache is an optimisation; a read-only disk must not fail the run
+        self.evict()
+
+    def evict(self):
+        """Deletes least recently used entries until the cache fits in max_bytes."""
+        with self._lock:
+            _evict_lru(self.cache_dir, ".zip", self.max_bytes)
+
+def _evict_lru(cache_dir, suffix, max_bytes):
+    """Deletes the oldest-mtime `suffix` files in cache_dir until they total at most max_bytes."""
+    entries = []
+    try:
+        with os.scandir(cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(suffix):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue # removed by another process
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+    except OSError:
+        return
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+@functools.lru_cache(maxsize=None)
+def get_result_cache():
+    """One ResultCache per process over RESULT_CACHE_DIR."""
+    return ResultCache()
+
+
+class MemberCache:
+    """
+    Disk-backed Parquet cache of process_file results, so an unchanged Sales or
+    Return file is not parsed again when only the other one was corrected.
+
+    Keyed by the member's SHA-256, its data type and code_version() (the frame
+    schema is defined by this module). Parquet keeps the compact dtypes (categorical
+    TYPE, small integers, Arrow strings), so a hit returns an equal frame. Writes
+    are atomic and LRU-evicted like ResultCache; frames Parquet cannot store (e.g.
+    mixed-type object columns) are simply not cached. Needs pyarrow; without it
+    every lookup misses.
+    """
+
+    def __init__(self, cache_dir=MEMBER_CACHE_DIR, max_bytes=MEMBER_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = CSV_ENGINE == "pyarrow" # i.e. pyarrow is installed
+        self._lock = threading.Lock()
+
+    def key(self, path, data_type):
+        with open(path, "rb") as f:
+            member_digest = content_digest(f)
+        parts = (code_version(), data_type, member_digest)
+        return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.parquet")
+
+    def get(self, key):
+        """Returns the cached frame for key, or None."""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            df = pd.read_parquet(path)
+            os.utime(path) # mark as recently used
+        except (OSError, ValueError, TypeError, ArrowException):
+            return None
+        return df
+
+    def put(self, key, df):
+        """Stores a frame under key (best effort) and evicts old entries."""
+        if not self.enabled:
+            return
+        path = self._path(key)
+        tmp_path = None
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            os.close(fd)
+            df.to_parquet(tmp_path)
+            os.replace(tmp_path, path)
+        except (OSError, ValueError, TypeError, ArrowException):
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self._lock:
+            _evict_lru(self.cache_dir, ".parquet", self.max_bytes)
+
+@functools.lru_cache(maxsize=None)
+def get_member_cache():
+    """One MemberCache per process over MEMBER_CACHE_DIR."""
+    return MemberCache()
+
+
+# ============================================================
+#  SESSION RESULT STORE
+# ============================================================
+class SessionResultStore:
+    """
+    Process-wide store for the large artifacts of app sessions, so session state only
+    holds a StoredArtifact handle. Every artifact is written to a temp directory owned
+    by the store (removed with it); the most recently used ones, up to memory_bytes,
+    are also kept in memory. Artifacts unused for ttl_seconds expire, and the least
+    recently used are evicted once the directory holds more than max_bytes (the
+    newest artifact is always kept). get() returns None for an expired or evicted
+    artifact.
+    """
+
+    def __init__(self, store_dir=SESSION_STORE_DIR, max_bytes=SESSION_STORE_MAX_BYTES,
+                 memory_bytes=SESSION_STORE_MEMORY_BYTES, ttl_seconds=SESSION_STORE_TTL_SECONDS):
+        if store_dir:
+            os.makedirs(store_dir, exist_ok=True)
+        self.store_dir = tempfile.mkdtemp(prefix="gst-session-results-", dir=store_dir)
+        self.max_bytes = max_bytes
+        self.memory_bytes = memory_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()  # token -> [size, last used], least recently used first
+        self._memory = collections.OrderedDict()   # token -> bytes, least recently used first
+        self._disk_total = 0
+        self._memory_total = 0
+        weakref.finalize(self, shutil.rmtree, self.store_dir, True)
+
+    def _path(self, token):
+        return os.path.join(self.store_dir, f"{token}.bin")
+
+    def keep(self, content):
+        """Stores content (bytes); returns a StoredArtifact that discards it when released or dropped."""
+        return StoredArtifact(self, self.put(content), len(content))
+
+    def put(self, content):
+        """Stores content (bytes); returns its token."""
+        token = secrets.token_hex(16)
+        _atomic_write(self._path(token), content)
+        self._add(token, len(content), content)
+        return token
+
+    def writer(self):
+        """An ArtifactWriter: an artifact written piece by piece, straight to the store's directory."""
+        return ArtifactWriter(self)
+
+    def _add(self, token, size, content=None):
+        """Registers the file of token (kept in memory too when content is given)."""
+        with self._lock:
+            self._entries[token] = [size, time.monotonic()]
+            self._disk_total += size
+            if content is not None:
+                self._remember(token, content)
+            self._evict()
+
+    def get(self, token):
+        """The stored bytes for token, or None once expired, evicted or discarded."""
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            entry[1] = time.monotonic()
+            self._entries.move_to_end(token)
+            content = self._memory.get(token)
+            if content is not None:
+                self._memory.move_to_end(token)
+                return content
+        try:
+            with open(self._path(token), "rb") as f:
+                content = f.read()
+        except OSError:
+            return None # evicted meanwhile
+        with self._lock:
+            if token in self._entries and token not in self._memory:
+                self._remember(token, content)
+        return content
+
+    def __contains__(self, token):
+        with self._lock:
+            self._expire()
+            return token in self._entries
+
+    def discard(self, *tokens):
+        """Deletes the artifacts of tokens (unknown tokens are ignored)."""
+        with self._lock:
+            for token in tokens:
+                self._drop(token)
+
+    def stats(self):
+        """Number of artifacts and the bytes they take on disk and in memory."""
+        with self._lock:
+            self._expire()
+            return {"artifacts": len(self._entries), "disk_bytes": self._disk_total, "memory_bytes": self._memory_total}
+
+    # --- internals (called with the lock held) ---------------------------
+    def _remember(self, token, content):
+        if len(content) > self.memory_bytes:
+            return
+        self._memory[token] = content
+        self._memory_total += len(content)
+        while self._memory_total > self.memory_bytes:
+            _, dropped = self._memory.popitem(last=False)
+            self._memory_total -= len(dropped)
+
+    def _drop(self, token):
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        self._disk_total -= entry[0]
+        content = self._memory.pop(token, None)
+        if content is not None:
+            self._memory_total -= len(content)
+        try:
+            os.remove(self._path(token))
+        except OSError:
+            pass
+
+    def _expire(self):
+        deadline = time.monotonic() - self.ttl_seconds
+        while self._entries:
+            token, (_, last_used) = next(iter(self._entries.items()))
+            if last_used > deadline:
+                break
+            self._drop(token)
+
+    def _evict(self):
+        self._expire()
+        while self._disk_total > self.max_bytes and len(self._entries) > 1:
+            self._drop(next(iter(self._entries)))
+
+class ArtifactWriter:
+    """
+    A SessionResultStore artifact written through the binary file `file` (e.g. a report
+    bundle as it is built), so its bytes never have to sit in memory whole. commit()
+    stores it and returns its StoredArtifact; discard() throws it away.
+    """
+
+    def __init__(self, store):
+        self._store = store
+        fd, self._tmp_path = tempfile.mkstemp(dir=store.store_dir, suffix=".tmp")
+        self.file = os.fdopen(fd, "w+b")
+
+    def commit(self):
+        self.file.close()
+        token = secrets.token_hex(16)
+        size = os.path.getsize(self._tmp_path)
+        os.replace(self._tmp_path, self._store._path(token))
+        self._store._add(token, size)
+        return StoredArtifact(self._store, token, size)
+
+    def discard(self):
+        self.file.close()
+        with contextlib.suppress(OSError):
+            os.remove(self._tmp_path)
+
+class StoredArtifact:
+    """
+    Session-state handle of one SessionResultStore artifact. The artifact is discarded
+    on release(), or when the handle is garbage collected (e.g. its session ended).
+    """
+
+    def __init__(self, store, token, size):
+        self.token = token
+        self.size = size
+        self._store = store
+        self._finalizer = weakref.finalize(self, store.discard, token)
+
+    def get(self):
+        """The artifact's bytes, or None once it expired or was evicted."""
+        return self._store.get(self.token)
+
+    @property
+    def available(self):
+        return self.token in self._store
+
+    def release(self):
+        self._finalizer()
+
+@functools.lru_cache(maxsize=None)
+def get_session_result_store():
+    """One SessionResultStore per process."""
+    return SessionResultStore()
+
+
+# ============================================================
+#  RUN INSTRUMENTATION
+# ============================================================
+_profile_lock = threading.Lock() # cProfile allows one active profiler per process
+
+def peak_rss_mib():
+    """
+    Peak RSS of this process in MiB (VmHWM). Never reset here: clearing it is process-wide
+    and would corrupt the figures of runs in other sessions (see gst_bench for per-case resets).
+    """
+    with contextlib.suppress(OSError):
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+def _cpu_seconds():
+    """CPU time of this process plus its finished children (parse workers)."""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+class RunRecorder:
+    """
+    Wall time, CPU time, rows and peak RSS of every stage of one generate_reports run.
+
+    record() is the structured (JSON-ready) run record. A stage entered several times
+    (once per chunk in streaming mode) is summed. A stage's peak RSS is the process's
+    high-water mark when it ends: it includes earlier runs and runs in other threads
+    (other Streamlit sessions), so it only shows where a new peak was reached. With
+    profile=True the run is also traced with cProfile and tracemalloc (several times
+    slower); profile_archive() then holds the dumps.
+    """
+
+    def __init__(self, profile=False):
+        self.profile = profile
+        self.stages = {}
+        self.info = {}  # run-level facts: streaming, cache hit, GSTIN, ...
+        self.profile_files = {}
+        self._totals = None
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=None):
+        """Times the block as stage `name`, counting `rows`; yields the stage entry."""
+        entry = self.stages.setdefault(name, {"seconds": 0.0, "cpu_seconds": 0.0, "rows": None, "peak_rss_mib": 0.0})
+        started, cpu_started = time.perf_counter(), _cpu_seconds()
+        try:
+            yield entry
+        finally:
+            entry["seconds"] += time.perf_counter() - started
+            entry["cpu_seconds"] += _cpu_seconds() - cpu_started
+            entry["peak_rss_mib"] = max(entry["peak_rss_mib"], peak_rss_mib())
+            if rows is not None:
+                entry["rows"] = (entry["rows"] or 0) + rows
+
+    def iterate(self, name, chunks):
+        """Yields from the chunks (frames), timing the reading of each as stage `name`."""
+        chunks = iter(chunks)
+        while True:
+            with self.stage(name) as entry:
+                chunk = next(chunks, None)
+                if chunk is not None:
+                    entry["rows"] = (entry["rows"] or 0) + len(chunk)
+            if chunk is None:
+                return
+            yield chunk
+
+    @contextlib.contextmanager
+    def run(self):
+        """Wraps the whole run: total time and, when profiling, the cProfile / tracemalloc capture."""
+        profiling = self.profile and _profile_lock.acquire(blocking=False)
+        if self.profile and not profiling:
+            self.info["profile"] = "skipped: another run is being profiled"
+        if profiling:
+            import cProfile
+            import tracemalloc
+            tracemalloc.start()
+            profiler = cProfile.Profile()
+            profiler.enable()
+        started, cpu_started = time.perf_counter(), _cpu_seconds()
+        try:
+            yield self
+        except BaseException as e:
+            self.info["error"] = str(e) or type(e).__name__
+            raise
+        finally:
+            self._totals = (time.perf_counter() - started, _cpu_seconds() - cpu_started)
+            if profiling:
+                profiler.disable()
+                try:
+                    self._save_profile(profiler)
+                finally:
+                    tracemalloc.stop()
+                    _profile_lock.release()
+
+    def _save_profile(self, profiler):
+        import marshal
+        import pstats
+        import tracemalloc
+
+        profiler.create_stats()
+        raw_stats = marshal.dumps(profiler.stats) # before pstats.Stats, which takes the stats over
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"Traced Python allocations: peak {peak / 1024 ** 2:,.1f} MiB, still held {current / 1024 ** 2:,.1f} MiB", ""]
+        lines += [str(stat) for stat in tracemalloc.take_snapshot().statistics("lineno")[:PROFILE_TOP_ALLOCATIONS]]
+
+        self.profile_files = {
+            "profile.prof": raw_stats, # python -m pstats profile.prof / snakeviz
+            "profile.txt": text.getvalue().encode("utf-8"),
+            "tracemalloc.txt": "\n".join(lines).encode("utf-8"),
+        }
+        self.info["profile"] = "captured"
+        self.info["traced_peak_mib"] = round(peak / 1024 ** 2, 1)
+
+    def record(self):
+        """The run record: run-level facts plus one entry per stage, in the order first entered."""
+        seconds, cpu_seconds = self._totals or (sum(e["seconds"] for e in self.stages.values()), None)
+        return {
+            "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "seconds": round(seconds, 4),
+            "cpu_seconds": None if cpu_seconds is None else round(cpu_seconds, 4),
+            "peak_rss_mib": round(max((e["peak_rss_mib"] for e in self.stages.values()), default=0.0), 1),
+            **self.info,
+            "stages": [
+                {
+                    "stage": name,
+                    "seconds": round(entry["seconds"], 4),
+                    "cpu_seconds": round(entry["cpu_seconds"], 4),
+                    "rows": entry["rows"],
+                    "peak_rss_mib": round(entry["peak_rss_mib"], 1),
+                }
+                for name, entry in self.stages.items()
+            ],
+            "versions": {"python": sys.version.split()[0], "pandas": pd.__version__, "numpy": np.__version__},
+        }
+
+    def profile_archive(self):
+        """ZIP bytes with the run record and the profile dumps; None when nothing was captured."""
+        if not self.profile_files:
+            return None
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as z:
+            z.writestr("run_record.json", json.dumps(self.record(), indent=2))
+            for name, content in self.profile_files.items():
+                z.writestr(name, content)
+        return buffer.getvalue()
+
+
+# ============================================================
+#  MAIN ZIP PROCESSOR
+# ============================================================
+def _generate_reports_streaming(members, dynamic_gstin, dynamic_fp, supplier_state_code_numeric,
+                                formula_mode=DEFAULT_COMBO_FORMULA_MODE, recorder=None,
+                                json_style=DEFAULT_GSTR1_JSON_STYLE, bundle=None, report_names=None):
+    """
+    Low-memory path: the rows of each (path, data_type) member, in order, flow chunk
+    by chunk through rename/sign, state mapping and tax split into the combo writer
+    and the running group sums. Members are read one at a time, never in parallel.
+    Each report goes into bundle (under report_names) once produced.
+    Returns (combo, b2cs_csv, hsn_csv, json); raises ReportError.
+    """
+    recorder = RunRecorder() if recorder is None else recorder
+
+    # Load Template first, so the combo sheet can be filled as chunks arrive
+    with recorder.stage("template"):
+        template = load_template()
+
+    combo_writer = ComboWorkbookWriter(
+        template, formula_mode=formula_mode, supplier_state=STATE_CODE_NAMES.get(supplier_state_code_numeric)
+    )
+    summaries = GSTAggregationCube()
+
+    try:
+        for data_stream, data_type in members:
+            for chunk in recorder.iterate("parse", iter_processed_chunks(data_stream, data_type)):
+                with recorder.stage("state_mapping", rows=len(chunk)):
+                    chunk = map_state_codes(chunk)
+                with recorder.stage("tax_components", rows=len(chunk)):
+                    taxed = calculate_tax_components(chunk, supplier_state_code_numeric)
+                with recorder.stage("combo_excel", rows=len(chunk)):
+                    combo_writer.append(chunk, taxed)
+                with recorder.stage("aggregate", rows=len(chunk)):
+                    summaries.update(taxed)
+    except ReportError:
+        raise
+    except Exception as e:
+        raise ReportError(f"Error processing input files: {e}") from e
+
+    with recorder.stage("aggregate"):
+        b2cs_summary, hsn_summary = summaries.result()
+    with recorder.stage("combo_excel"):
+        combo_excel_output = combo_writer.getvalue()
+    _bundle_report(bundle, recorder, report_names, "combo_result", combo_excel_output)
+    with recorder.stage("b2cs_csv"):
+        b2cs_csv_output = generate_b2cs_csv(b2cs_summary)
+    _bundle_report(bundle, recorder, report_names, "b2cs_result", b2cs_csv_output)
+    with recorder.stage("hsn_csv"):
+        hsn_csv_output = generate_hsn_summary(hsn_summary)
+    _bundle_report(bundle, recorder, report_names, "hsn_result", hsn_csv_output)
+    with recorder.stage("gstr1_json"):
+        json_output = generate_gstr1_json(
+            b2cs_summary, hsn_summary, dynamic_gstin, dynamic_fp, supplier_state_code_numeric, style=json_style
+        )
+    _bundle_report(bundle, recorder, report_names, "json_result", json_output)
+    return combo_excel_output, b2cs_csv_output, hsn_csv_output, json_output
+
+def generate_reports(zip_file, streaming=False, formula_mode=DEFAULT_COMBO_FORMULA_MODE, cache=None,
+                     parse_workers=None, member_cache=None, recorder=None, json_style=DEFAULT_GSTR1_JSON_STYLE,
+                     bundle=None):
+    """
+    Extracts, processes, merges data, fills the Excel template, and generates reports.
+    A Sales file is mandatory for configuration; Return files are optional. Every
+    matching workbook is used (split exports), Sales then Return, each in name order;
+    up to parse_workers (default PARSE_WORKERS) of them are parsed in parallel. Outside
+    streaming mode, those found in member_cache (a MemberCache) are loaded instead.
+    With streaming=True the sheets are read in STREAM_CHUNK_ROWS chunks instead of whole.
+    formula_mode picks how combo columns K–O are written (see COMBO_FORMULA_MODES), and
+    json_style the layout of the GSTR-1 JSON (see GSTR1_JSON_STYLES).
+    With a ResultCache, an upload already processed (same bytes, mode, template and
+    code) is returned from the cache without being parsed again. Every stage is timed
+    by recorder (a RunRecorder; pass one with profile=True to profile the run, or to
+    read the record of a run that failed). With a ReportBundleWriter as bundle, each
+    report is written into it as soon as it is produced, and the manifest (with the run
+    record) once the run is done; after a failure the bundle is incomplete.
+
+    Returns a dict keyed like the session state (combo_result, b2cs_result, hsn_result,
+    json_result, file_name, dynamic_gstin, ..., run_record) plus "warnings", a list of
+    messages. Raises ReportError with a user-facing message when the upload cannot be processed.
+    """
+    recorder = RunRecorder() if recorder is None else recorder
+    recorder.info.update(streaming=streaming, formula_mode=formula_mode, json_style=json_style)
+    try:
+        with recorder.run():
+            with recorder.stage("upload"):
+                upload = open_upload(zip_file)
+            try:
+                if cache is None:
+                    results = _generate_reports(
+                        upload, streaming, formula_mode, parse_workers, member_cache, recorder, json_style, bundle
+                    )
+                else:
+                    with recorder.stage("result_cache"):
+                        key = cache.key(content_digest(upload), formula_mode, template_version(), json_style)
+                        results = cache.get(key)
+                    recorder.info["result_cache"] = "miss" if results is None else "hit"
+                    if results is None:
+                        results = _generate_reports(
+                            upload, streaming, formula_mode, parse_workers, member_cache, recorder, json_style, bundle
+                        )
+                        with recorder.stage("result_cache"):
+                            cache.put(key, results)
+                    elif bundle is not None:
+                        report_names = _report_names(results["file_name"])
+                        for result_key in report_names:
+                            _bundle_report(bundle, recorder, report_names, result_key, results[result_key])
+            finally:
+                if upload is not zip_file:
+                    upload.close()
+    except BaseException:
+        if bundle is not None:
+            bundle.abort()
+        raise
+
+    recorder.info.update(gstin=results["dynamic_gstin"], fp=results["dynamic_fp"])
+    results["run_record"] = recorder.record()
+    if bundle is not None:
+        bundle.finish(results, results["run_record"])
+    return results
+
+def _generate_reports(upload, streaming, formula_mode, parse_workers=None, member_cache=None, recorder=None,
+                      json_style=DEFAULT_GSTR1_JSON_STYLE, bundle=None):
+    """generate_reports without the cache; upload is a seekable ZIP file."""
+    recorder = RunRecorder() if recorder is None else recorder
+    with tempfile.TemporaryDirectory(prefix="gst-members-") as work_dir:
+        with recorder.stage("extract"):
+            sales_members, return_members = extract_sales_return(upload, work_dir)
+        recorder.info.update(sales_files=len(sales_members), return_files=len(return_members))
+        return _generate_reports_from_members(
+            sales_members, return_members, streaming, formula_mode, parse_workers, member_cache, recorder, json_style,
+            bundle,
+        )
+
+def extract_sales_return(upload, work_dir):
+    """
+    Extracts every Sales and Return workbook of the upload into work_dir.
+    Returns two lists of (member name, path), each in member-name order.
+    """
+    sales_infos = []
+    return_infos = []
+
+    # 1. Find the Sales / Return members and extract them out of the ZIP
+    try:
+        with zipfile.ZipFile(upload) as z:
+            for info in z.infolist():
+                name = info.filename
+                if not info.file_size:
+                    continue # empty members count as missing, like an empty read did before
+                if name.endswith(INPUT_EXTENSIONS):
+                    if "return" in name.lower() or "rtn" in name.lower():
+                        return_infos.append(info)
+                    elif "sale" in name.lower() or "sls" in name.lower() or "invoice" in name.lower():
+                        sales_infos.append(info)
+
+            members = []
+            for kind, infos in (("sale", sales_infos), ("return", return_infos)):
+                infos.sort(key=lambda info: info.filename)
+                # Numbered paths: member names may repeat or contain directories
+                members.append([
+                    (info.filename, extract_member(
+                        z, info, os.path.join(work_dir, f"{kind}-{index}{os.path.splitext(info.filename)[1]}")
+                    ))
+                    for index, info in enumerate(infos)
+                ])
+    except zipfile.BadZipFile as e:
+        raise ReportError("Invalid or corrupted ZIP file.") from e
+    return members
+
+def probe_csv_header(path):
+    """First data row's GSTIN / month / year of a CSV export, keyed like HEADER_CELLS."""
+    columns = list(CSV_HEADER_COLUMNS.values())
+    row = pd.read_csv(path, usecols=columns, dtype="str", nrows=1, encoding="utf-8-sig", keep_default_na=False)
+    if row.empty:
+        raise ValueError("the file has no data rows")
+    return {key: row.at[0, col] for key, col in CSV_HEADER_COLUMNS.items()}
+
+def _read_reporting_header(name, path):
+    """Reads and validates the configuration of one Sales export; returns (gstin, month, year)."""
+    # 1a. Extract GSTIN and Reporting Period (C2, P2, O2 / CSV columns) — reads only the top rows
+    try:
+        if detect_format(path) == "csv":
+            header = probe_csv_header(path)
+        else:
+            cells = probe_header_cells(path)
+            header = {key: cells[ref] for key, ref in HEADER_CELLS.items()}
+    except Exception as e:
+        raise ReportError(f"Error extracting header data from Sales file (C2, P2, O2) of '{name}': {e}") from e
+
+    try:
+        return validate_reporting_header(header["gstin"], header["month"], header["year"])
+    except ValueError as e:
+        raise ReportError(str(e)) from e
+
+def spawn_pool(max_workers):
+    """
+    A process pool with spawned workers. Forking the multithreaded app server can
+    copy a lock another thread holds and deadlock the child; spawning starts clean.
+    """
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+def parse_members(members, workers=None, member_cache=None):
+    """
+    Runs process_file over (path, data_type) members and returns the frames in the
+    same order. Members found in member_cache are loaded instead of parsed. With
+    more than one member left, workers > 1 and at least PARALLEL_PARSE_MIN_BYTES
+    to read, the rest are parsed in a process pool.
+    """
+    frames = [None] * len(members)
+    keys = {}
+    if member_cache is not None:
+        for i, (path, data_type) in enumerate(members):
+            keys[i] = member_cache.key(path, data_type)
+            frames[i] = member_cache.get(keys[i])
+    pending = [i for i, frame in enumerate(frames) if frame is None]
+
+    workers = min(workers or PARSE_WORKERS, len(pending))
+    total_bytes = sum(os.path.getsize(members[i][0]) for i in pending)
+    if workers <= 1 or total_bytes < PARALLEL_PARSE_MIN_BYTES:
+        for i in pending:
+            frames[i] = process_file(*members[i])
+    else:
+        # Largest first, so the longest parse starts immediately
+        order = sorted(pending, key=lambda i: -os.path.getsize(members[i][0]))
+        with spawn_pool(workers) as pool:
+            futures = {i: pool.submit(process_file, *members[i]) for i in order}
+            for i in pending:
+                frames[i] = futures[i].result()
+
+    if member_cache is not None:
+        for i in pending:
+            member_cache.put(keys[i], frames[i])
+    return frames
+
+def export_config(sales_members, return_members):
+    """Validated (gstin, month, year, warnings) of the extracted Sales / Return members."""
+    warnings = []
+
+    # **Sales file is mandatory for configuration (GSTIN/FP)**
+    if not sales_members:
+        raise ReportError(
+            "The Sales file is mandatory as it contains the required configuration data (GSTIN in C2, Month/Year in P2/O2) needed for processing and file naming.",
+            emphasis=("Sales file",),
+        )
+
+    if not return_members:
+        warnings.append("Return file not found in ZIP. Processing Sales data only.")
+
+    # Split exports must all belong to the same GSTIN and period
+    dynamic_gstin, month_str, year_str = _read_reporting_header(*sales_members[0])
+    for name, path in sales_members[1:]:
+        other = _read_reporting_header(name, path)
+        if other != (dynamic_gstin, month_str, year_str):
+            raise ReportError(
+                f"Sales files disagree on GSTIN/period: '{sales_members[0][0]}' is {dynamic_gstin} "
+                f"{month_str}/{year_str}, '{name}' is {other[0]} {other[1]}/{other[2]}."
+            )
+    return dynamic_gstin, month_str, year_str, warnings
+
+def _parse_export(members, parse_workers=None, member_cache=None, recorder=None):
+    """Parses (path, data_type) members into one merged, state-mapped frame."""
+    recorder = RunRecorder() if recorder is None else recorder
+
+    # 2. Process DataFrames (no empty placeholder frame for a missing Returns file:
+    # concatenating one would turn every column into object dtype)
+    with recorder.stage("parse") as entry:
+        try:
+            frames = parse_members(members, parse_workers, member_cache)
+        except Exception as e:
+            raise ReportError(f"Error processing input files: {e}") from e
+        entry["rows"] = sum(len(frame) for frame in frames)
+
+    # 3. Merge DataFrames
+    with recorder.stage("merge", rows=entry["rows"]):
+        df_merged = pd.concat(frames, ignore_index=True)
+    del frames
+
+    # Map State Code
+    with recorder.stage("state_mapping", rows=len(df_merged)):
+        return map_state_codes(df_merged)
+
+def read_export(zip_file, parse_workers=None, member_cache=None):
+    """
+    Reads an export ZIP (one delivery) without building any report: returns a dict
+    with dynamic_gstin, dynamic_fp, default_state_code_numeric, warnings and "frame",
+    the merged, normalised and state-mapped rows. Raises ReportError like generate_reports.
+    """
+    upload = open_upload(zip_file)
+    try:
+        with tempfile.TemporaryDirectory(prefix="gst-members-") as work_dir:
+            sales_members, return_members = extract_sales_return(upload, work_dir)
+            dynamic_gstin, month_str, year_str, warnings = export_config(sales_members, return_members)
+            members = [(path, "Sale") for _, path in sales_members] + [(path, "Return") for _, path in return_members]
+            df_merged = _parse_export(members, parse_workers, member_cache)
+    finally:
+        if upload is not zip_file:
+            upload.close()
+    return {
+        "dynamic_gstin": dynamic_gstin,
+        "dynamic_fp": f"{month_str}{year_str}",
+        "default_state_code_numeric": dynamic_gstin[:2],
+        "frame": df_merged,
+        "warnings": warnings,
+    }
+
+def _generate_reports_from_members(sales_members, return_members, streaming, formula_mode, parse_workers=None,
+                                   member_cache=None, recorder=None, json_style=DEFAULT_GSTR1_JSON_STYLE, bundle=None):
+    """
+    Builds the reports from the extracted Sales / Return workbooks (lists of (name, path)),
+    adding each to bundle (a ReportBundleWriter, optional) as soon as it is produced.
+    """
+    recorder = RunRecorder() if recorder is None else recorder
+    with recorder.stage("header"):
+        dynamic_gstin, month_str, year_str, warnings = export_config(sales_members, return_members)
+    members = [(path, "Sale") for _, path in sales_members] + [(path, "Return") for _, path in return_members]
+
+    # Format FP and Filename
+    dynamic_fp = f"{month_str}{year_str}"
+    dynamic_filename = f"{dynamic_gstin}_{month_str}_{year_str}_GSTR1.xlsx"
+    default_state_code_numeric = dynamic_gstin[:2]
+    report_names = _report_names(dynamic_filename)
+
+    if streaming:
+        combo_excel_output, b2cs_csv_output, hsn_csv_output, json_output = _generate_reports_streaming(
+            members, dynamic_gstin, dynamic_fp, default_state_code_numeric,
+            formula_mode=formula_mode, recorder=recorder, json_style=json_style,
+            bundle=bundle, report_names=report_names,
+        )
+        frame_memory = None # rows never sit in memory all at once
+    else:
+        # 2.–3. Parse, merge and state-map the members
+        df_merged = _parse_export(members, parse_workers, member_cache, recorder)
+        rows = len(df_merged)
+
+        # 4. Calculate Tax Components 
+        with recorder.stage("tax_components", rows=rows):
+            df_merged_taxed = calculate_tax_components(df_merged, default_state_code_numeric)
+        frame_memory = memory_report(df_merged_taxed) # shares the merged columns, plus the tax columns
+
+        # 5. Load Template (for Excel output only)
+        with recorder.stage("template"):
+            template = load_template()
+
+        # 6. Generate All Reports
+        with recorder.stage("combo_excel", rows=rows):
+            combo_excel_output = generate_combo_excel(
+                df_merged, template, formula_mode=formula_mode, df_taxed=df_merged_taxed,
+                supplier_state=STATE_CODE_NAMES.get(default_state_code_numeric),
+            )
+        _bundle_report(bundle, recorder, report_names, "combo_result", combo_excel_output)
+        with recorder.stage("aggregate", rows=rows):
+            b2cs_summary, hsn_summary = summarise_taxed(df_merged_taxed)
+        with recorder.stage("b2cs_csv"):
+            b2cs_csv_output = generate_b2cs_csv(b2cs_summary)
+        _bundle_report(bundle, recorder, report_names, "b2cs_result", b2cs_csv_output)
+        with recorder.stage("hsn_csv"):
+            hsn_csv_output = generate_hsn_summary(hsn_summary)
+        _bundle_report(bundle, recorder, report_names, "hsn_result", hsn_csv_output)
+        
+        # CRITICAL: Passing the supplier state code numeric for JSON's sply_ty calculation
+        with recorder.stage("gstr1_json"):
+            json_output = generate_gstr1_json(
+                b2cs_summary, hsn_summary, dynamic_gstin, dynamic_fp, default_state_code_numeric, style=json_style
+            )
+        _bundle_report(bundle, recorder, report_names, "json_result", json_output)
+
+    return {
+        "combo_result": combo_excel_output,
+        "b2cs_result": b2cs_csv_output,
+        "hsn_result": hsn_csv_output,
+        "json_result": json_output,
+        "file_name": dynamic_filename,
+        "dynamic_gstin": dynamic_gstin,
+        "dynamic_fp": dynamic_fp,
+        "default_state_code_numeric": default_state_code_numeric,
+        "memory_report": frame_memory,
+        "warnings": warnings,
+    }
+
+def _report_names(file_name):
+    """Result key -> output file name of the four reports of a run whose combo workbook is file_name."""
+    base_name = file_name.replace(".xlsx", "")
+    return {
+        "combo_result": file_name,
+        "b2cs_result": "B2CS_Summary_Report.csv",
+        "hsn_result": "HSN_Summary_Report.csv",
+        "json_result": f"{base_name}_GSTR1.json",
+    }
+
+def report_files(results):
+    """Output file name -> bytes for a generate_reports result, named like the app's download buttons."""
+    return {name: results[key] for key, name in _report_names(results["file_name"]).items()}
+
+def write_reports(results, output_dir):
+    """Writes the four reports into output_dir; returns their paths."""
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for name, content in report_files(results).items():
+        path = os.path.join(output_dir, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        paths.append(path)
+    return paths
+
+BUNDLE_MANIFEST_NAME = "manifest.json"
+BUNDLE_WRITE_BYTES = 1024 * 1024  # slice written to the bundle at a time
+
+def bundle_name(file_name):
+    """File name of the ZIP bundle for a result whose combo workbook is file_name."""
+    return file_name.replace(".xlsx", "_reports.zip")
+
+def _file_entry(name, content):
+    return {"name": name, "bytes": len(content), "sha256": hashlib.sha256(content).hexdigest()}
+
+def bundle_manifest(results, run_record=None, files=None):
+    """
+    The manifest stored in a bundle: GSTIN / period, the files with sizes and SHA-256
+    (those of report_files(results) unless given), warnings and the run.
+    """
+    manifest = {
+        "gstin": results["dynamic_gstin"],
+        "fp": results["dynamic_fp"],
+        "files": files if files is not None else [_file_entry(name, content) for name, content in report_files(results).items()],
+        "warnings": results["warnings"],
+    }
+    if run_record is not None:
+        manifest["run"] = run_record
+    return manifest
+
+class ReportBundleWriter:
+    """
+    A report bundle built on the binary stream `out` while a run goes: generate_reports
+    add()s each report as soon as it is produced and finish()es with the manifest, so
+    the bundle needs no second pass over the four reports. Reports are written in
+    BUNDLE_WRITE_BYTES slices; CSVs and JSON are deflated, the combo workbook (already
+    a deflated ZIP) is stored as is.
+    """
+
+    def __init__(self, out):
+        self._zip = zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED)
+        self.files = []  # manifest entries of the reports added so far
+
+    def add(self, name, content):
+        info = zipfile.ZipInfo(name, time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_STORED if name.endswith(".xlsx") else zipfile.ZIP_DEFLATED
+        view = memoryview(content)
+        with self._zip.open(info, "w", force_zip64=len(content) > 0x7FFFFFFF) as member:
+            for start in range(0, len(view), BUNDLE_WRITE_BYTES):
+                member.write(view[start:start + BUNDLE_WRITE_BYTES])
+        self.files.append(_file_entry(name, content))
+
+    def abort(self):
+        """Closes the ZIP of a run that failed; what `out` holds is incomplete."""
+        with contextlib.suppress(OSError, ValueError):
+            self._zip.close()
+
+    def finish(self, results, run_record=None):
+        """Writes bundle_manifest() and closes the ZIP (not `out`)."""
+        self._zip.writestr(BUNDLE_MANIFEST_NAME, json.dumps(bundle_manifest(results, run_record, self.files), indent=2))
+        self._zip.close()
+
+def _bundle_report(bundle, recorder, report_names, key, content):
+    """Adds the report `key` to the run's bundle, if it has one, under the "bundle" stage."""
+    if bundle is not None:
+        with recorder.stage("bundle"):
+            bundle.add(report_names[key], content)
+
+def write_report_bundle(results, out, run_record=None):
+    """Writes the four reports of a finished run and bundle_manifest() as one ZIP to the binary stream `out`."""
+    bundle = ReportBundleWriter(out)
+    for name, content in report_files(results).items():
+        bundle.add(name, content)
+    bundle.finish(results, run_record)
+
+def report_bundle(results, run_record=None):
+    """write_report_bundle() into memory; returns the ZIP bytes."""
+    buffer = io.BytesIO()
+    write_report_bundle(results, buffer, run_record)
+    return buffer.getvalue()
+
+def read_bundle_member(bundle, name):
+    """Bytes of one file of a report bundle (ZIP bytes)."""
+    with zipfile.ZipFile(io.BytesIO(bundle)) as z:
+        return z.read(name)
+
+
+# ============================================================
+#  COMMAND LINE
+# ============================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate the four GSTR-1 reports for one seller ZIP.")
+    parser.add_argument("zip_path", help="ZIP with the Sales (mandatory) and Return (optional) exports")
+    parser.add_argument("-o", "--output", default=".", help="output directory (default: current directory)")
+    parser.add_argument("--low-memory", action="store_true", help="read the sheets in chunks (streaming mode)")
+    parser.add_argument(
+        "--formula-mode", choices=COMBO_FORMULA_MODES, default=DEFAULT_COMBO_FORMULA_MODE,
+        help="how combo columns K–O are written (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-j", "--parse-workers", type=int, default=None,
+        help="processes for parsing several Sales/Return files (default: CPU count)",
+    )
+    parser.add_argument(
+        "--json-style", choices=GSTR1_JSON_STYLES, default=DEFAULT_GSTR1_JSON_STYLE,
+        help="GSTR-1 JSON layout: indented or compact for upload (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--bundle", action="store_true",
+        help="write one ZIP with the four reports and a manifest instead of four files",
+    )
+    parser.add_argument("--run-record", metavar="PATH", help="write the per-stage run record (JSON) here")
+    parser.add_argument(
+        "--profile", metavar="PATH",
+        help="profile the run (cProfile + tracemalloc, slower) and write the dumps to this ZIP",
+    )
+    args = parser.parse_args(argv)
+
+    recorder = RunRecorder(profile=bool(args.profile))
+    bundle_file = None
+    try:
+        try:
+            if args.bundle:
+                # Named once the header is read; renamed into place only when complete
+                os.makedirs(args.output, exist_ok=True)
+                bundle_file = tempfile.NamedTemporaryFile(dir=args.output, suffix=".zip.tmp", delete=False)
+            with open(args.zip_path, "rb") as zip_file:
+                results = generate_reports(
+                    zip_file, streaming=args.low_memory, formula_mode=args.formula_mode,
+                    parse_workers=args.parse_workers, recorder=recorder, json_style=args.json_style,
+                    bundle=None if bundle_file is None else ReportBundleWriter(bundle_file),
+                )
+            if bundle_file is not None:
+                bundle_file.close()
+                bundle_path = os.path.join(args.output, bundle_name(results["file_name"]))
+                os.replace(bundle_file.name, bundle_path)
+                bundle_file = None
+        finally:
+            if bundle_file is not None:
+                bundle_file.close()
+                with contextlib.suppress(OSError):
+                    os.remove(bundle_file.name)
+            # Written for failed runs too: that is when the record is most useful
+            if args.run_record:
+                with open(args.run_record, "w", encoding="utf-8") as f:
+                    json.dump(recorder.record(), f, indent=2)
+            if args.profile and recorder.profile_files:
+                with open(args.profile, "wb") as f:
+                    f.write(recorder.profile_archive())
+    except (OSError, ReportError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+
+    for message in results["warnings"]:
+        print(f"warning: {message}", file=sys.stderr)
+    if args.bundle:
+        print(bundle_path)
+        return 0
+    for path in write_reports(results, args.output):
+        print(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
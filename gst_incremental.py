@@ -0,0 +1,297 @@
+"""
+Incremental (intra-month) mode for the GSTR-1 report generator.
+
+Meesho deliveries for a GSTIN / period can arrive several times a month. Each delta
+ZIP is added to a store for its GSTIN / period that keeps the running
+POS × HSN × rate sums and the order numbers already ingested, so the B2CS / HSN
+CSVs and the GSTR-1 JSON can be produced at any point without re-reading the month:
+
+    python gst_incremental.py add week1.zip week2.zip --store gstr1_store/
+    python gst_incremental.py emit 27ABCDE1234F1Z5 062025 --store gstr1_store/ -o reports/
+    python gst_incremental.py status --store gstr1_store/
+
+    gstr1_store/<GSTIN>/<MMYYYY>.sqlite
+
+A row is keyed on its order number and Sale/Return (rows without an order number on a
+digest of their values) plus how many rows before it in the same delta share that key.
+Rows an earlier delta already added (overlapping exports) are skipped; rows repeated
+within one delta are all counted, as the full-month run counts them. A delta ZIP that
+was already added is skipped as a whole. Adding a delta costs time in proportion
+to the delta; emitting costs time in proportion to the number of groups. The combo
+workbook lists every row, so it is not produced here: run the full month through the
+app or gst_core.py for it.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import gst_core as gst
+
+DEFAULT_STORE_DIR = "gstr1_store"
+STORE_FORMAT = 5  # bump when the stored cube state or row keys change shape (5: float64 fallback sums)
+# Values a row without an order number is identified by (their digest is its key)
+ROW_DIGEST_COLUMNS = ["order_date", "hsn_code", "gst_rate", "tcs_taxable_amount", "end_customer_state_new", "QTY", "TYPE"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS row_keys (
+    key        TEXT NOT NULL,
+    occurrence INTEGER NOT NULL,
+    PRIMARY KEY (key, occurrence)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS deltas (
+    digest     TEXT PRIMARY KEY,
+    name       TEXT,
+    added_at   REAL,
+    rows_read  INTEGER,
+    rows_added INTEGER,
+    duplicates INTEGER
+);
+CREATE TABLE IF NOT EXISTS cube (
+    id     INTEGER PRIMARY KEY CHECK (id = 1),
+    format INTEGER NOT NULL,
+    state  TEXT NOT NULL
+);
+"""
+
+
+# ============================================================
+#  ROW KEYS
+# ============================================================
+def row_keys(frame):
+    """
+    (keys, occurrences) of the rows of a read_export() frame, as lists. The key is
+    "order:<order number>:<type>", or "row:<digest of ROW_DIGEST_COLUMNS>" for a row
+    without an order number; occurrence counts the earlier rows of the frame with the
+    same key, so identical rows within one delta stay distinct.
+    """
+    order_num = frame["order_num"]
+    has_order = order_num.notna().to_numpy()
+    keys = np.empty(len(frame), dtype=object)
+    keys[has_order] = ("order:" + order_num[has_order].astype(str) + ":" + frame["TYPE"][has_order].astype(str)).to_numpy()
+    if not has_order.all():
+        digests = pd.util.hash_pandas_object(_canonical_rows(frame.loc[~has_order, ROW_DIGEST_COLUMNS]), index=False)
+        keys[~has_order] = [f"row:{digest:016x}" for digest in digests.tolist()]
+    occurrence = pd.Series(keys).groupby(keys, sort=False).cumcount()
+    return keys.tolist(), occurrence.tolist()
+
+def _canonical_rows(frame):
+    """The columns in one dtype per kind, so a row digests alike from CSV and xlsx reads."""
+    columns = {}
+    for name, column in frame.items():
+        if pd.api.types.is_datetime64_any_dtype(column):
+            columns[name] = column.astype("datetime64[ns]").astype("int64")
+        elif pd.api.types.is_numeric_dtype(column):
+            columns[name] = column.astype("float64")
+        else:
+            columns[name] = column.astype(object).map(lambda value: None if pd.isna(value) else str(value))
+    return pd.DataFrame(columns)
+
+
+# ============================================================
+#  STORE
+# ============================================================
+class IncrementalStore:
+    """
+    Running aggregates of one GSTIN / period in a SQLite file. Each delta is added
+    in a single IMMEDIATE transaction, so concurrent writers to the same store are
+    serialised and a failed delta leaves the store unchanged.
+    """
+
+    def __init__(self, store_dir, gstin, fp, create=True):
+        self.gstin = gstin
+        self.fp = fp
+        self.path = os.path.join(store_dir, gstin, f"{fp}.sqlite")
+        if not create and not os.path.isfile(self.path):
+            raise gst.ReportError(f"No deltas have been added for {gstin} {fp} in {store_dir}.")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # --- cube ------------------------------------------------------------
+    def _load_cube(self):
+        row = self._db.execute("SELECT format, state FROM cube WHERE id = 1").fetchone()
+        if row is None:
+            return gst.GSTAggregationCube()
+        if row[0] != STORE_FORMAT:
+            raise gst.ReportError(
+                f"Store {self.path} was written by an incompatible version (format {row[0]}); "
+                "start a new store and add the deltas again."
+            )
+        return gst.GSTAggregationCube.from_state(json.loads(row[1]))
+
+    def _save_cube(self, cube):
+        self._db.execute(
+            "INSERT OR REPLACE INTO cube (id, format, state) VALUES (1, ?, ?)",
+            (STORE_FORMAT, json.dumps(cube.state())),
+        )
+
+    # --- deltas ----------------------------------------------------------
+    def _new_rows(self, frame):
+        """Mask of rows whose (key, occurrence) is not in the store (see row_keys)."""
+        keys, occurrence = row_keys(frame)
+        self._db.execute("CREATE TEMP TABLE IF NOT EXISTS delta_keys (pos INTEGER, key TEXT, occurrence INTEGER)")
+        self._db.execute("DELETE FROM delta_keys")
+        self._db.executemany("INSERT INTO delta_keys VALUES (?, ?, ?)", zip(range(len(keys)), keys, occurrence))
+        seen = [
+            pos for (pos,) in self._db.execute(
+                "SELECT d.pos FROM delta_keys d JOIN row_keys r ON r.key = d.key AND r.occurrence = d.occurrence"
+            )
+        ]
+        new = np.ones(len(frame), dtype=bool)
+        new[seen] = False
+        self._db.execute("INSERT OR IGNORE INTO row_keys (key, occurrence) SELECT key, occurrence FROM delta_keys")
+        return new
+
+    def add(self, export, digest, name):
+        """
+        Adds the rows of one read_export() result; returns its manifest entry.
+        digest identifies the delta file, so the same file is never counted twice.
+        """
+        frame = export["frame"]
+        entry = {"delta": name, "gstin": self.gstin, "fp": self.fp, "rows_read": len(frame)}
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            if self._db.execute("SELECT 1 FROM deltas WHERE digest = ?", (digest,)).fetchone():
+                self._db.execute("ROLLBACK")
+                entry.update(status="skipped", rows_added=0, duplicates=len(frame))
+                return entry
+
+            cube = self._load_cube()  # first: rejects a store of another format before its tables are touched
+            new = self._new_rows(frame)
+            taxed = gst.calculate_tax_components(frame[new], export["default_state_code_numeric"])
+            cube.update(taxed)
+            self._save_cube(cube)
+
+            entry.update(status="added", rows_added=int(new.sum()), duplicates=int(len(frame) - new.sum()))
+            self._db.execute(
+                "INSERT INTO deltas VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, name, time.time(), entry["rows_read"], entry["rows_added"], entry["duplicates"]),
+            )
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        return entry
+
+    def reports(self, json_style=gst.DEFAULT_GSTR1_JSON_STYLE):
+        """The B2CS CSV, HSN CSV and GSTR-1 JSON of everything added so far."""
+        return gst.summary_reports(self._load_cube(), self.gstin, self.fp, json_style)
+
+    def status(self):
+        deltas, rows = self._db.execute("SELECT COUNT(*), COALESCE(SUM(rows_added), 0) FROM deltas").fetchone()
+        return {"gstin": self.gstin, "fp": self.fp, "deltas": deltas, "rows": rows, "path": self.path}
+
+
+def add_delta(zip_path, store_dir=DEFAULT_STORE_DIR, parse_workers=None):
+    """Reads one delta ZIP and adds it to the store of its GSTIN / period; returns the manifest entry."""
+    with open(zip_path, "rb") as zip_file:
+        digest = gst.content_digest(zip_file)
+        export = gst.read_export(zip_file, parse_workers=parse_workers)
+    with IncrementalStore(store_dir, export["dynamic_gstin"], export["dynamic_fp"]) as store:
+        entry = store.add(export, digest, os.path.basename(zip_path))
+    entry["warnings"] = export["warnings"]
+    return entry
+
+def emit_reports(gstin, fp, store_dir=DEFAULT_STORE_DIR, output_dir=".", json_style=gst.DEFAULT_GSTR1_JSON_STYLE):
+    """Writes the current B2CS CSV, HSN CSV and GSTR-1 JSON of a store; returns their paths."""
+    with IncrementalStore(store_dir, gstin, fp, create=False) as store:
+        results = store.reports(json_style)
+    base_name = f"{gstin}_{fp[:2]}_{fp[2:]}_GSTR1"
+    files = {
+        "B2CS_Summary_Report.csv": results["b2cs_result"],
+        "HSN_Summary_Report.csv": results["hsn_result"],
+        f"{base_name}_GSTR1.json": results["json_result"], # named like the app's download
+    }
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for name, content in files.items():
+        path = os.path.join(output_dir, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        paths.append(path)
+    return paths
+
+def list_stores(store_dir=DEFAULT_STORE_DIR):
+    """status() of every store under store_dir, sorted by GSTIN and period."""
+    stores = []
+    if not os.path.isdir(store_dir):
+        return stores
+    for gstin in sorted(os.listdir(store_dir)):
+        gstin_dir = os.path.join(store_dir, gstin)
+        if not os.path.isdir(gstin_dir):
+            continue
+        for name in sorted(os.listdir(gstin_dir)):
+            if name.endswith(".sqlite"):
+                with IncrementalStore(store_dir, gstin, name[:-len(".sqlite")]) as store:
+                    stores.append(store.status())
+    return stores
+
+
+# ============================================================
+#  COMMAND LINE
+# ============================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Add GSTR-1 delta exports to running totals and emit the reports.")
+    parser.add_argument("--store", default=DEFAULT_STORE_DIR, help="store directory (default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="add delta ZIPs (in the order given)")
+    add.add_argument("zip_paths", nargs="+", help="delta ZIPs with Sales and/or Return exports")
+    emit = commands.add_parser("emit", help="write the current B2CS / HSN CSVs and GSTR-1 JSON")
+    emit.add_argument("gstin")
+    emit.add_argument("fp", help="period as MMYYYY")
+    emit.add_argument("-o", "--output", default=".", help="output directory (default: current directory)")
+    emit.add_argument(
+        "--json-style", choices=gst.GSTR1_JSON_STYLES, default=gst.DEFAULT_GSTR1_JSON_STYLE,
+        help="GSTR-1 JSON layout: indented or compact for upload (default: %(default)s)",
+    )
+    commands.add_parser("status", help="list the stores and what they hold")
+    args = parser.parse_args(argv)
+
+    if args.command == "add":
+        failed = 0
+        for zip_path in args.zip_paths:
+            try:
+                entry = add_delta(zip_path, args.store)
+            except (OSError, gst.ReportError) as e:
+                print(f"[failed] {zip_path}: {e}", file=sys.stderr)
+                failed += 1
+                continue
+            print(
+                f"[{entry['status']:>7}] {zip_path}  {entry['gstin']} {entry['fp']}  "
+                f"{entry['rows_added']:,} added, {entry['duplicates']:,} already present"
+            )
+        return 1 if failed else 0
+
+    if args.command == "emit":
+        try:
+            paths = emit_reports(args.gstin.strip().upper(), args.fp, args.store, args.output, args.json_style)
+        except (OSError, sqlite3.Error, gst.ReportError) as e:
+            print(f"error: {e}", file=sys.stderr)
+            return 1
+        for path in paths:
+            print(path)
+        return 0
+
+    for store in list_stores(args.store):
+        print(f"{store['gstin']} {store['fp']}  {store['deltas']} deltas, {store['rows']:,} rows  {store['path']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+"""
+Multi-period (QRMP quarterly) mode for the GSTR-1 report generator.
+
+Takes the monthly ZIPs of one GSTIN, reads them in parallel (one process per ZIP),
+reduces each month to its POS × HSN × rate cube and merges the cubes, never the
+rows, into quarter totals. Writes the B2CS CSV, HSN CSV and GSTR-1 JSON of every
+month and of every (Indian financial-year) quarter in one run:
+
+    python gst_periods.py apr.zip may.zip jun.zip -o reports/ -j 3
+
+    reports/<GSTIN>/
+        manifest.json
+        042025/  052025/  062025/      B2CS_Summary_Report.csv, HSN_Summary_Report.csv,
+                                       <GSTIN>_<MM>_<YYYY>_GSTR1_GSTR1.json
+        Q1_2025-26/                    B2CS_Summary_Report.csv, HSN_Summary_Report.csv,
+                                       <GSTIN>_Q1_2025-26_GSTR1.json (fp: the quarter's last month)
+
+The combo workbook lists every row, so it is not produced here: run each month
+through the app or gst_core.py for it.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+import zipfile
+import gst_core as gst
+
+MANIFEST_NAME = "manifest.json"
+QUARTER_START_MONTH = 4  # the financial year (and Q1) starts in April
+
+
+# ============================================================
+#  PERIODS
+# ============================================================
+def quarter_of(fp):
+    """(label, [MMYYYY of its three months]) of the financial-year quarter containing period fp."""
+    month, year = int(fp[:2]), int(fp[2:])
+    fy_start = year if month >= QUARTER_START_MONTH else year - 1
+    quarter = (month - QUARTER_START_MONTH) % 12 // 3 + 1
+    months = []
+    for offset in range(3):
+        index = QUARTER_START_MONTH - 1 + (quarter - 1) * 3 + offset  # months since January of fy_start
+        months.append(f"{index % 12 + 1:02d}{fy_start + index // 12}")
+    return f"Q{quarter}_{fy_start}-{(fy_start + 1) % 100:02d}", months
+
+def _period_order(fp):
+    return fp[2:], fp[:2]
+
+
+# ============================================================
+#  WORKER
+# ============================================================
+def read_period(source, name):
+    """
+    Reads one monthly ZIP (a path or a binary file object) in the current process and
+    reduces it to its GSTAggregationCube. Returns an entry with the cube; never raises.
+    """
+    started = time.perf_counter()
+    entry = {"zip": name, "status": "failed"}
+    try:
+        if _is_path(source):
+            with open(source, "rb") as zip_file:
+                export = gst.read_export(zip_file, parse_workers=1)
+        else:
+            source.seek(0)
+            export = gst.read_export(source, parse_workers=1)
+        taxed = gst.calculate_tax_components(export["frame"], export["default_state_code_numeric"])
+        cube = gst.GSTAggregationCube()
+        cube.update(taxed)
+        entry.update(
+            status="ok", gstin=export["dynamic_gstin"], fp=export["dynamic_fp"], rows=len(taxed),
+            warnings=export["warnings"], cube=cube,
+        )
+    except gst.ReportError as e:
+        entry["error"] = str(e)
+    except Exception as e:
+        entry["error"] = f"{type(e).__name__}: {e}"
+    entry["seconds"] = round(time.perf_counter() - started, 3)
+    return entry
+
+def _is_path(source):
+    return isinstance(source, (str, os.PathLike))
+
+
+# ============================================================
+#  MULTI-PERIOD RUN
+# ============================================================
+def run_periods(sources, workers=None, json_style=gst.DEFAULT_GSTR1_JSON_STYLE):
+    """
+    Builds the monthly and quarterly reports of several monthly ZIPs of one GSTIN.
+    sources is a list of (name, path or binary file object); paths are read in spawned
+    worker processes, file objects (which cannot be sent to one) here, one after another.
+    Returns {"gstin", "files", "manifest"}, files mapping the relative output path to its
+    bytes (manifest.json included).
+    Raises ReportError when a ZIP fails, the GSTINs differ or a month is given twice.
+    """
+    if not sources:
+        raise gst.ReportError("No monthly ZIPs were given.")
+    started = time.perf_counter()
+    paths = [i for i, (_, source) in enumerate(sources) if _is_path(source)]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(paths)))
+    entries = [None] * len(sources)
+    if workers == 1:
+        for i, (name, source) in enumerate(sources):
+            entries[i] = read_period(source, name)
+    else:
+        with gst.spawn_pool(workers) as pool:
+            futures = {i: pool.submit(read_period, sources[i][1], sources[i][0]) for i in paths}
+            for i, (name, source) in enumerate(sources):
+                if i not in futures:
+                    entries[i] = read_period(source, name)
+            for i, future in futures.items():
+                entries[i] = future.result()
+
+    failed = [entry for entry in entries if entry["status"] != "ok"]
+    if failed:
+        raise gst.ReportError(" ".join(f"'{entry['zip']}': {entry['error']}" for entry in failed))
+    gstins = sorted({entry["gstin"] for entry in entries})
+    if len(gstins) > 1:
+        raise gst.ReportError(f"The ZIPs belong to different GSTINs ({', '.join(gstins)}); run each GSTIN separately.")
+    months = {}
+    for entry in entries:
+        if entry["fp"] in months:
+            raise gst.ReportError(
+                f"'{months[entry['fp']]['zip']}' and '{entry['zip']}' are both for {entry['fp']}; "
+                "put a month's Sales / Return files in one ZIP."
+            )
+        months[entry["fp"]] = entry
+    gstin = gstins[0]
+
+    files = {}
+    manifest = {"gstin": gstin, "json_style": json_style, "months": [], "quarters": []}
+    quarters = {}
+    for fp in sorted(months, key=_period_order):
+        entry = months[fp]
+        cube = entry.pop("cube")
+        reports = gst.summary_reports(cube, gstin, fp, json_style)
+        files.update(_report_paths(fp, f"{gstin}_{fp[:2]}_{fp[2:]}_GSTR1_GSTR1.json", reports))
+        manifest["months"].append(entry)
+
+        label, quarter_months = quarter_of(fp)
+        if label not in quarters:
+            quarters[label] = {"label": label, "fp": quarter_months[-1], "months": [], "cube": gst.GSTAggregationCube()}
+        quarters[label]["months"].append(fp)
+        quarters[label]["cube"].merge(cube)
+
+    for label, quarter in quarters.items():
+        cube = quarter.pop("cube")
+        reports = gst.summary_reports(cube, gstin, quarter["fp"], json_style)
+        files.update(_report_paths(label, f"{gstin}_{label}_GSTR1.json", reports))
+        quarter["missing"] = [fp for fp in quarter_of(quarter["fp"])[1] if fp not in quarter["months"]]
+        manifest["quarters"].append(quarter)
+
+    manifest["seconds"] = round(time.perf_counter() - started, 3)
+    files[MANIFEST_NAME] = json.dumps(manifest, indent=2).encode("utf-8")
+    return {"gstin": gstin, "files": files, "manifest": manifest}
+
+def _report_paths(folder, json_name, reports):
+    return {
+        f"{folder}/B2CS_Summary_Report.csv": reports["b2cs_result"],
+        f"{folder}/HSN_Summary_Report.csv": reports["hsn_result"],
+        f"{folder}/{json_name}": reports["json_result"],
+    }
+
+def periods_bundle(result):
+    """The files of a run_periods result as one deflated ZIP (bytes), under <GSTIN>/."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as z:
+        for name, content in result["files"].items():
+            z.writestr(f"{result['gstin']}/{name}", content)
+    return buffer.getvalue()
+
+def write_periods(result, output_dir):
+    """Writes the files of a run_periods result under output_dir/<GSTIN>/; returns their paths."""
+    paths = []
+    for name, content in result["files"].items():
+        path = os.path.join(output_dir, result["gstin"], *name.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content)
+        paths.append(path)
+    return paths
+
+
+# ============================================================
+#  COMMAND LINE
+# ============================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monthly and quarterly GSTR-1 summaries from several monthly ZIPs.")
+    parser.add_argument("zip_paths", nargs="+", help="one ZIP per month, all for the same GSTIN")
+    parser.add_argument("-o", "--output", default="gstr1_reports", help="output directory (default: %(default)s)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument(
+        "--json-style", choices=gst.GSTR1_JSON_STYLES, default=gst.DEFAULT_GSTR1_JSON_STYLE,
+        help="GSTR-1 JSON layout: indented or compact for upload (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        result = run_periods(
+            [(os.path.basename(path), path) for path in args.zip_paths], args.workers, args.json_style
+        )
+        paths = write_periods(result, args.output)
+    except (OSError, gst.ReportError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+
+    manifest = result["manifest"]
+    for entry in manifest["months"]:
+        for message in entry["warnings"]:
+            print(f"warning: {entry['zip']}: {message}", file=sys.stderr)
+    for quarter in manifest["quarters"]:
+        if quarter["missing"]:
+            print(f"warning: {quarter['label']} is missing {', '.join(quarter['missing'])}", file=sys.stderr)
+    for path in paths:
+        print(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,22 @@
-import streamlit as st
-import pandas as pd
-import io
-import zipfile
-import requests
+import functools
+import importlib
 import json
-from openpyxl import load_workbook
-from openpyxl.utils.dataframe import dataframe_to_rows
+import os
+import shutil
+import tempfile
+import threading
+
+import streamlit as st
+
+# gst_core pulls in pandas/numpy/pyarrow (~0.5 s); it is imported off the first
+# paint and only waited for once a ZIP is uploaded. See load_core().
+CORE_MODULE = "gst_core"
+PERIODS_MODULE = "gst_periods"
+
+# Report bytes of a generate_reports result; the session keeps them only inside the bundle
+REPORT_KEYS = ("combo_result", "b2cs_result", "hsn_result", "json_result")
+# Session-state keys holding StoredArtifact handles (the bytes live in the session result store)
+ARTIFACT_KEYS = ("bundle_result", "profile_dump")
 
 # ============================================================
 #  CONFIGURATION & INITIALIZATION
@@ -19,477 +30,147 @@ st.set_page_config(
 )
 
 # Initialize Session State for persistent results and conditional rendering
-if 'combo_result' not in st.session_state:
-    st.session_state.combo_result = None
-    st.session_state.b2cs_result = None
-    st.session_state.hsn_result = None
-    st.session_state.json_result = None
+if 'bundle_result' not in st.session_state:
+    st.session_state.bundle_result = None
     st.session_state.file_name = None
     st.session_state.dynamic_gstin = "N/A"
     st.session_state.dynamic_fp = "N/A"
     st.session_state.default_state_code_numeric = "N/A"
+if 'memory_report' not in st.session_state:
+    st.session_state.memory_report = None
+if 'run_record' not in st.session_state:
+    st.session_state.run_record = None
+    st.session_state.profile_dump = None
+if 'periods_result' not in st.session_state:
+    st.session_state.periods_result = None
+    st.session_state.periods_manifest = None
+
+
+@st.cache_resource(show_spinner=False)
+def _warm_core():
+    """Imports gst_core and prepares the template/state tables in the background, once per process."""
+    def warm():
+        try:
+            core = importlib.import_module(CORE_MODULE)
+            core.get_state_normaliser()
+            core.get_template_provider().combo_template()
+        except Exception:
+            pass # load_core() / generate_reports() surface real failures to the user
+    thread = threading.Thread(target=warm, name="gst-core-warmup", daemon=True)
+    thread.start()
+    return thread
+
+def load_core():
+    """Returns the gst_core module (blocks only while the background import is still running)."""
+    return importlib.import_module(CORE_MODULE)
+
+_warm_core()
 
 
 # ============================================================
-#  GLOBAL MAPPING & CONSTANTS
+#  REPORT GENERATION (see gst_core.py)
 # ============================================================
-GITHUB_TEMPLATE_URL = "https://raw.githubusercontent.com/Biswa-hack/Messo_GST/main/MESSO%20GST%20Template.xlsx"
-
-COLUMN_MAPPING = {
-    'order_date': 'order_date',
-    'sub_order_num': 'order_num',
-    'hsn_code': 'hsn_code',
-    'gst_rate': 'gst_rate',
-    'total_taxable_sale_value': 'tcs_taxable_amount',
-    'end_customer_state_new': 'end_customer_state_new',
-    'quantity': 'QTY'
-}
-
-WRITE_COL_ORDER = [
-    'order_date',             # B
-    'order_num',              # C
-    'hsn_code',               # D
-    'gst_rate',               # E
-    'tcs_taxable_amount',     # F
-    'end_customer_state_new', # G
-    'TYPE',                   # H
-    'QTY'                     # I
-]
-
-STATE_MAPPING = {
-    "Jammu And Kashmir": "01-Jammu & Kashmir", "Jammu & Kashmir": "01-Jammu & Kashmir",
-    "Himachal Pradesh": "02-Himachal Pradesh", "Punjab": "03-Punjab",
-    "Chandigarh": "04-Chandigarh", "Uttarakhand": "05-Uttarakhand",
-    "Haryana": "06-Haryana", "Delhi": "07-Delhi",
-    "Rajasthan": "08-Rajasthan", "Uttar Pradesh": "09-Uttar Pradesh",
-    "Bihar": "10-Bihar", "Sikkim": "11-Sikkim",
-    "Arunachal Pradesh": "12-Arunachal Pradesh", "Nagaland": "13-Nagaland",
-    "Manipur": "14-Manipur", "Mizoram": "15-Mizoram",
-    "Tripura": "16-Tripura", "Megalaya": "17-Meghalaya",
-    "Meghalaya": "17-Meghalaya", "Assam": "18-Assam",
-    "West Bengal": "19-West Bengal", "Jharkhand": "20-Jharkhand",
-    "Odisha": "21-Odisha", "Chhattisgarh": "22-Chhattisgarh",
-    "Madhya Pradesh": "23-Madhya Pradesh", "Gujarat": "24-Gujarat",
-    "Daman And Diu": "25-Daman & Diu", "Daman & Diu": "25-Daman & Diu",
-    "The Dadra And Nagar Haveli And Daman And Diu": "26-Dadra & Nagar Haveli & Daman & Diu",
-    "Dadra & Nagar Haveli & Daman & Diu": "26-Dadra & Nagar Haveli & Daman & Diu",
-    "Dadra And Nagar Haveli": "26-Dadra & Nagar Haveli & Daman & Diu",
-    "Maharashtra": "27-Maharashtra", "Karnataka": "29-Karnataka",
-    "Goa": "30-Goa", "Lakshadweep": "31-Lakshdweep",
-    "Kerala": "32-Kerala", "Tamil Nadu": "33-Tamil Nadu",
-    "Pondicherry": "34-Puducherry", "Puducherry": "34-Puducherry",
-    "Andaman And Nico.In.": "35-Andaman & Nicobar Islands",
-    "Andaman And Nicobar Islands": "35-Andaman & Nicobar Islands",
-    "Andaman & Nicobar Islands": "35-Andaman & Nicobar Islands",
-    "Telangana": "36-Telangana", "Andhra Pradesh": "37-Andhra Pradesh",
-    "Ladakh": "38-Ladakh", "Other Territory": "97-Other Territory",
-    "Orissa": "21-Odisha",
-  "ORISSA": "21-Odisha",
-  "Andaman & Nicobar": "35-Andaman & Nicobar Islands",
-  "ANDAMAN & NICOBAR": "35-Andaman & Nicobar Islands"
-}
-
-
-# ============================================================
-#  HELPER FUNCTIONS
-# ============================================================
-def load_template_from_github():
-    """Downloads the Excel template from the specified GitHub URL."""
-    r = requests.get(GITHUB_TEMPLATE_URL)
-    if r.status_code != 200:
-        st.error("❌ Could not download template from GitHub. Status Code: " + str(r.status_code))
-        return None
-    return io.BytesIO(r.content)
-
-def process_file(file_data, data_type):
-    """Reads Excel, renames columns, and adjusts values for Sales/Return."""
-    df = pd.read_excel(file_data)
-    df_processed = df.rename(columns=COLUMN_MAPPING)
-
-    # Filter and create the final DataFrame with required columns
-    df_final = df_processed[list(COLUMN_MAPPING.values())].copy()
-    df_final["TYPE"] = data_type
-
-    df_final["tcs_taxable_amount"] = pd.to_numeric(df_final["tcs_taxable_amount"], errors="coerce")
-    df_final["QTY"] = pd.to_numeric(df_final["QTY"], errors="coerce")
-
-    # Apply sign convention based on data type
-    if data_type == "Return":
-        df_final["tcs_taxable_amount"] = df_final["tcs_taxable_amount"].abs() * -1
-        df_final["QTY"] = df_final["QTY"].abs() * -1
-    else:
-        df_final["tcs_taxable_amount"] = df_final["tcs_taxable_amount"].abs()
-        df_final["QTY"] = df_final["QTY"].abs()
-
-    return df_final
-
-def calculate_tax_components(df, supplier_state_code_numeric):
+def release_artifacts(keys=ARTIFACT_KEYS):
+    """Discards this session's stored bundle and profile dump (or the artifacts under `keys`)."""
+    for key in keys:
+        if st.session_state.get(key) is not None:
+            st.session_state[key].release()
+        st.session_state[key] = None
+
+def error_markdown(error):
+    """The message of a ReportError with its emphasised phrases in bold."""
+    message = str(error)
+    for phrase in getattr(error, "emphasis", ()):
+        message = message.replace(phrase, f"**{phrase}**", 1)
+    return message
+
+def stored_download(artifact, name=None):
+    """Bytes of a stored artifact, or of the file `name` in a stored bundle; for deferred downloads."""
+    content = artifact.get()
+    if content is None:
+        raise load_core().ReportError("These results were cleared from the server; generate them again.")
+    return content if name is None else load_core().read_bundle_member(content, name)
+
+def process_zip_and_combine_data(zip_file, streaming=False, formula_mode=None, profile=False, json_style=None):
     """
-    Calculates CGST, SGST, IGST based on the dynamically provided supplier state code.
+    Runs generate_reports for the UI: shows errors and warnings, saves the outputs to
+    session state. The run record (and profile dump) is kept for failed runs too.
+    The four reports are written, as the run produces them, into one ZIP bundle (with
+    a manifest) in the session result store; session state holds only its handle and
+    the small metadata.
     """
-    df_taxed = df.copy()
-    
-    # J_mapped starts with the state code (e.g., '27-Maharashtra'). Extract the numeric code.
-    df_taxed["customer_state_code_numeric"] = df_taxed["J_mapped"].str[:2]
-    
-    # Check if Place of Supply is the same as Supplier State Code (Intra-State)
-    is_intra_state = df_taxed["customer_state_code_numeric"] == supplier_state_code_numeric
-    
-    df_taxed["gst_rate"] = pd.to_numeric(df_taxed["gst_rate"], errors='coerce').fillna(0)
-    
-    total_tax_rate = df_taxed["gst_rate"] / 100
-    total_tax = df_taxed["tcs_taxable_amount"] * total_tax_rate
-    
-    # Use where() for conditional assignment (0 if not applicable)
-    df_taxed["CGST"] = total_tax.where(is_intra_state, 0) / 2
-    df_taxed["SGST"] = total_tax.where(is_intra_state, 0) / 2
-    df_taxed["IGST"] = total_tax.where(~is_intra_state, 0)
-    
-    df_taxed["Total Tax"] = df_taxed["CGST"] + df_taxed["SGST"] + df_taxed["IGST"]
-    df_taxed["Total Value"] = df_taxed["tcs_taxable_amount"] + df_taxed["Total Tax"]
-    
-    return df_taxed
-
-def generate_combo_excel(df_merged, template_stream):
-    """Fills the raw data into the Excel template and returns the bytes."""
-    
-    # template_stream is a BytesIO object, need to load workbook from it
-    wb = load_workbook(template_stream)
-    ws = wb["raw"]
-
-    # Clear old data (clear up to 1000 rows for safety/performance)
-    for row in range(3, 1003): 
-        for col in range(1, 16):
-            if ws.cell(row=row, column=col).value is not None:
-                ws.cell(row=row, column=col).value = None
-            else:
-                break 
-
-    start_row = 3
-    num_rows = len(df_merged)
-    
-    template_output = io.BytesIO()
-    
-    if num_rows == 0:
-        # If no data, return empty excel content
-        wb.save(template_output)
-        return template_output.getvalue()
-
-    # 1. Prepare DataFrame for insertion
-    # Ensure all required columns exist and reset index for safe positional access
-    required_cols = WRITE_COL_ORDER + ["J_mapped"]
-    write_df = df_merged.copy()
-    
-    # Check if any required column is missing before proceeding
-    missing_cols = [col for col in required_cols if col not in write_df.columns]
-    if missing_cols:
-        st.error(f"❌ Internal Error: Missing columns {missing_cols} needed for Excel generation.")
-        return template_output.getvalue() # Return empty content
-
-    write_df = write_df[required_cols].reset_index(drop=True)
-    
-    # Extract the mapped states separately for column J insertion
-    mapped_states = write_df["J_mapped"]
-    
-    # Insert B → I
-    data_for_b_to_i = write_df[WRITE_COL_ORDER]
-    
-    for r_idx, row in enumerate(dataframe_to_rows(data_for_b_to_i, index=False, header=False)):
-        if r_idx < num_rows: 
-            for c_idx, value in enumerate(row):
-                # Columns B (2) through I (9)
-                ws.cell(start_row + r_idx, 2 + c_idx).value = value
-
-    # 2. Insert Column A = Messo & Column J (Mapped State Code)
-    for r in range(num_rows):
-        excel_row = start_row + r
-        
-        # Access mapped state directly from the extracted Series/Column
-        mapped_state = mapped_states.loc[r]
-        
-        ws.cell(excel_row, 1).value = "Messo"
-        ws.cell(excel_row, 10).value = mapped_state # Column J
-
-        # 3. Insert formulas K–O (Assuming $X$22 in the template holds the full state code string)
-        ws.cell(excel_row, 11).value = f'=IF(J{excel_row}=$X$22,F{excel_row}*E{excel_row}/100/2,0)'
-        ws.cell(excel_row, 12).value = f'=IF(J{excel_row}=$X$22,F{excel_row}*E{excel_row}/100/2,0)'
-        ws.cell(excel_row, 13).value = f'=IF(J{excel_row}<>$X$22,F{excel_row}*E{excel_row}/100,0)'
-        ws.cell(excel_row, 14).value = f'=K{excel_row}+L{excel_row}+M{excel_row}+F{excel_row}'
-        ws.cell(excel_row, 15).value = f'=(K{excel_row}+L{excel_row}+M{excel_row})/F{excel_row}'
-
-    wb.save(template_output)
-    return template_output.getvalue()
-
-
-# ============================================================
-#  SUMMARY GENERATION FUNCTIONS
-# ============================================================
-
-def generate_b2cs_csv(df_merged_taxed):
-    """Generates the GSTR-1 B2CS (Table 7) summary in CSV format."""
-    
-    summary_df = df_merged_taxed.groupby(["J_mapped", "gst_rate"]).agg(
-        Taxable_Value=('tcs_taxable_amount', 'sum')
-    ).reset_index()
-
-    summary_df['Type'] = 'OE'
-    summary_df['Place Of Supply'] = summary_df['J_mapped']
-    summary_df['Rate'] = summary_df['gst_rate']
-    summary_df['Applicable % of Tax Rate'] = ''
-    summary_df['Cess Amount'] = 0.0
-    summary_df['E-Commerce GSTIN'] = ''
-    
-    final_b2cs_df = summary_df[[
-        'Type', 'Place Of Supply', 'Rate', 'Applicable % of Tax Rate',
-        'Taxable_Value', 'Cess Amount', 'E-Commerce GSTIN'
-    ]].rename(columns={'Taxable_Value': 'Taxable Value'})
-    
-    csv_output = final_b2cs_df.to_csv(index=False).encode('utf-8')
-    return csv_output
-
-def generate_hsn_summary(df_merged_taxed):
-    """Generates the GSTR-1 HSN Summary (Table 12) in CSV format."""
-
-    summary_df = df_merged_taxed.groupby(["hsn_code", "gst_rate"]).agg(
-        Total_Quantity=('QTY', 'sum'),
-        Total_Value=('Total Value', 'sum'),
-        Total_Taxable_Value=('tcs_taxable_amount', 'sum'),
-        Integrated_Tax_Amount=('IGST', 'sum'),
-        Central_Tax_Amount=('CGST', 'sum'),
-        State_UT_Tax_Amount=('SGST', 'sum')
-    ).reset_index()
-
-    summary_df['Description'] = ''
-    summary_df['UQC'] = 'NOS-NUMBERS'
-    summary_df['Cess Amount'] = 0.0
-
-    final_hsn_df = summary_df[[
-        'hsn_code', 'Description', 'UQC', 'Total_Quantity',
-        'Total_Value', 'Total_Taxable_Value', 'Integrated_Tax_Amount',
-        'Central_Tax_Amount', 'State_UT_Tax_Amount', 'Cess Amount', 'gst_rate'
-    ]].rename(columns={
-        'hsn_code': 'HSN',
-        'Total_Quantity': 'Total Quantity',
-        'Total_Value': 'Total Value',
-        'Total_Taxable_Value': 'Taxable Value',
-        'Integrated_Tax_Amount': 'Integrated Tax Amount',
-        'Central_Tax_Amount': 'Central Tax Amount',
-        'State_UT_Tax_Amount': 'State/UT Tax Amount',
-        'gst_rate': 'Rate'
-    })
-    
-    # Convert to CSV
-    csv_output = final_hsn_df.to_csv(index=False).encode('utf-8')
-    return csv_output
-
+    core = load_core()
+    store = core.get_session_result_store()
+    release_artifacts()
+    recorder = core.RunRecorder(profile=profile)
+    bundle_writer = store.writer()
+    try:
+        results = core.generate_reports(
+            zip_file, streaming=streaming, formula_mode=formula_mode or core.DEFAULT_COMBO_FORMULA_MODE,
+            cache=core.get_result_cache(), member_cache=core.get_member_cache(), recorder=recorder,
+            json_style=json_style or core.DEFAULT_GSTR1_JSON_STYLE, bundle=core.ReportBundleWriter(bundle_writer.file),
+        )
+    except core.ReportError as e:
+        bundle_writer.discard()
+        st.error(f"❌ {error_markdown(e)}")
+        return False
+    except BaseException:
+        bundle_writer.discard()
+        raise
+    finally:
+        profile_dump = recorder.profile_archive()
+        st.session_state.update(
+            run_record=recorder.record(), profile_dump=None if profile_dump is None else store.keep(profile_dump)
+        )
 
-def generate_gstr1_json(df_merged_taxed, dynamic_gstin, dynamic_fp, supplier_state_code_numeric):
-    """
-    Generates the GSTR-1 JSON file structure (Table 7 B2CS and Table 12 HSN)
-    using the strict schema required by the GST portal (based on user feedback).
-    """
-    
-    # --- 1. B2CS JSON Structure (Table 7) - FLATTENED ---
-    # Group by POS and Rate
-    b2cs_grouped = df_merged_taxed.groupby(['J_mapped', 'gst_rate'])
-
-    b2cs_json_list = []
-    for (pos_name, rate), group in b2cs_grouped:
-        
-        pos_code_only = pos_name[:2] # State Code from 'XX-State Name'
-        
-        group_txval = group['tcs_taxable_amount'].sum()
-        group_iamt = group['IGST'].sum()
-        group_camt = group['CGST'].sum()
-        group_samt = group['SGST'].sum()
-
-        # Skip if Taxable Value is very close to zero
-        if abs(group_txval) < 0.005: continue
-            
-        # Determine Supply Type (sply_ty): INTRA if POS is same as Supplier State Code, else INTER
-        if pos_code_only == supplier_state_code_numeric:
-            supply_type = "INTRA"
-        else:
-            supply_type = "INTER"
-        
-        # Build the B2CS transaction object (FLAT STRUCTURE REQUIRED BY PORTAL)
-        b2cs_entry = {
-            "sply_ty": supply_type,
-            "rt": int(rate),
-            "typ": "OE", # Other than E-Commerce
-            "pos": pos_code_only,
-            "txval": round(group_txval, 2),
-            "iamt": round(group_iamt, 2),
-            "camt": round(group_camt, 2),
-            "samt": round(group_samt, 2),
-            "csamt": 0.0
-        }
-        b2cs_json_list.append(b2cs_entry)
-
-
-    # --- 2. HSN Summary JSON Structure (Table 12) ---
-    hsn_grouped = df_merged_taxed.groupby(['hsn_code', 'gst_rate']).agg(
-        qty=('QTY', 'sum'),
-        txval=('tcs_taxable_amount', 'sum'),
-        iamt=('IGST', 'sum'),
-        camt=('CGST', 'sum'),
-        samt=('SGST', 'sum')
-    ).reset_index()
-    
-    hsn_data_list = []
-    num_counter = 1
-    for index, row in hsn_grouped.iterrows():
-        # Ensure HSN and Rate are valid before adding
-        if pd.notna(row['hsn_code']) and str(row['hsn_code']).strip() and row['gst_rate'] > 0:
-            hsn_entry = {
-                "num": num_counter,
-                "hsn_sc": str(int(row['hsn_code'])),
-                "desc": "", 
-                "uqc": "NOS-NUMBERS", # Changed from 'NOS-NUMBERS' to 'NOS' to match working sample
-                "qty": round(row['qty'], 3),
-                # Removed 'val' (Total Value) as per working sample
-                "txval": round(row['txval'], 2),
-                "iamt": round(row['iamt'], 2),
-                "camt": round(row['camt'], 2),
-                "samt": round(row['samt'], 2),
-                "csamt": 0.0,
-                "rt": int(row['gst_rate']),
-            }
-            hsn_data_list.append(hsn_entry)
-            num_counter += 1
-
-    # --- 3. Combine into Final GSTR-1 JSON Structure ---
-    
-    gstr1_json_output = {
-        "gstin": dynamic_gstin,
-        "fp": dynamic_fp,
-        "version": "GST3.2.3", # Mandatory field added
-        "hash": "hash", # Mandatory field added (placeholder)
-        # Removed 'gt' and 'cur_gt' to match working sample
-        "b2cs": b2cs_json_list,
-        "hsn": {
-            "hsn_b2c": hsn_data_list # Key changed from 'data' to 'hsn_b2c'
-        }
-    }
+    # 7. Save outputs to session state
+    st.session_state.bundle_result = bundle_writer.commit()
+    for message in results.pop("warnings"):
+        st.warning(f"⚠️ {message}")
+    for key in REPORT_KEYS:
+        del results[key]
+    st.session_state.update(results)
     
-    # Use standard json.dumps for strict compliance
-    return json.dumps(gstr1_json_output, indent=4).encode('utf-8')
-
+    return True
 
-# ============================================================
-#  MAIN ZIP PROCESSOR
-# ============================================================
-def process_zip_and_combine_data(zip_file):
+def process_period_zips(zip_files, json_style=None):
     """
-    Extracts, processes, merges data, fills the Excel template, and generates reports.
-    Sales file is mandatory for configuration; Return file is optional.
+    Runs gst_periods.run_periods for the UI over several monthly ZIPs: shows errors and
+    quarter gaps, keeps the monthly + quarterly summaries as one stored ZIP.
     """
-    sales_data_bytes = None
-    return_data_bytes = None
-
-    # 1. Extract file streams from ZIP
+    core = load_core()
+    periods = importlib.import_module(PERIODS_MODULE)
+    release_artifacts(("periods_result",))
+    st.session_state.periods_manifest = None
     try:
-        with zipfile.ZipFile(io.BytesIO(zip_file.read())) as z:
-            for name in z.namelist():
-                if name.endswith((".xlsx", ".xls")):
-                    if "return" in name.lower() or "rtn" in name.lower():
-                        return_data_bytes = z.read(name)
-                    elif "sale" in name.lower() or "sls" in name.lower() or "invoice" in name.lower():
-                        sales_data_bytes = z.read(name)
-    except zipfile.BadZipFile:
-        st.error("❌ Invalid or corrupted ZIP file.")
+        # Each upload is copied to a scratch file in turn, so the worker processes get a
+        # path to open rather than every month's bytes at once.
+        with tempfile.TemporaryDirectory(prefix="gstr1-periods-") as scratch:
+            sources = []
+            for i, zip_file in enumerate(zip_files):
+                path = os.path.join(scratch, f"{i}.zip")
+                zip_file.seek(0)
+                with open(path, "wb") as f:
+                    shutil.copyfileobj(zip_file, f)
+                sources.append((zip_file.name, path))
+            result = periods.run_periods(sources, json_style=json_style or core.DEFAULT_GSTR1_JSON_STYLE)
+    except OSError as e:
+        st.error(f"❌ Could not stage the uploaded ZIPs: {e}")
         return False
-        
-    # **Sales file is mandatory for configuration (GSTIN/FP)**
-    if not sales_data_bytes:
-        st.error("❌ The **Sales file** is mandatory as it contains the required configuration data (GSTIN in C2, Month/Year in P2/O2) needed for processing and file naming.")
-        return False
-
-    sales_data_stream = io.BytesIO(sales_data_bytes)
-
-    # 1a. Extract GSTIN and Reporting Period (C2, P2, O2)
-    try:
-        wb_sales = load_workbook(sales_data_stream)
-        ws_sales = wb_sales.active
-        
-        dynamic_gstin = str(ws_sales['C2'].value).strip() if ws_sales['C2'].value is not None else None
-        reporting_month = ws_sales['P2'].value
-        reporting_year = ws_sales['O2'].value
-
-        sales_data_stream.seek(0) # Reset stream pointer for pandas processing below
-        
-        if not (dynamic_gstin and len(dynamic_gstin) == 15):
-             st.error("❌ GSTIN in C2 is invalid or missing.")
-             return False
-        if not (reporting_month and reporting_year):
-            st.error("❌ Reporting Month (P2) or Year (O2) is missing.")
-            return False
-        
-        # Format FP and Filename
-        month_str = str(reporting_month).zfill(2)
-        year_str = str(reporting_year)
-        if len(year_str) == 2:
-            year_str = '20' + year_str
-        
-        dynamic_fp = f"{month_str}{year_str}"
-        dynamic_filename = f"{dynamic_gstin}_{month_str}_{year_str}_GSTR1.xlsx"
-        default_state_code_numeric = dynamic_gstin[:2]
-        
-    except Exception as e:
-        st.error(f"❌ Error extracting header data from Sales file (C2, P2, O2): {e}")
-        return False
-
-    # 2. Process DataFrames
-    try:
-        df_sales = process_file(sales_data_stream, "Sale")
-        
-        # Handle optional Returns file
-        if return_data_bytes:
-            return_data_stream = io.BytesIO(return_data_bytes)
-            df_returns = process_file(return_data_stream, "Return")
-        else:
-            st.warning("⚠️ Return file not found in ZIP. Processing Sales data only.")
-            # Create an empty DataFrame with the expected structure for safe concatenation
-            expected_cols = list(COLUMN_MAPPING.values()) + ["TYPE"]
-            df_returns = pd.DataFrame(columns=expected_cols)
-
-    except Exception as e:
-        st.error(f"❌ Error processing input files: {e}")
-        return False
-        
-    # 3. Merge DataFrames
-    df_merged = pd.concat([df_sales, df_returns], ignore_index=True)
-
-    # Map State Code
-    df_merged["end_customer_state_new"] = df_merged["end_customer_state_new"].astype(str).str.title()
-    df_merged["J_mapped"] = df_merged["end_customer_state_new"].map(STATE_MAPPING).fillna("")
-
-    # 4. Calculate Tax Components 
-    df_merged_taxed = calculate_tax_components(df_merged.copy(), default_state_code_numeric) 
-
-    # 5. Load Template (for Excel output only)
-    template_stream = load_template_from_github()
-    if template_stream is None:
+    except core.ReportError as e:
+        st.error(f"❌ {error_markdown(e)}")
         return False
 
-    # 6. Generate All Reports
-    combo_excel_output = generate_combo_excel(df_merged, template_stream) 
-    b2cs_csv_output = generate_b2cs_csv(df_merged_taxed)
-    hsn_csv_output = generate_hsn_summary(df_merged_taxed)
-    
-    # CRITICAL: Passing the supplier state code numeric for JSON's sply_ty calculation
-    json_output = generate_gstr1_json(df_merged_taxed, dynamic_gstin, dynamic_fp, default_state_code_numeric) 
-
-    # 7. Save outputs to session state
-    st.session_state.combo_result = combo_excel_output
-    st.session_state.b2cs_result = b2cs_csv_output
-    st.session_state.hsn_result = hsn_csv_output
-    st.session_state.json_result = json_output
-    st.session_state.file_name = dynamic_filename
-    st.session_state.dynamic_gstin = dynamic_gstin
-    st.session_state.dynamic_fp = dynamic_fp
-    st.session_state.default_state_code_numeric = default_state_code_numeric
-    
+    for entry in result["manifest"]["months"]:
+        for message in entry["warnings"]:
+            st.warning(f"⚠️ {entry['zip']}: {message}")
+    for quarter in result["manifest"]["quarters"]:
+        if quarter["missing"]:
+            st.warning(f"⚠️ {quarter['label']} is missing {', '.join(quarter['missing'])}; its totals cover the months given.")
+    st.session_state.update(
+        periods_result=core.get_session_result_store().keep(periods.periods_bundle(result)),
+        periods_manifest=result["manifest"],
+    )
     return True
 
 
@@ -516,25 +197,69 @@ st.markdown("---")
 st.markdown("### 📤 File Upload")
 
 # Clear session state if a new file is uploaded
-zipped_files = st.file_uploader("Upload ZIP containing Sales (Mandatory) + Return (Optional) files", type=["zip"], on_change=lambda: [
-    st.session_state.update(combo_result=None, b2cs_result=None, hsn_result=None, json_result=None, file_name=None)
+zipped_files = st.file_uploader("Upload ZIP containing Sales (Mandatory) + Return (Optional) files (.xlsx or .csv)", type=["zip"], on_change=lambda: [
+    release_artifacts(), st.session_state.update(file_name=None, memory_report=None, run_record=None)
 ])
 
 # Process button
 if zipped_files:
+    core = load_core()
+    streaming_mode = st.checkbox(
+        "Low-memory mode (read large exports in chunks)",
+        help=f"Reads the Sales/Return sheets {core.STREAM_CHUNK_ROWS:,} rows at a time. Reports are identical."
+    )
+    formula_mode = st.selectbox(
+        "Combo tax columns (K–O)",
+        core.COMBO_FORMULA_MODES,
+        format_func={
+            "shared": "Shared formulas with cached values",
+            "values": "Values only (smallest, no formulas)",
+            "formulas": "Original formula in every cell",
+        }.get,
+        help="Shared formulas keep the original formulas live while writing one formula per column per block of rows."
+    )
+    json_style = st.selectbox(
+        "GSTR-1 JSON layout",
+        core.GSTR1_JSON_STYLES,
+        format_func={
+            "pretty": "Indented (readable)",
+            "compact": "Compact (about half the size, for upload)",
+        }.get,
+        help="Both layouts hold the same data; the GST portal accepts either."
+    )
+    profile_run = st.checkbox(
+        "Profile this run (diagnostics)",
+        help="Captures a cProfile and tracemalloc dump of the next run for download. Processing is several times slower."
+    )
     if st.button("🚀 Generate All 4 Reports", type="primary"):
         with st.spinner("Processing... Generating Combo, B2CS Summary (CSV), HSN Summary (CSV), and GSTR-1 JSON."):
-            success = process_zip_and_combine_data(zipped_files)
+            success = process_zip_and_combine_data(
+                zipped_files, streaming=streaming_mode, formula_mode=formula_mode, profile=profile_run,
+                json_style=json_style,
+            )
 
         if success:
             st.success("✔️ Processing Complete! All four reports are ready for download.")
 
 # Conditional Download Section (Visible only if session state has results)
-if st.session_state.combo_result and st.session_state.b2cs_result and st.session_state.hsn_result and st.session_state.json_result:
-    
+if st.session_state.bundle_result is not None and not st.session_state.bundle_result.available:
+    st.markdown("---")
+    st.warning("⚠️ These reports were cleared from the server to free space. Please generate them again.")
+elif st.session_state.bundle_result is not None:
+    bundle = st.session_state.bundle_result
+    # The bundle (or one file of it) is only read from the result store when its button is clicked
+    bundle_file = functools.partial(stored_download, bundle)
+
     st.markdown("---")
     st.markdown("### ⬇️ Download Reports (All ready for GSTR-1 Filing)")
     st.markdown(f"**Base File Name:** `{st.session_state.file_name.replace('.xlsx', '')}`")
+    st.download_button(
+        "⬇ All reports + manifest (.zip)",
+        bundle_file,
+        load_core().bundle_name(st.session_state.file_name),
+        mime="application/zip",
+        type="primary"
+    )
     
     col1, col2, col3, col4 = st.columns(4)
     
@@ -542,7 +267,7 @@ if st.session_state.combo_result and st.session_state.b2cs_result and st.session
         st.markdown("#### 1. Raw Combo Data")
         st.download_button(
             "⬇ Combo Report (.xlsx)",
-            st.session_state.combo_result,
+            functools.partial(bundle_file, st.session_state.file_name),
             st.session_state.file_name,
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
@@ -551,7 +276,7 @@ if st.session_state.combo_result and st.session_state.b2cs_result and st.session
         st.markdown("#### 2. B2CS Summary (CSV)")
         st.download_button(
             "⬇ B2CS Summary (.csv)",
-            st.session_state.b2cs_result,
+            functools.partial(bundle_file, "B2CS_Summary_Report.csv"),
             "B2CS_Summary_Report.csv",
             mime="text/csv"
         )
@@ -560,7 +285,7 @@ if st.session_state.combo_result and st.session_state.b2cs_result and st.session
         st.markdown("#### 3. HSN Summary (CSV)")
         st.download_button(
             "⬇ HSN Summary (.csv)",
-            st.session_state.hsn_result,
+            functools.partial(bundle_file, "HSN_Summary_Report.csv"),
             "HSN_Summary_Report.csv",
             mime="text/csv"
         )
@@ -569,7 +294,81 @@ if st.session_state.combo_result and st.session_state.b2cs_result and st.session
         st.markdown("#### 4. GSTR-1 JSON (Filing)")
         st.download_button(
             "⬇ GSTR1 JSON File",
-            st.session_state.json_result,
+            functools.partial(bundle_file, f"{st.session_state.file_name.replace('.xlsx', '')}_GSTR1.json"),
             f"{st.session_state.file_name.replace('.xlsx', '')}_GSTR1.json",
             mime="application/json"
         )
+
+    if st.session_state.memory_report is not None:
+        with st.expander("🧮 Memory report (merged + taxed rows)"):
+            report = st.session_state.memory_report
+            st.caption(f"Total: {report.loc['TOTAL', 'bytes'] / 1024 ** 2:,.1f} MiB")
+            st.dataframe(report)
+
+st.markdown("---")
+st.markdown("### 📅 Quarterly (QRMP) Summaries")
+period_files = st.file_uploader(
+    "Upload one ZIP per month (same GSTIN) for monthly and quarterly B2CS / HSN / JSON",
+    type=["zip"], accept_multiple_files=True,
+    on_change=lambda: [release_artifacts(("periods_result",)), st.session_state.update(periods_manifest=None)]
+)
+if period_files:
+    core = load_core()
+    period_json_style = st.selectbox(
+        "GSTR-1 JSON layout",
+        core.GSTR1_JSON_STYLES,
+        format_func={
+            "pretty": "Indented (readable)",
+            "compact": "Compact (about half the size, for upload)",
+        }.get,
+        key="period_json_style"
+    )
+    if st.button(f"📅 Generate Monthly + Quarterly Summaries ({len(period_files)} ZIPs)"):
+        with st.spinner("Processing the months in parallel and merging their totals..."):
+            if process_period_zips(period_files, json_style=period_json_style):
+                st.success("✔️ Monthly and quarterly summaries are ready for download.")
+
+if st.session_state.periods_result is not None and st.session_state.periods_manifest is not None:
+    manifest = st.session_state.periods_manifest
+    if not st.session_state.periods_result.available:
+        st.warning("⚠️ These summaries were cleared from the server to free space. Please generate them again.")
+    else:
+        st.dataframe(
+            [
+                {"Quarter": quarter["label"], "Filing period": quarter["fp"], "Months": ", ".join(quarter["months"]),
+                 "Missing": ", ".join(quarter["missing"])}
+                for quarter in manifest["quarters"]
+            ],
+            hide_index=True
+        )
+        st.download_button(
+            "⬇ Monthly + Quarterly Summaries (.zip)",
+            functools.partial(stored_download, st.session_state.periods_result),
+            f"{manifest['gstin']}_periods_GSTR1.zip",
+            mime="application/zip"
+        )
+
+if st.session_state.run_record is not None:
+    with st.expander("🩺 Diagnostics (time and memory per stage)"):
+        record = st.session_state.run_record
+        cache_note = f", result cache {record['result_cache']}" if record.get("result_cache") else ""
+        st.caption(
+            f"Total: {record['seconds']:,.2f} s wall, {record['cpu_seconds']:,.2f} s CPU, "
+            f"process peak {record['peak_rss_mib']:,.0f} MiB{cache_note}"
+        )
+        if record.get("error"):
+            st.caption(f"Failed: {record['error']}")
+        st.dataframe(record["stages"], hide_index=True)
+        st.download_button(
+            "⬇ Run record (.json)",
+            json.dumps(record, indent=2),
+            "run_record.json",
+            mime="application/json"
+        )
+        if st.session_state.profile_dump is not None and st.session_state.profile_dump.available:
+            st.download_button(
+                "⬇ Profile dump (.zip)",
+                functools.partial(stored_download, st.session_state.profile_dump),
+                "gstr1_profile.zip",
+                mime="application/zip"
+            )
@@ -0,0 +1,56 @@
+import os
+import sys
+import zipfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gst_bench  # noqa: E402
+
+EXPORT_ROWS = 3000
+EXPORT_SEED = 7
+
+
+@pytest.fixture(scope="session")
+def export_zips(tmp_path_factory):
+    """The same synthetic seller export as an .xlsx ZIP and a .csv ZIP: {"xlsx": path, "csv": path}."""
+    folder = tmp_path_factory.mktemp("exports")
+    paths = {}
+    for fmt in ("xlsx", "csv"):
+        paths[fmt] = str(folder / f"export_{fmt}.zip")
+        gst_bench.generate_export(paths[fmt], EXPORT_ROWS, fmt=fmt, seed=EXPORT_SEED)
+    return paths
+
+
+@pytest.fixture(scope="session")
+def unnumbered_delta(tmp_path_factory, export_zips):
+    """
+    A CSV delta where every fifth sales row has no order number and every seventh row
+    is repeated, as two ZIPs with the same rows but different bytes (so both get added).
+    """
+    with zipfile.ZipFile(export_zips["csv"]) as z:
+        header, *rows = z.read("tcs_sales.csv").decode("utf-8").splitlines()
+        returns = z.read("tcs_sales_return.csv")
+    order_col = header.split(",").index("sub_order_num")
+
+    lines = [header]
+    for i, row in enumerate(rows[:1500]):
+        fields = row.split(",")
+        if i % 5 == 0:
+            fields[order_col] = ""
+        lines.append(",".join(fields))
+        if i % 7 == 0:
+            lines.append(",".join(fields))
+    sales = ("\n".join(lines) + "\n").encode("utf-8")
+
+    folder = tmp_path_factory.mktemp("deltas")
+    paths = []
+    for name, comment in (("delta.zip", b""), ("delta_again.zip", b"sent again")):
+        path = str(folder / name)
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as out:
+            out.writestr("tcs_sales.csv", sales)
+            out.writestr("tcs_sales_return.csv", returns)
+            out.comment = comment
+        paths.append(path)
+    return paths
@@ -0,0 +1,181 @@
+import functools
+import hashlib
+import io
+import json
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import gst_core as gst
+
+REPORT_KEYS = ("combo_result", "b2cs_result", "hsn_result", "json_result")
+
+
+def run_reports(path, **kwargs):
+    kwargs.setdefault("parse_workers", 1)
+    with open(path, "rb") as zip_file:
+        return gst.generate_reports(zip_file, **kwargs)
+
+
+# ============================================================
+#  SAME REPORTS WHATEVER THE PATH
+# ============================================================
+@pytest.mark.parametrize("formula_mode", ["values", "formulas"])
+def test_streaming_matches_in_memory(export_zips, monkeypatch, formula_mode):
+    in_memory = run_reports(export_zips["xlsx"], formula_mode=formula_mode)
+    # Small chunks, so the rows really arrive in several pieces
+    monkeypatch.setattr(gst, "iter_processed_chunks", functools.partial(gst.iter_processed_chunks, chunk_rows=700))
+    streamed = run_reports(export_zips["xlsx"], formula_mode=formula_mode, streaming=True)
+    for key in REPORT_KEYS:
+        assert streamed[key] == in_memory[key], key
+
+def test_streaming_summaries_match_in_shared_mode(export_zips):
+    in_memory = run_reports(export_zips["xlsx"])
+    streamed = run_reports(export_zips["xlsx"], streaming=True)
+    for key in ("b2cs_result", "hsn_result", "json_result"):
+        assert streamed[key] == in_memory[key], key
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_csv_export_matches_xlsx(export_zips, streaming):
+    from_xlsx = run_reports(export_zips["xlsx"], streaming=streaming)
+    from_csv = run_reports(export_zips["csv"], streaming=streaming)
+    for key in REPORT_KEYS:
+        assert from_csv[key] == from_xlsx[key], key
+
+
+# ============================================================
+#  TAX IN PAISE
+# ============================================================
+def test_tax_paise_round_half_away_from_zero():
+    frame = pd.DataFrame({
+        "J_mapped": pd.Series(
+            ["27-Maharashtra", "27-Maharashtra", "07-Delhi", "07-Delhi", "07-Delhi", "07-Delhi"]
+        ).astype(gst.POS_DTYPE),
+        "gst_rate": [5, 5, 5, 5, 5, 12],
+        "tcs_taxable_amount": [0.20, -0.20, 0.10, -0.10, 0.29, 1.005],
+    })
+    taxed = gst.calculate_tax_components(frame, "27")
+
+    # 0.20 × 2.5% = 0.5 paise each for CGST / SGST; 0.10 × 5% = 0.5 paise IGST: all away from zero
+    assert taxed["cgst_paise"].tolist() == [1, -1, 0, 0, 0, 0]
+    assert taxed["sgst_paise"].tolist() == [1, -1, 0, 0, 0, 0]
+    # 0.29 × 5% = 1.45 paise -> 1; 1.005 is 100.4999... × 100 in binary, still 101 paise -> 12.12 paise -> 12
+    assert taxed["igst_paise"].tolist() == [0, 0, 1, -1, 1, 12]
+    assert taxed["taxable_paise"].tolist() == [20, -20, 10, -10, 29, 101]
+    assert taxed["total_value_paise"].tolist() == [22, -22, 11, -11, 30, 113]
+
+    rupees = gst.tax_rupees(taxed)
+    assert rupees["CGST"].tolist() == [0.01, -0.01, 0.0, 0.0, 0.0, 0.0]
+    assert rupees["Total Value"].tolist() == [0.22, -0.22, 0.11, -0.11, 0.3, 1.13]
+
+def test_tax_rupees_missing_taxable_value():
+    frame = pd.DataFrame({
+        "J_mapped": pd.Series(["27-Maharashtra", "07-Delhi"]).astype(gst.POS_DTYPE),
+        "gst_rate": [5, 5],
+        "tcs_taxable_amount": [np.nan, np.nan],
+    })
+    rupees = gst.tax_rupees(gst.calculate_tax_components(frame, "27"))
+    # Unknown where the tax applies, zero where it does not
+    assert np.isnan(rupees["CGST"][0]) and rupees["CGST"][1] == 0
+    assert rupees["IGST"][0] == 0 and np.isnan(rupees["IGST"][1])
+    assert np.isnan(rupees["Total Value"]).all()
+
+
+# ============================================================
+#  RESULT CACHE
+# ============================================================
+def test_result_cache_hit_returns_identical_bytes(export_zips, tmp_path):
+    cache = gst.ResultCache(str(tmp_path))
+    first = run_reports(export_zips["xlsx"], cache=cache)
+    second = run_reports(export_zips["xlsx"], cache=cache)
+    assert first["run_record"]["result_cache"] == "miss"
+    assert second["run_record"]["result_cache"] == "hit"
+    for key in REPORT_KEYS:
+        assert second[key] == first[key], key
+
+
+# ============================================================
+#  REPORT BUNDLE
+# ============================================================
+@pytest.mark.parametrize("streaming", [False, True])
+def test_bundle_manifest(export_zips, streaming):
+    out = io.BytesIO()
+    results = run_reports(export_zips["xlsx"], streaming=streaming, bundle=gst.ReportBundleWriter(out))
+    files = gst.report_files(results)
+
+    with zipfile.ZipFile(io.BytesIO(out.getvalue())) as z:
+        assert z.namelist() == list(files) + [gst.BUNDLE_MANIFEST_NAME]
+        manifest = json.loads(z.read(gst.BUNDLE_MANIFEST_NAME))
+        for name, content in files.items():
+            assert z.read(name) == content
+        assert z.getinfo(results["file_name"]).compress_type == zipfile.ZIP_STORED
+
+    assert manifest["gstin"] == results["dynamic_gstin"]
+    assert manifest["fp"] == results["dynamic_fp"]
+    assert manifest["warnings"] == results["warnings"]
+    assert manifest["files"] == [
+        {"name": name, "bytes": len(content), "sha256": hashlib.sha256(content).hexdigest()}
+        for name, content in files.items()
+    ]
+    assert "bundle" in [stage["stage"] for stage in manifest["run"]["stages"]]
+
+def test_bundle_from_result_cache_hit(export_zips, tmp_path):
+    cache = gst.ResultCache(str(tmp_path))
+    run_reports(export_zips["xlsx"], cache=cache)
+    out = io.BytesIO()
+    results = run_reports(export_zips["xlsx"], cache=cache, bundle=gst.ReportBundleWriter(out))
+    assert results["run_record"]["result_cache"] == "hit"
+    with zipfile.ZipFile(io.BytesIO(out.getvalue())) as z:
+        for name, content in gst.report_files(results).items():
+            assert z.read(name) == content
+
+
+# ============================================================
+#  CSV INPUT
+# ============================================================
+@pytest.fixture(scope="module")
+def blank_cell_csv_zip(export_zips, tmp_path_factory):
+    """The CSV export with blank numeric cells scattered through the sales rows."""
+    with zipfile.ZipFile(export_zips["csv"]) as z:
+        header, *rows = z.read("tcs_sales.csv").decode("utf-8").splitlines()
+        returns = z.read("tcs_sales_return.csv")
+    columns = header.split(",")
+    blanks = [columns.index(col) for col in ("gst_rate", "quantity", "hsn_code", "total_taxable_sale_value")]
+    for i, col in enumerate(blanks):
+        for n in range(10 + i, len(rows), 97):
+            fields = rows[n].split(",")
+            fields[col] = ""
+            rows[n] = ",".join(fields)
+
+    path = str(tmp_path_factory.mktemp("blank_cells") / "export_blank.zip")
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as out:
+        out.writestr("tcs_sales.csv", "\n".join([header] + rows) + "\n")
+        out.writestr("tcs_sales_return.csv", returns)
+    return path
+
+def combo_raw_values(content):
+    from openpyxl import load_workbook
+    wb = load_workbook(io.BytesIO(content), read_only=True)
+    return list(wb[gst.RAW_SHEET_NAME].iter_rows(values_only=True))
+
+def test_csv_blank_numeric_cells_on_both_paths(blank_cell_csv_zip):
+    in_memory = run_reports(blank_cell_csv_zip, formula_mode="values")
+    streamed = run_reports(blank_cell_csv_zip, formula_mode="values", streaming=True)
+    for key in ("b2cs_result", "hsn_result", "json_result"):
+        assert streamed[key] == in_memory[key], key
+    # Same cells; only the number text differs (the merged frame holds HSN as float: "6404.0")
+    assert combo_raw_values(streamed["combo_result"]) == combo_raw_values(in_memory["combo_result"])
+
+@pytest.mark.parametrize("fmt", ["xlsx", "csv"])
+def test_process_file_accepts_file_objects(export_zips, fmt):
+    member = "tcs_sales.xlsx" if fmt == "xlsx" else "tcs_sales.csv"
+    with zipfile.ZipFile(export_zips[fmt]) as z:
+        data = z.read(member)
+    with zipfile.ZipFile(export_zips[fmt]) as z, z.open(member) as f:
+        from_path = gst.process_file(io.BytesIO(f.read()), "Sale")
+    from_bytes = gst.process_file(io.BytesIO(data), "Sale")
+    streamed = pd.concat(list(gst.iter_processed_chunks(io.BytesIO(data), "Sale")), ignore_index=True)
+    pd.testing.assert_frame_equal(from_bytes, from_path)
+    pd.testing.assert_frame_equal(streamed, from_bytes, check_dtype=False)
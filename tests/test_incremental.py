@@ -0,0 +1,50 @@
+import pandas as pd
+
+import gst_core as gst
+import gst_incremental
+
+
+def store_reports(store_dir, gstin, fp):
+    with gst_incremental.IncrementalStore(str(store_dir), gstin, fp, create=False) as store:
+        return store.reports()
+
+
+def test_reapplied_delta_is_idempotent(unnumbered_delta, tmp_path):
+    first, again = unnumbered_delta
+    added = gst_incremental.add_delta(first, str(tmp_path), parse_workers=1)
+    assert added["status"] == "added" and added["duplicates"] == 0
+    after_first = store_reports(tmp_path, added["gstin"], added["fp"])
+
+    # Same rows in a different file: nothing new, rows without an order number included
+    readded = gst_incremental.add_delta(again, str(tmp_path), parse_workers=1)
+    assert readded["status"] == "added"
+    assert readded["rows_added"] == 0 and readded["duplicates"] == added["rows_read"]
+    assert store_reports(tmp_path, added["gstin"], added["fp"]) == after_first
+
+    # The very same file is skipped as a whole
+    assert gst_incremental.add_delta(first, str(tmp_path), parse_workers=1)["status"] == "skipped"
+
+def test_delta_matches_full_month_run(unnumbered_delta, tmp_path):
+    # Rows repeated within one file count every time, as in a full-month run
+    added = gst_incremental.add_delta(unnumbered_delta[0], str(tmp_path), parse_workers=1)
+    with open(unnumbered_delta[0], "rb") as zip_file:
+        full = gst.generate_reports(zip_file, parse_workers=1)
+    reports = store_reports(tmp_path, added["gstin"], added["fp"])
+    for key in ("b2cs_result", "hsn_result", "json_result"):
+        assert reports[key] == full[key], key
+
+def test_row_keys_number_repeats():
+    frame = pd.DataFrame({
+        "order_date": pd.to_datetime(["2025-06-01"] * 4),
+        "order_num": ["A", "A", None, None],
+        "hsn_code": [6109] * 4,
+        "gst_rate": [5] * 4,
+        "tcs_taxable_amount": [10.0, 10.0, 20.0, 20.0],
+        "end_customer_state_new": ["Delhi"] * 4,
+        "QTY": [1] * 4,
+        "TYPE": ["Sale"] * 4,
+    })
+    keys, occurrence = gst_incremental.row_keys(frame)
+    assert keys[0] == keys[1] == "order:A:Sale"
+    assert keys[2] == keys[3] and keys[2].startswith("row:")
+    assert occurrence == [0, 1, 0, 1]
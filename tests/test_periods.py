@@ -0,0 +1,15 @@
+import pytest
+
+import gst_periods
+
+
+@pytest.mark.parametrize("fp, label, months", [
+    ("032025", "Q4_2024-25", ["012025", "022025", "032025"]),
+    ("042025", "Q1_2025-26", ["042025", "052025", "062025"]),
+    ("062025", "Q1_2025-26", ["042025", "052025", "062025"]),
+    ("072025", "Q2_2025-26", ["072025", "082025", "092025"]),
+    ("122025", "Q3_2025-26", ["102025", "112025", "122025"]),
+    ("012026", "Q4_2025-26", ["012026", "022026", "032026"]),
+])
+def test_quarter_of(fp, label, months):
+    assert gst_periods.quarter_of(fp) == (label, months)